@@ -0,0 +1,123 @@
+"""SQLite index of completed downloads, used to skip items already fetched."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from utils import log, app_data_dir
+
+
+def archive_id(item_id, extractor="youtube"):
+    """Same key format as yt-dlp's download archive: '<extractor> <id>'."""
+    return f"{extractor.lower()} {item_id}"
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DownloadArchive:
+    """Records (item, mode, quality, format) -> output file, size and checksum.
+
+    Lookups are a single indexed query plus one stat() of the recorded file;
+    entries whose file is gone or has changed size are dropped on the spot.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(app_data_dir(), "archive.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    item_id TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    quality TEXT NOT NULL,
+                    fmt TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (item_id, mode, quality, fmt)
+                )""")
+
+    def lookup(self, item_id, mode, quality, fmt):
+        """Returns {'path', 'size', 'sha256'} if the item is archived and its file still exists."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT path, size, sha256 FROM downloads WHERE item_id=? AND mode=? AND quality=? AND fmt=?",
+                (item_id, mode, quality, fmt)).fetchone()
+        if not row:
+            return None
+
+        path, size, sha256 = row
+        try:
+            valid = os.path.getsize(path) == size
+        except OSError:
+            valid = False
+        if not valid:
+            log(f"[archive] {item_id}: recorded file missing or changed, will download again.")
+            self.forget(item_id, mode, quality, fmt)
+            return None
+        return {"path": path, "size": size, "sha256": sha256}
+
+    def record(self, item_id, mode, quality, fmt, path):
+        try:
+            size = os.path.getsize(path)
+            checksum = file_checksum(path)
+        except OSError as e:
+            log(f"[archive] Cannot record {path}: {e}")
+            return
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (item_id, mode, quality, fmt, os.path.abspath(path), size, checksum, time.time()))
+
+    def forget(self, item_id, mode, quality, fmt):
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM downloads WHERE item_id=? AND mode=? AND quality=? AND fmt=?",
+                (item_id, mode, quality, fmt))
+
+    def verify(self, item_id, mode, quality, fmt):
+        """Full check: recomputes the checksum of the recorded file."""
+        entry = self.lookup(item_id, mode, quality, fmt)
+        if not entry:
+            return False
+        if entry["sha256"] and file_checksum(entry["path"]) != entry["sha256"]:
+            self.forget(item_id, mode, quality, fmt)
+            return False
+        return True
+
+    def view(self, mode, quality, fmt):
+        return ArchiveView(self, mode, quality, fmt)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ArchiveView:
+    """Set-like adapter passed as yt-dlp's `download_archive` option.
+
+    yt-dlp checks membership using the ID it can derive from the URL before any
+    extraction, so archived playlist entries cost no network request at all.
+    Recording is done by the manager (it needs the output path), so add() is a no-op.
+    """
+    def __init__(self, archive, mode, quality, fmt):
+        self.archive = archive
+        self.key = (mode, quality, fmt)
+
+    def __contains__(self, item_id):
+        return self.archive.lookup(item_id, *self.key) is not None
+
+    def __bool__(self):
+        return True
+
+    def add(self, item_id):
+        pass
@@ -0,0 +1,177 @@
+"""Global bandwidth shaping: token buckets with weighted fair sharing."""
+import re
+import threading
+import time
+
+MAX_SLEEP = 0.25 # Re-check at least this often so runtime limit changes apply quickly
+RATE_ALPHA = 0.3
+IDLE_AFTER = 2.0 # s without bytes after which a job's share goes to the jobs still transferring
+
+
+def parse_rate(text):
+    """'500K', '2.5M', '1G', '800000' -> bytes/s. None/''/'0' -> None (unlimited)."""
+    if text is None:
+        return None
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?(?:/s)?\s*", str(text), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Invalid rate: {text!r}")
+    value = float(m.group(1)) * {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[m.group(2).lower()]
+    return int(value) or None
+
+
+class TokenBucket:
+    """Classic token bucket. consume() may go into debt for chunks larger than
+    the burst size, then blocks until the debt is repaid, so the long-run rate
+    holds even for engines that deliver data in big chunks."""
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _capacity(self):
+        return self.burst or max(64 * 1024, (self.rate or 0) / 4)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self._capacity(), self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def consume(self, n, cancel=None):
+        with self._lock:
+            self._refill()
+            self._tokens -= n
+        while True:
+            with self._lock:
+                self._refill()
+                if not self.rate or self._tokens >= 0:
+                    if not self.rate:
+                        self._tokens = 0.0
+                    return
+                wait = -self._tokens / self.rate
+            if cancel is not None and cancel.is_set():
+                return
+            time.sleep(min(wait, MAX_SLEEP))
+
+
+class JobShare:
+    """One job's slice of the global limit."""
+    def __init__(self, limiter, key, priority):
+        self.limiter = limiter
+        self.key = key
+        self.priority = max(1, priority)
+        self.bucket = TokenBucket()
+        self.rate = 0.0 # Measured effective rate (bytes/s, EWMA over ~1s windows)
+        self.last = None # time.monotonic() of the last bytes received (None = none yet)
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def allotted(self):
+        """Rate currently granted to this job (None = unlimited)."""
+        return self.bucket.rate
+
+    def throttle(self, nbytes, cancel=None):
+        """Accounts nbytes just received, blocking as needed to respect the share."""
+        if nbytes <= 0:
+            return
+        self.limiter._touch(self)
+        self.bucket.consume(nbytes, cancel)
+        with self._lock:
+            self._window_bytes += nbytes
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed >= 1.0:
+                sample = self._window_bytes / elapsed
+                self.rate = sample if not self.rate else RATE_ALPHA * sample + (1 - RATE_ALPHA) * self.rate
+                self._window_bytes = 0
+                self._window_start = now
+
+    def close(self):
+        self.limiter._unregister(self)
+
+
+class BandwidthLimiter:
+    """Caps the total download rate across all jobs and engines.
+
+    Each job registers a JobShare weighted by its priority; the global limit is
+    split as limit * priority / sum(priorities), over the jobs actually
+    transferring. A job still extracting, stalled or post-processing (no bytes
+    for IDLE_AFTER seconds) leaves its share to the others, and gets it back
+    with its next chunk: the limit is never left unused. The limit and
+    priorities can be changed at any time: running jobs pick up the new rate on
+    their next chunk.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self._shares = {}
+        self._checked = time.monotonic() # Last look for shares gone idle
+        self._lock = threading.Lock()
+
+    def register(self, key, priority=1):
+        share = JobShare(self, key, priority)
+        with self._lock:
+            self._shares[key] = share
+            self._rebalance()
+        return share
+
+    def set_limit(self, limit):
+        with self._lock:
+            self.limit = limit or None
+            self._rebalance()
+
+    def set_priority(self, key, priority):
+        with self._lock:
+            share = self._shares.get(key)
+            if not share:
+                return False
+            share.priority = max(1, priority)
+            self._rebalance()
+            return True
+
+    def rates(self):
+        """key -> {'priority', 'allotted', 'rate'} for every active job."""
+        with self._lock:
+            return {k: {"priority": s.priority, "allotted": s.allotted, "rate": round(s.rate)}
+                    for k, s in self._shares.items()}
+
+    def _unregister(self, share):
+        with self._lock:
+            if self._shares.get(share.key) is share:
+                del self._shares[share.key]
+                self._rebalance()
+
+    def _touch(self, share):
+        """Called for every chunk: rebalances when share starts transferring
+        or, at most every IDLE_AFTER / 4 s, when another share went idle."""
+        now = time.monotonic()
+        with self._lock:
+            idle = share.last is None or now - share.last > IDLE_AFTER
+            share.last = now
+            if idle or now - self._checked > IDLE_AFTER / 4:
+                self._rebalance(now)
+
+    def _active(self, share, now):
+        return share.last is not None and now - share.last <= IDLE_AFTER
+
+    def _rebalance(self, now=None):
+        now = now or time.monotonic()
+        self._checked = now
+        active = [s for s in self._shares.values() if self._active(s, now)]
+        total = sum(s.priority for s in active)
+        for s in self._shares.values():
+            if not self.limit:
+                s.bucket.set_rate(None)
+            elif s in active:
+                s.bucket.set_rate(self.limit * s.priority / total)
+            else:
+                # Idle: what it would get on joining, until its first chunk rebalances
+                s.bucket.set_rate(self.limit * s.priority / (total + s.priority))
@@ -0,0 +1 @@
+"""Benchmarks against a local synthetic media server: python -m benchmarks.run"""
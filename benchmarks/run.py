@@ -0,0 +1,313 @@
+"""Benchmark harness: drives DownloadManager against the synthetic server.
+
+Each scenario describes synthetic media (a progressive file, DASH fragments,
+an HLS playlist) with latency, bandwidth and error injection. Its metadata
+is put in the metadata cache (and served to re-extractions), so the real
+engine path runs without any network extraction. Every run happens in a fresh child process, so CPU time
+and peak RSS belong to that download alone. FFmpeg is hidden from the runs:
+the synthetic bytes are not real media, and merges are not what is measured.
+
+    python -m benchmarks.run                        # all scenarios
+    python -m benchmarks.run hls dash --repeat 5    # some, median of 5 runs
+    python -m benchmarks.run --save-baseline main   # benchmarks/baselines/main.json
+    python -m benchmarks.run --compare main         # exit code 1 on regression
+
+benchmarks/baselines/main.json is committed (recorded with --repeat 5, the
+machine is in the file). Numbers only compare on the machine that recorded
+them: save a local baseline first when measuring elsewhere.
+
+Metrics: throughput (MB/s of output), ttfb (s until the server sent the
+first byte), cpu_per_mb (CPU s per MB), peak_rss_mb, fallback_latency (s
+until the fallback engine's first byte) and wall time.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINES = os.path.join(HERE, "baselines")
+VIDEO_ID = "benchmark01" # Any 11-char ID: the metadata comes from the cache
+
+SCENARIOS = {
+    "progressive": {"kind": "file", "size": "64M", "query": {"lat": 0.02}},
+    "progressive-slow": {"kind": "file", "size": "16M", "query": {"lat": 0.1, "bw": "4M"}},
+    "dash": {"kind": "dash", "segments": 128, "segment": "256K", "query": {"lat": 0.02}},
+    "hls": {"kind": "hls", "segments": 128, "segment": "256K", "query": {"lat": 0.02}},
+    "hls-lossy": {"kind": "hls", "segments": 128, "segment": "256K", "query": {"lat": 0.02, "err": 0.03, "drop": 0.02}},
+    # yt-dlp's stream is refused, the ranged engine takes over
+    "fallback": {"kind": "fallback", "size": "32M", "query": {"lat": 0.02}},
+}
+
+# name -> (higher is better, absolute noise floor)
+METRICS = {
+    "throughput": (True, 0.5),
+    "ttfb": (False, 0.05),
+    "cpu_per_mb": (False, 0.002),
+    "peak_rss_mb": (False, 5.0),
+    "fallback_latency": (False, 0.25),
+    "wall": (False, 0.1),
+}
+
+
+def _qs(query, **extra):
+    from urllib.parse import urlencode
+    return urlencode(dict(query, **extra))
+
+
+def synthetic_info(scenario, base):
+    """yt-dlp info dict of the scenario's media on the synthetic server."""
+    query = scenario["query"]
+    fmt = {"format_id": "bench", "ext": "mp4", "vcodec": "avc1.64001f", "acodec": "mp4a.40.2", "height": 720,
+           "width": 1280}
+    if scenario["kind"] == "file":
+        fmt.update(url=f"{base}/file/{scenario['size']}.mp4?{_qs(query, tag='ytdlp')}", protocol="http")
+    elif scenario["kind"] == "fallback":
+        fmt.update(url=f"{base}/file/{scenario['size']}.mp4?{_qs(query, tag='ytdlp', fail=403)}", protocol="http")
+    elif scenario["kind"] == "hls":
+        fmt.update(url=f"{base}/hls/{scenario['segments']}x{scenario['segment']}.m3u8?{_qs(query, tag='ytdlp')}",
+                   protocol="m3u8_native")
+    elif scenario["kind"] == "dash":
+        qs = _qs(query, tag="ytdlp")
+        fmt.update(url=f"{base}/seg/{scenario['segment']}/0.m4s?{qs}", protocol="http_dash_segments",
+                   fragment_base_url=f"{base}/seg/{scenario['segment']}/",
+                   fragments=[{"path": f"{i}.m4s?{qs}"} for i in range(scenario["segments"])])
+    return {"id": VIDEO_ID, "title": "Benchmark", "extractor": "youtube", "extractor_key": "Youtube",
+            "webpage_url": f"https://www.youtube.com/watch?v={VIDEO_ID}", "_type": "video", "formats": [fmt]}
+
+
+class _Stream:
+    """The few pytubefix Stream attributes the ranged engine reads."""
+    def __init__(self, url, size):
+        self.itag, self.type, self.subtype = 18, "video", "mp4"
+        self.resolution, self.abr, self.mime_type = "720p", None, "video/mp4"
+        self.url, self.filesize, self.default_filename = url, size, "Benchmark.mp4"
+
+
+class _Streams(list):
+    def filter(self, progressive=False, **_):
+        return _Streams(self if progressive else [])
+
+    def order_by(self, _):
+        return self
+
+    def desc(self):
+        return self
+
+    def first(self):
+        return self[0] if self else None
+
+    def last(self):
+        return self[-1] if self else None
+
+    def get_audio_only(self):
+        return None
+
+
+def synthetic_youtube(scenario, base):
+    """pytubefix.YouTube stand-in serving one progressive stream (fallback scenario)."""
+    from benchmarks.server import parse_size
+    url = f"{base}/file/{scenario['size']}.mp4?{_qs(scenario['query'], tag='fallback')}"
+
+    class SyntheticYouTube:
+        def __init__(self, *args, **kwargs):
+            self.video_id = VIDEO_ID
+            self.streams = _Streams([_Stream(url, parse_size(scenario["size"]))])
+    return SyntheticYouTube
+
+
+def _server_call(base, path, method="GET"):
+    req = urllib.request.Request(base + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+def run_child(name, base):
+    """One measured download, in this (fresh) process. Returns the metrics."""
+    random.seed(0) # Same backoff jitter from one run to the next
+    sys.path.insert(0, ROOT)
+    import downloader
+    from utils import logger
+
+    logger.headless = True
+    logger.stream = open(os.devnull, "w")
+    scenario = SCENARIOS[name]
+    manager = downloader.DownloadManager(archive=False, postprocess_workers=0)
+    info = synthetic_info(scenario, base)
+    manager.cache.put(VIDEO_ID, info)
+    manager._extract = lambda url: info # A failed cached run re-extracts: never from the real site
+    if scenario["kind"] == "fallback":
+        downloader.YouTube = synthetic_youtube(scenario, base)
+    out = tempfile.mkdtemp(prefix="bench-out-")
+    try:
+        _server_call(base, "/_reset", "POST")
+        cpu = time.process_time()
+        started = time.time()
+        ok = manager.start_download(f"https://www.youtube.com/watch?v={VIDEO_ID}", out, "Vidéo", "best", "mp4")
+        wall = time.time() - started
+        cpu = time.process_time() - cpu
+        size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(out) for f in files)
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+    server = _server_call(base, "/_stats")
+    first = server["first_byte"]
+    mb = size / 1e6
+    result = {
+        "ok": bool(ok),
+        "bytes": size,
+        "wall": round(wall, 3),
+        "throughput": round(mb / wall, 3) if wall else None,
+        "ttfb": round(min(first.values()) - started, 4) if first else None,
+        "cpu_per_mb": round(cpu / mb, 5) if mb else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "fallback_latency": round(first["fallback"] - started, 3) if "fallback" in first else None,
+        "requests": server["requests"],
+        "injected_errors": server["injected"],
+        "peak_connections": server["peak_connections"],
+        "engines": {k: v["successes"] for k, v in manager.health.snapshot().items() if v["successes"]},
+    }
+    return result
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _path_without_ffmpeg():
+    # The synthetic bytes are not real media: FFmpeg stays out of the measured path
+    dirs = os.environ.get("PATH", "").split(os.pathsep)
+    return os.pathsep.join(d for d in dirs if not shutil.which("ffmpeg", path=d))
+
+
+def start_server():
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.server", "--port", "0"], cwd=ROOT,
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith("PORT "):
+        proc.kill()
+        raise RuntimeError("synthetic server did not start")
+    return proc, f"http://127.0.0.1:{int(line.split()[1])}"
+
+
+def measure(name, base, repeat):
+    """Runs a scenario `repeat` times (one child process each). Returns the
+    median of every metric, plus the individual runs."""
+    runs = []
+    for _ in range(repeat):
+        home = tempfile.mkdtemp(prefix="bench-home-")
+        try:
+            env = dict(os.environ, ULTRAYT_HOME=home, PYTHONPATH=ROOT, PATH=_path_without_ffmpeg())
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.run", "--child", name, "--server", base],
+                                  cwd=ROOT, env=env, capture_output=True, text=True, timeout=600)
+        finally:
+            shutil.rmtree(home, ignore_errors=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{name}: child failed\n{proc.stderr.strip()}")
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    summary = {"ok": all(r["ok"] for r in runs), "runs": runs}
+    for key in METRICS:
+        values = [r[key] for r in runs if r.get(key) is not None]
+        summary[key] = round(statistics.median(values), 5) if values else None
+    return summary
+
+
+def compare(results, baseline, threshold):
+    """Lines describing each metric against the baseline; regressions are
+    worse by more than `threshold` (relative) and the metric's noise floor."""
+    lines, regressions = [], 0
+    for name, result in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            lines.append(f"{name:18} (not in baseline)")
+            continue
+        for key, (higher_better, floor) in METRICS.items():
+            new, old = result.get(key), base.get(key)
+            if new is None or old is None:
+                continue
+            delta = new - old
+            worse = -delta if higher_better else delta
+            regressed = worse > floor and worse > abs(old) * threshold
+            regressions += regressed
+            change = f"{delta / old * 100:+.1f}%" if old else f"{delta:+.3f}"
+            lines.append(f"{name:18} {key:17} {old:>10.4g} -> {new:<10.4g} {change:>8}"
+                         + ("  REGRESSION" if regressed else ""))
+    return lines, regressions
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.run", description="DownloadManager benchmarks")
+    p.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per scenario, the median is kept (default: %(default)s)")
+    p.add_argument("--save-baseline", metavar="NAME", help="Save the results as benchmarks/baselines/NAME.json")
+    p.add_argument("--compare", metavar="NAME", help="Compare with a saved baseline, exit code 1 on regression")
+    p.add_argument("--threshold", type=float, default=0.15, help="Relative regression threshold (default: %(default)s)")
+    p.add_argument("--json", action="store_true", help="Print the results as JSON")
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    p.add_argument("--server", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.server)))
+        return 0
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        p.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    server, base = start_server()
+    results = {}
+    try:
+        for name in names:
+            results[name] = measure(name, base, args.repeat)
+            r = results[name]
+            print(f"{name:18} {'ok' if r['ok'] else 'FAILED':6} {r['throughput'] or 0:8.2f} MB/s  "
+                  f"ttfb {r['ttfb'] or 0:.3f}s  cpu {r['cpu_per_mb'] or 0:.4f}s/MB  "
+                  f"rss {r['peak_rss_mb'] or 0:.0f}MB"
+                  + (f"  fallback {r['fallback_latency']:.2f}s" if r["fallback_latency"] is not None else ""),
+                  file=sys.stderr)
+    finally:
+        server.kill()
+        server.wait()
+
+    import yt_dlp.version
+    report = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+              "platform": platform.platform(), "yt_dlp": yt_dlp.version.__version__, "repeat": args.repeat,
+              "scenarios": results}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f"{args.save_baseline}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved: {path}", file=sys.stderr)
+
+    failed = [n for n, r in results.items() if not r["ok"]]
+    if args.compare:
+        with open(os.path.join(BASELINES, f"{args.compare}.json"), encoding="utf-8") as f:
+            lines, regressions = compare(results, json.load(f), args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{regressions} regression(s) against baseline '{args.compare}'.", file=sys.stderr)
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""Synthetic media server for the benchmarks (see run.py).
+
+Serves generated content, nothing is read from disk:
+
+    GET  /file/<size>.<ext>          progressive file (Range supported)
+    GET  /hls/<count>x<size>.m3u8    HLS playlist of <count> segments of <size>
+    GET  /seg/<size>/<index>.<ext>   one segment (HLS and DASH fragments)
+    GET  /_stats                     counters, first byte time per tag
+    POST /_reset
+
+Sizes take K/M suffixes (e.g. /file/32M.mp4). Every media URL accepts these
+query parameters, also propagated to the segments of a playlist:
+
+    lat=0.05    seconds before the response headers
+    bw=4M       bytes/s per connection
+    err=0.05    probability of answering 503
+    drop=0.01   probability of closing the connection halfway through the body
+    fail=403    always answer this status
+    norange=1   ignore Range headers
+    tag=name    label for the first-byte time in /_stats
+
+    python -m benchmarks.server [--port 0] [--seed 1]   # prints "PORT <n>"
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+BLOCK = bytes(range(256)) * 256 # 64 KiB, content at offset o is BLOCK[o % len(BLOCK)]
+CONTENT_TYPES = {"mp4": "video/mp4", "m4a": "audio/mp4", "webm": "video/webm", "ts": "video/mp2t",
+                 "m4s": "video/iso.segment"}
+
+
+def parse_size(text):
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)", str(text).upper())
+    if not m:
+        raise ValueError(f"invalid size: {text}")
+    return int(float(m[1]) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[m[2]])
+
+
+def content(start, length):
+    """Yields the synthetic bytes [start, start + length) in chunks."""
+    pos, end = start, start + length
+    while pos < end:
+        offset = pos % len(BLOCK)
+        chunk = BLOCK[offset:offset + min(len(BLOCK) - offset, end - pos)]
+        yield chunk
+        pos += len(chunk)
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes = 0
+            self.injected = 0
+            self.active = 0
+            self.peak = 0
+            self.first_byte = {}
+
+    def add(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, getattr(self, key) + value)
+            self.peak = max(self.peak, self.active)
+
+    def sent(self, tag, n):
+        with self._lock:
+            self.bytes += n
+            if tag not in self.first_byte:
+                self.first_byte[tag] = time.time()
+
+    def as_dict(self):
+        with self._lock:
+            return {"requests": self.requests, "bytes": self.bytes, "injected": self.injected,
+                    "peak_connections": self.peak, "first_byte": dict(self.first_byte)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, as a CDN would
+    server_version = "SyntheticMedia"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    @property
+    def stats(self):
+        return self.server.stats
+
+    def do_POST(self):
+        if self.path == "/_reset":
+            self.stats.reset()
+            return self._json({"ok": True})
+        self.send_error(404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == "/_stats":
+            return self._json(self.stats.as_dict())
+        self.stats.add(requests=1)
+        if query.get("lat"):
+            time.sleep(float(query["lat"]))
+        if query.get("fail"):
+            return self._inject(int(query["fail"]))
+        if random.random() < float(query.get("err", 0)):
+            return self._inject(503)
+
+        m = re.fullmatch(r"/hls/(\d+)x(\w+)\.m3u8", url.path)
+        if m:
+            return self._playlist(int(m[1]), m[2], query)
+        m = re.fullmatch(r"/file/(\w+)\.(\w+)", url.path) or re.fullmatch(r"/seg/(\w+)/\d+\.(\w+)", url.path)
+        if not m:
+            return self.send_error(404)
+        try:
+            size = parse_size(m[1])
+        except ValueError:
+            return self.send_error(404)
+        self._media(size, CONTENT_TYPES.get(m[2], "application/octet-stream"), query)
+
+    def _json(self, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self, code):
+        self.stats.add(injected=1)
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _playlist(self, count, segment, query):
+        qs = urlencode(query)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(count):
+            lines += ["#EXTINF:4.000,", f"/seg/{segment}/{i}.ts" + (f"?{qs}" if qs else "")]
+        lines.append("#EXT-X-ENDLIST")
+        data = ("\n".join(lines) + "\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _media(self, size, content_type, query):
+        start, end = 0, size - 1
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if m and not query.get("norange"):
+            start, end = int(m[1]), min(int(m[2]) if m[2] else size - 1, size - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                return self.end_headers()
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        length = end - start + 1
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        if not query.get("norange"):
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+        bandwidth = parse_size(query["bw"]) if query.get("bw") else 0
+        drop_at = length // 2 if random.random() < float(query.get("drop", 0)) else None
+        tag = query.get("tag", "default")
+        sent = 0
+        began = time.monotonic()
+        self.stats.add(active=1)
+        try:
+            for chunk in content(start, length):
+                if drop_at is not None and sent + len(chunk) > drop_at:
+                    self.stats.add(injected=1)
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                self.stats.sent(tag, len(chunk))
+                if bandwidth:
+                    ahead = sent / bandwidth - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            self.stats.add(active=-1)
+
+
+def serve(port=0, seed=1):
+    random.seed(seed) # Same injected errors from one run to the next
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    server.stats = Stats()
+    return server
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.server", description="Synthetic media server")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args(argv)
+    server = serve(args.port, args.seed)
+    print(f"PORT {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever(poll_interval=0.2)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
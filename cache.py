@@ -0,0 +1,146 @@
+"""Persistent on-disk cache of extracted video metadata (yt-dlp info dicts)."""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils import log, app_data_dir
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 5 * 3600 # Used when no stream URL carries an expiry (YouTube: ~6h)
+EXPIRY_MARGIN = 15 * 60 # Don't hand out URLs that expire mid-download
+
+_EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d{9,11})")
+
+
+def stream_expiry(info):
+    """Earliest `expire` timestamp found in the info dict's stream URLs, or None."""
+    earliest = None
+    for f in info.get("formats") or []:
+        for key in ("url", "manifest_url", "fragment_base_url"):
+            m = _EXPIRE_RE.search(f.get(key) or "")
+            if m:
+                ts = int(m.group(1))
+                if earliest is None or ts < earliest:
+                    earliest = ts
+    return earliest
+
+
+class MetadataCache:
+    """Video ID -> info dict, stored as one JSON file per video.
+
+    Entries expire with their stream URLs; the least recently used entries are
+    evicted when the cache grows past max_bytes.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, default_ttl=DEFAULT_TTL):
+        self.cache_dir = cache_dir or app_data_dir("metadata")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict() # video_id -> size in bytes, oldest use first
+        self._bytes = 0
+        self._load_index()
+
+    def _file(self, video_id):
+        return os.path.join(self.cache_dir, f"{video_id}.json")
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-5], st.st_size))
+        for _, vid, size in sorted(entries):
+            self._index[vid] = size
+            self._bytes += size
+
+    def get(self, video_id):
+        """Returns the cached info dict for video_id, or None on miss/expiry."""
+        with self._lock:
+            if video_id not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(self._file(video_id), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+
+            if not entry or entry.get("expires", 0) <= time.time():
+                self._remove(video_id)
+                self.misses += 1
+                return None
+
+            self._index.move_to_end(video_id)
+            try:
+                os.utime(self._file(video_id)) # mtime doubles as LRU order on reload
+            except OSError:
+                pass
+            self.hits += 1
+            return entry["info"]
+
+    def put(self, video_id, info):
+        expires = stream_expiry(info)
+        if expires is None:
+            expires = time.time() + self.default_ttl
+        else:
+            expires -= EXPIRY_MARGIN
+        if expires <= time.time():
+            return
+
+        data = json.dumps({"expires": expires, "info": info}, default=str).encode("utf-8")
+        with self._lock:
+            if video_id in self._index:
+                self._remove(video_id)
+            path = self._file(video_id)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                log(f"[cache] Cannot write {video_id}: {e}")
+                return
+            self._index[video_id] = len(data)
+            self._bytes += len(data)
+            self._evict()
+
+    def invalidate(self, video_id):
+        with self._lock:
+            if video_id in self._index:
+                self._remove(video_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._bytes,
+            }
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            vid = next(iter(self._index))
+            self._remove(vid)
+            self.evictions += 1
+
+    def _remove(self, video_id):
+        self._bytes -= self._index.pop(video_id, 0)
+        try:
+            os.remove(self._file(video_id))
+        except OSError:
+            pass
@@ -0,0 +1,299 @@
+"""Headless command-line entry point.
+
+Drives DownloadManager/DownloadQueue directly: no GUI, no auto-update, no
+requirements check. Progress is written to stdout as JSON lines, logs go to
+stderr.
+
+    python cli.py URL [URL ...] [-i FILE|-] [-o DIR] [-m video|audio] [-q 1080p] [-f mp4] [-j 3]
+    python cli.py URL --also audio::mp3 --also video:480p:mp4  # several outputs, one download
+    python cli.py --serve [PORT]           # daemon: warm engines, local JSON API
+    python cli.py --connect [ADDR] URL ... # submit to the daemon and follow the jobs
+    python cli.py --submit-to DIR URL ...  # queue jobs in a shared job directory
+    python cli.py --worker DIR             # claim and run jobs from it (any number of hosts)
+    python cli.py -i big.txt --isolate --recycle-after 50 --max-rss 800 --job-timeout 3600
+
+Exit codes: 0 all jobs succeeded, 1 at least one job failed,
+2 usage error (no URL), 130 interrupted.
+"""
+import atexit
+import argparse
+import os
+import sys
+import threading
+import time
+
+from utils import logger, DEBUG
+from downloader import DownloadManager, DownloadQueue
+from concurrency import DEFAULT_BUDGET
+from bandwidth import parse_rate
+from journal import JobJournal
+from staging import FSYNC_POLICIES, FSYNC_NONE
+from isolation import IsolatedManager, MAX_JOBS
+from urls import canonical_url
+from output import MODES, DEFAULTS, JsonEmitter, output_spec
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+def parse_output(text):
+    """argparse type for --also MODE[:QUALITY[:FORMAT]]."""
+    try:
+        return output_spec(*text.split(":", 2))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def read_urls(args):
+    urls = list(args.urls)
+    if args.input:
+        if args.input == "-":
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(args.input, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        urls.extend(lines)
+    elif not urls and not sys.stdin.isatty():
+        urls.extend(sys.stdin.read().splitlines())
+
+    # Strip blanks and comments, keep order, drop duplicates (youtu.be/ID = watch?v=ID)
+    seen = set()
+    result = []
+    for u in urls:
+        u = u.strip()
+        if not u or u.startswith("#") or canonical_url(u) in seen:
+            continue
+        seen.add(canonical_url(u))
+        result.append(u)
+    return result
+
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="cli.py", description="UltraYouTube Downloader (headless)")
+    p.add_argument("urls", nargs="*", help="URLs to download")
+    p.add_argument("-i", "--input", help="File with one URL per line ('-' for stdin)")
+    p.add_argument("-o", "--output", default="Downloads_YT", help="Output directory (default: %(default)s)")
+    p.add_argument("-m", "--mode", choices=sorted(MODES), default="video")
+    p.add_argument("-q", "--quality", help="e.g. 1080p, 720p, '320 kbps' (default depends on mode)")
+    p.add_argument("-f", "--format", dest="fmt", help="e.g. mp4, mkv, mp3, m4a (default depends on mode)")
+    p.add_argument("--also", type=parse_output, action="append", metavar="MODE:QUALITY:FMT",
+                   help="Extra output made from the same download, e.g. audio::mp3 or video:480p:webm (repeatable)")
+    p.add_argument("-j", "--jobs", type=int, default=3, help="Concurrent downloads (default: %(default)s)")
+    p.add_argument("--playlist-jobs", type=int, default=3,
+                   help="Parallel entries per playlist, 0 = single sequential yt-dlp run (default: %(default)s)")
+    p.add_argument("--pp-jobs", type=int, default=None, metavar="N",
+                   help="Parallel FFmpeg merges/transcodes, overlapping downloads "
+                        "(default: one per CPU, 0 = inline in each download)")
+    p.add_argument("--sync", action="store_true",
+                   help="Playlists: download only entries missing from the last sync snapshot")
+    p.add_argument("--record-removals", action="store_true",
+                   help="With --sync: enumerate the whole playlist and mark removed entries")
+    p.add_argument("--staging-dir", metavar="DIR",
+                   help="Write downloads here until complete (default: a hidden .staging folder in the output, "
+                        "so finishing a file is a rename)")
+    p.add_argument("--fsync", choices=FSYNC_POLICIES, default=FSYNC_NONE,
+                   help="Sync finished files ('file') and their folder too ('full') before they appear "
+                        "(default: %(default)s)")
+    p.add_argument("--no-cache", action="store_true", help="Do not use the metadata cache")
+    p.add_argument("--no-archive", action="store_true", help="Download again even if already archived")
+    p.add_argument("--hedge", action="store_true",
+                   help="Start the fallback engine in parallel when the primary stalls")
+    p.add_argument("--stall-timeout", type=float, default=20, help="Seconds without progress before hedging (default: %(default)s)")
+    p.add_argument("--latency-budget", type=float, default=180, help="Seconds before hedging anyway (default: %(default)s)")
+    p.add_argument("--connections", type=int, default=DEFAULT_BUDGET,
+                   help="Fragment connections shared by all jobs (default: %(default)s)")
+    p.add_argument("--limit-rate", type=parse_rate, help="Total bandwidth cap, e.g. 5M, 800K (bytes/s)")
+    p.add_argument("--priority", type=int, default=1, help="Priority / bandwidth weight of these jobs (default: %(default)s)")
+    p.add_argument("--progress-rate", type=float, default=2,
+                   help="Max progress lines per second per job (default: %(default)s)")
+    p.add_argument("--resume", action="store_true", help="Also resume jobs interrupted in a previous run")
+    p.add_argument("--isolate", action="store_true",
+                   help="Run each download in a worker process, recycled regularly (flat memory on long runs)")
+    p.add_argument("--recycle-after", type=int, default=MAX_JOBS, metavar="N",
+                   help="With --isolate: replace a worker process after N jobs (default: %(default)s)")
+    p.add_argument("--max-rss", type=float, metavar="MB",
+                   help="With --isolate: replace a worker process once it uses more memory than this")
+    p.add_argument("--job-timeout", type=float, metavar="SECONDS",
+                   help="With --isolate: kill a job (and its process) running longer than this")
+    p.add_argument("--trace", action="store_true",
+                   help="Emit a 'trace' line per finished job (time per phase, bytes per engine, retries...)")
+    p.add_argument("--metrics-file", metavar="PATH",
+                   help="Keep Prometheus metrics in this file (rewritten every 10 s and at exit)")
+    p.add_argument("--serve", nargs="?", type=int, const=8719, metavar="PORT",
+                   help="Run as a daemon serving the local job API (default port: %(const)s)")
+    p.add_argument("--connect", nargs="?", const="auto", metavar="ADDR",
+                   help="Submit to a running daemon (default: the one found locally) instead of downloading here")
+    p.add_argument("--submit-to", metavar="DIR", help="Queue the URLs in a shared job directory and exit")
+    p.add_argument("--worker", metavar="DIR", help="Run jobs claimed from a shared job directory (results in DIR/output)")
+    p.add_argument("--lease", type=float, default=60,
+                   help="Worker: seconds without heartbeat before a job is reclaimed (default: %(default)s)")
+    p.add_argument("--until-empty", action="store_true", help="Worker: exit once the shared queue is drained")
+    p.add_argument("--quiet", action="store_true", help="Do not write engine logs to stderr")
+    p.add_argument("-v", "--verbose", action="store_true", help="Include yt-dlp debug output in the logs")
+    p.add_argument("--log-file", help="Also write logs to this file (rotated at 5 MB)")
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # stdout is reserved for JSON lines
+    logger.headless = True
+    logger.stream = open(os.devnull, "w") if args.quiet else sys.stderr
+    if args.verbose:
+        logger.level = DEBUG
+    if args.log_file:
+        logger.add_file_sink(args.log_file)
+
+    if args.connect:
+        return connect(args)
+    urls = [] if args.serve or args.worker else read_urls(args)
+    if args.submit_to:
+        return submit_shared(args, urls)
+    if not urls and not args.resume and not args.serve and not args.worker:
+        print("error: no URL given (arguments, --input FILE or stdin)", file=sys.stderr)
+        return EXIT_USAGE
+    if args.isolate and args.serve:
+        print("error: --isolate is not available with --serve", file=sys.stderr)
+        return EXIT_USAGE
+
+    quality, fmt = DEFAULTS[args.mode]
+    quality = args.quality or quality
+    fmt = args.fmt or fmt
+    outputs = [[MODES[args.mode], quality, fmt]] + args.also if args.also else None
+
+    out = JsonEmitter()
+    options = dict(cache=False if args.no_cache else None,
+                   # Workers: the shared directory is the record of what was done
+                   archive=False if args.no_archive or args.worker else None,
+                   hedge=args.hedge, stall_timeout=args.stall_timeout,
+                   latency_budget=args.latency_budget,
+                   connection_budget=args.connections, rate_limit=args.limit_rate,
+                   progress_rate=args.progress_rate, playlist_workers=args.playlist_jobs,
+                   sync=args.sync, record_removals=args.record_removals,
+                   postprocess_workers=args.pp_jobs, staging_dir=args.staging_dir,
+                   fsync=args.fsync)
+    if args.isolate:
+        manager = IsolatedManager(args.jobs, max_jobs=args.recycle_after, max_rss=args.max_rss,
+                                  timeout=args.job_timeout, **options)
+        atexit.register(manager.close)
+    else:
+        manager = DownloadManager(**options)
+    if args.metrics_file:
+        manager.metrics.export(args.metrics_file)
+        atexit.register(manager.metrics.write, args.metrics_file) # Final totals
+    if args.worker:
+        from distributed import Worker
+        worker = Worker(manager, args.worker, jobs=args.jobs, lease=args.lease)
+        try:
+            worker.run(until_empty=args.until_empty)
+        except KeyboardInterrupt:
+            return EXIT_INTERRUPTED # Our leases expire, other workers take over
+        out.emit("summary", shared=worker.shared.counts())
+        return EXIT_OK
+
+    journal = JobJournal()
+    if args.serve:
+        from daemon import Daemon
+        Daemon(manager, workers=args.jobs, journal=journal, port=args.serve).serve()
+        return EXIT_OK
+
+    # Finished jobs are only counted: the queue forgets them, memory stays flat on long runs
+    emit_status = out.on_trace if args.trace else out.on_status
+    finished = {"done": 0, "other": 0}
+    lock = threading.Lock()
+
+    def on_status(job):
+        emit_status(job)
+        if job.finished:
+            with lock:
+                finished["done" if job.status == "done" else "other"] += 1
+
+    manager.progress.subscribe(out.on_progress)
+    queue = DownloadQueue(manager, workers=args.jobs, on_status=on_status, journal=journal)
+
+    started = time.monotonic()
+    total = 0
+    if args.resume:
+        journal.collect_garbage(staging_root=manager.staging.root)
+        total += len(queue.resume())
+    for u in urls:
+        queue.submit(u, args.output, MODES[args.mode], quality, fmt, args.priority, outputs=outputs)
+        total += 1
+    try:
+        # Poll instead of join() so Ctrl+C is delivered promptly
+        while finished["done"] + finished["other"] < total:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        out.emit("interrupted", pending=[j.id for j in queue.pending()])
+        return EXIT_INTERRUPTED
+
+    failed = finished["other"]
+    out.emit("summary", total=total, succeeded=total - failed, failed=failed,
+             elapsed=round(time.monotonic() - started, 3))
+    out.emit("engines", stats=manager.health.snapshot())
+    queue.stop(wait=False)
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def submit_shared(args, urls):
+    from distributed import SharedQueue
+    if not urls:
+        print("error: no URL given (arguments, --input FILE or stdin)", file=sys.stderr)
+        return EXIT_USAGE
+    shared = SharedQueue(args.submit_to)
+    quality, fmt = DEFAULTS[args.mode]
+    quality, fmt = args.quality or quality, args.fmt or fmt
+    outputs = [[MODES[args.mode], quality, fmt]] + args.also if args.also else None
+    out = JsonEmitter()
+    for u in urls:
+        job_id = shared.submit(u, MODES[args.mode], quality, fmt, priority=args.priority, outputs=outputs)
+        out.emit("status", job=job_id, url=u, status="queued")
+    return EXIT_OK
+
+
+def connect(args):
+    """Thin client: the daemon downloads, this process relays its events."""
+    from client import DaemonClient, DaemonError, find_daemon
+    client = find_daemon() if args.connect == "auto" else DaemonClient(args.connect)
+    if client is None:
+        print("error: no running daemon found (start one with --serve)", file=sys.stderr)
+        return EXIT_USAGE
+    urls = read_urls(args)
+    if not urls:
+        print("error: no URL given (arguments, --input FILE or stdin)", file=sys.stderr)
+        return EXIT_USAGE
+
+    out = JsonEmitter()
+    started = time.monotonic()
+    try:
+        events = client.events() # Opened before submitting: no event can be missed
+        jobs = {j["id"]: j["status"] for j in client.submit(urls, args.output, args.mode, args.quality,
+                                                             args.fmt, args.priority, args.also)}
+    except (OSError, DaemonError) as e:
+        print(f"error: daemon: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    try:
+        for record in events:
+            job = str(record.get("job", ""))
+            if job.split(".")[0] not in jobs:
+                continue # Other clients' jobs (and their playlist entries)
+            out.write(record)
+            if record["event"] == "status" and job in jobs:
+                jobs[job] = record["status"]
+                if all(s in ("done", "failed", "cancelled") for s in jobs.values()):
+                    break
+    except KeyboardInterrupt:
+        # The jobs keep running in the daemon
+        out.emit("interrupted", pending=[j for j, s in jobs.items() if s not in ("done", "failed", "cancelled")])
+        return EXIT_INTERRUPTED
+
+    failed = [j for j, s in jobs.items() if s != "done"]
+    out.emit("summary", total=len(jobs), succeeded=len(jobs) - len(failed), failed=len(failed),
+             elapsed=round(time.monotonic() - started, 3))
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
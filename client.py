@@ -0,0 +1,217 @@
+"""Thin client for the daemon's JSON API (see daemon.py)."""
+import collections
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+from utils import log, app_data_dir, WARNING
+from journal import pid_alive
+from progress import ProgressChannel, ProgressEvent
+
+STATE_FILE = "daemon.json"
+EARLY_EVENTS = 1000 # Status records kept for jobs not known (yet) to a RemoteQueue
+
+
+class DaemonError(Exception):
+    pass
+
+
+class DaemonClient:
+    """token: the daemon's token (see daemon.json); by default read from the
+    local daemon.json when it describes the same address."""
+    def __init__(self, address, token=None):
+        self.address = address.rstrip("/")
+        if token is None:
+            state = read_state()
+            if state.get("address", "").rstrip("/") == self.address:
+                token = state.get("token")
+        self.token = token
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def _call(self, method, path, body=None, timeout=10):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(self.address + path, data=data, method=method, headers=self._headers())
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                return json.loads(resp.read() or b"null")
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error")
+            except (ValueError, AttributeError):
+                message = None
+            raise DaemonError(message or f"HTTP {e.code}") from None
+
+    def health(self, timeout=10):
+        return self._call("GET", "/health", timeout=timeout)
+
+    def jobs(self):
+        return self._call("GET", "/jobs")
+
+    def job(self, job_id):
+        return self._call("GET", f"/jobs/{job_id}")
+
+    def submit(self, urls, output=None, mode="video", quality=None, fmt=None, priority=1, also=None):
+        """Queues urls on the daemon. `also`: extra [mode, quality, fmt] outputs
+        made from the same download. Returns the new jobs (dicts)."""
+        body = {"urls": list(urls), "output": os.path.abspath(output) if output else None,
+                "mode": mode, "quality": quality, "fmt": fmt, "priority": priority}
+        if also:
+            body["also"] = [list(spec) for spec in also]
+        return self._call("POST", "/jobs", body)
+
+    def cancel(self, job_id):
+        return self._call("DELETE", f"/jobs/{job_id}")
+
+    def set_priority(self, job_id, priority):
+        return self._call("POST", f"/jobs/{job_id}/priority", {"priority": priority})
+
+    def shutdown(self):
+        return self._call("POST", "/shutdown")
+
+    def events(self):
+        """Opens the event stream now; returns an iterator of event dicts."""
+        resp = urllib.request.urlopen(urllib.request.Request(self.address + "/events", headers=self._headers()))
+
+        def lines():
+            with resp:
+                for line in resp:
+                    line = line.strip()
+                    if line: # Blank lines are keep-alives
+                        yield json.loads(line)
+        return lines()
+
+
+def read_state():
+    """Contents of the local daemon.json ({} if there is none)."""
+    try:
+        with open(os.path.join(app_data_dir(), STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def find_daemon():
+    """Returns a DaemonClient for the running daemon, or None."""
+    state = read_state()
+    if not state.get("pid") or not pid_alive(state["pid"]):
+        return None
+    client = DaemonClient(state["address"], state.get("token"))
+    try:
+        client.health(timeout=1)
+    except (OSError, DaemonError):
+        return None
+    return client
+
+
+class RemoteJob:
+    """Client-side mirror of a daemon job (same attributes as DownloadJob)."""
+    def __init__(self, data):
+        self.id = data["id"]
+        self.url = data["url"]
+        self.path = self.mode = self.quality = self.fmt = self.error = None
+        self.priority = 1
+        self.status = "queued"
+        self.progress = 0.0
+        self.update(data)
+
+    def update(self, data):
+        for key in ("path", "mode", "quality", "fmt", "priority", "status", "progress", "error"):
+            if key in data:
+                setattr(self, key, data[key])
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def __repr__(self):
+        return f"<RemoteJob {self.id} {self.status} {self.url}>"
+
+
+class RemoteQueue:
+    """DownloadQueue look-alike backed by the daemon, so the GUI can be a thin client.
+    Only the jobs submitted through it are tracked, not the daemon's other work.
+
+    on_status(job) is called from the event thread; progress events are
+    republished on self.progress, a local ProgressChannel.
+    """
+    journal = None # The daemon resumes its own jobs
+
+    def __init__(self, client, on_status=None, progress_rate=10):
+        self.client = client
+        self.on_status = on_status
+        self.progress = ProgressChannel(progress_rate)
+        self.jobs = {} # Only the jobs submitted through this queue
+        self._early = collections.OrderedDict() # Other jobs' last status, in case it is one of ours in flight
+        self._lock = threading.Lock()
+        self._events = client.events()
+        threading.Thread(target=self._listen, name="daemon-events", daemon=True).start()
+
+    def submit(self, url, path, mode, quality, fmt, priority=1):
+        mode = "audio" if mode == "Audio" else "video"
+        data = self.client.submit([url], path, mode, quality, fmt, priority)[0]
+        with self._lock:
+            job = self.jobs[data["id"]] = RemoteJob(data)
+            # Its events may have come in before the daemon's reply: they are newer
+            early = self._early.pop(job.id, None)
+            if early:
+                job.update(early)
+        if early and self.on_status:
+            self.on_status(job)
+        return job
+
+    def resume(self):
+        return []
+
+    def cancel(self, job_id):
+        try:
+            self.client.cancel(job_id)
+            return True
+        except DaemonError:
+            return False
+
+    def set_priority(self, job_id, priority):
+        try:
+            self.client.set_priority(job_id, priority)
+            return True
+        except DaemonError:
+            return False
+
+    def pending(self):
+        return [j for j in list(self.jobs.values()) if not j.finished]
+
+    def _track(self, data):
+        """Updates one of our jobs; returns None for other clients' jobs."""
+        with self._lock:
+            job = self.jobs.get(data["id"])
+            if job is None:
+                self._early[data["id"]] = data
+                self._early.move_to_end(data["id"])
+                while len(self._early) > EARLY_EVENTS:
+                    self._early.popitem(last=False)
+            else:
+                job.update(data)
+        return job
+
+    def _listen(self):
+        try:
+            for record in self._events:
+                kind = record.pop("event", None)
+                if kind == "status":
+                    job = self._track({"id": record["job"], "url": record["url"], "status": record["status"],
+                                       "error": record.get("error")})
+                    if job and self.on_status:
+                        self.on_status(job)
+                elif kind == "progress":
+                    job = self.jobs.get(record.get("job"))
+                    if job:
+                        job.progress = record.get("fraction", job.progress)
+                    self.progress.publish(ProgressEvent.from_dict(record))
+        except (OSError, ValueError) as e:
+            log(f"[client] Lost the daemon event stream: {e}", WARNING)
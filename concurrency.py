@@ -0,0 +1,165 @@
+"""Adaptive fragment concurrency (AIMD) under a global connection budget."""
+import threading
+import time
+
+DEFAULT_BUDGET = 32 # Fragment connections shared by every active download
+INITIAL_FRAGMENTS = 15 # First download's fragments (the former fixed value)
+MAX_FRAGMENTS = 32
+MIN_BUFFER = 64 * 1024
+MAX_BUFFER = 4 * 1024 * 1024
+
+
+class ConnectionBudget:
+    """Global pool of fragment connections. Each active download holds a
+    FragmentController whose share grows and shrinks inside this pool.
+
+    yt-dlp reads the fragment count once per stream, so a download mostly runs
+    at the value it starts with: new controllers start where the previous ones
+    ended (last_value). It goes up when a download grew past it, and down only
+    when a download was cut for congestion, not when it was merely held back
+    by other downloads sharing the budget."""
+    def __init__(self, total=DEFAULT_BUDGET):
+        self.total = max(1, int(total))
+        self._used = 0
+        self._controllers = set()
+        self._generation = 0 # Bumped whenever a download starts or ends
+        self.last_value = INITIAL_FRAGMENTS
+        self._lock = threading.Lock()
+
+    def controller(self, initial=None, maximum=MAX_FRAGMENTS):
+        return FragmentController(self, initial or self.last_value, maximum)
+
+    def _open(self, ctrl, want):
+        with self._lock:
+            # Every download gets at least one connection, even over budget
+            granted = max(1, min(want, self.total - self._used))
+            self._used += granted
+            self._controllers.add(ctrl)
+            self._generation += 1
+            return granted
+
+    def _grow(self, n=1):
+        with self._lock:
+            if self._used + n > self.total:
+                return False
+            self._used += n
+            return True
+
+    def _release(self, n):
+        with self._lock:
+            self._used = max(0, self._used - n)
+
+    def _close(self, ctrl):
+        with self._lock:
+            self._controllers.discard(ctrl)
+            self._generation += 1
+            if ctrl.cut or ctrl.value > self.last_value:
+                self.last_value = ctrl.value
+            self._used = max(0, self._used - ctrl.value)
+
+    @property
+    def used(self):
+        return self._used
+
+    def aggregate_rate(self):
+        """Sum of the latest measured throughput (bytes/s) of all active downloads."""
+        with self._lock:
+            return sum(c.rate for c in self._controllers)
+
+    def mean_rate(self):
+        """(aggregate throughput / active downloads, generation). Means taken
+        under different generations (a download started or ended in between)
+        are not comparable."""
+        with self._lock:
+            n = len(self._controllers)
+            return (sum(c.rate for c in self._controllers) / n if n else 0.0), self._generation
+
+
+class FragmentController:
+    """AIMD controller for one download's fragment concurrency.
+
+    Every `interval` seconds the measured throughput is compared to the
+    previous window: if adding connections still pays off (and the global
+    budget allows it) concurrency grows by one; on congestion (throttling,
+    retries, or the mean throughput per download collapsing while the same
+    downloads run) it is halved.
+    """
+    def __init__(self, budget, initial=INITIAL_FRAGMENTS, maximum=MAX_FRAGMENTS, interval=2.0):
+        self.budget = budget
+        self.maximum = maximum
+        self.interval = interval
+        self.value = budget._open(self, initial)
+
+        self.rate = 0.0 # bytes/s over the last window
+        self._best_rate = 0.0
+        self._mean = 0.0 # Mean rate per download at the previous tick
+        self._generation = None
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+        self._seen = {} # filename -> downloaded_bytes
+        self._congested = False
+        self.cut = False # Halved for congestion at least once
+        self._lock = threading.Lock()
+        self.closed = False
+
+    @property
+    def buffersize(self):
+        # ~1/4 s of one connection's share, so reads stay responsive
+        per_conn = self.rate / max(1, self.value) / 4 if self.rate else 1024 * 1024
+        return int(min(MAX_BUFFER, max(MIN_BUFFER, per_conn)))
+
+    def observe(self, key, downloaded_bytes):
+        """Feeds a cumulative byte counter (e.g. from a yt-dlp progress hook).
+        Returns True when the concurrency value changed."""
+        with self._lock:
+            prev = self._seen.get(key, 0)
+            self._seen[key] = downloaded_bytes
+            if downloaded_bytes > prev:
+                self._window_bytes += downloaded_bytes - prev
+            return self._tick()
+
+    def add_bytes(self, n):
+        with self._lock:
+            self._window_bytes += n
+            return self._tick()
+
+    def congestion(self):
+        """Signals throttling / retried fragments: halve on the next tick."""
+        with self._lock:
+            self._congested = True
+
+    def _tick(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.interval or self.closed:
+            return False
+
+        self.rate = self._window_bytes / elapsed
+        self._window_bytes = 0
+        self._window_start = now
+        # A finished download takes its rate out of the sum: only compare
+        # per-download means, and start over when the set of downloads changed
+        mean, generation = self.budget.mean_rate()
+        collapsed = generation == self._generation and self._mean and mean < 0.6 * self._mean
+        self._mean, self._generation = mean, generation
+
+        old = self.value
+        if self._congested or collapsed:
+            new = max(1, self.value // 2)
+            self.budget._release(self.value - new)
+            self.value = new
+            self._best_rate = self.rate
+            self._congested = False
+            self.cut = True
+        elif self.rate >= self._best_rate * 1.05 and self.value < self.maximum:
+            # Still scaling: probe one more connection
+            self._best_rate = self.rate
+            if self.budget._grow(1):
+                self.value += 1
+        return self.value != old
+
+    def close(self):
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self.budget._close(self)
@@ -0,0 +1,286 @@
+"""Long-running daemon: one warm DownloadManager behind a local JSON API.
+
+Engines stay imported, extraction sessions stay warm and every client (CLI,
+GUI, scripts) shares one queue, one bandwidth limiter and one connection budget.
+
+    GET    /health               engines, queue counters, pid
+    GET    /jobs                 every job
+    POST   /jobs                 {"urls": [...], "output", "mode", "quality", "fmt", "priority",
+                                  "also": [[mode, quality, fmt], ...]}
+    GET    /jobs/<id>            one job
+    GET    /jobs/<id>/trace      its spans and counters (time per phase, bytes per engine...)
+    DELETE /jobs/<id>            cancel (queued or running)
+    POST   /jobs/<id>/priority   {"priority": n}
+    GET    /events               JSON lines: a status event per job, then live
+                                 status/progress events (same format as cli.py)
+    GET    /metrics              Prometheus text format
+    POST   /shutdown
+
+The server only listens on 127.0.0.1; its address and a per-daemon token
+are written to daemon.json in app_data_dir() (readable by this user only)
+for clients to find it. Every request must carry the token
+(`Authorization: Bearer <token>`), bodies must be `application/json`, and
+requests with an Origin header (made by a web page) are refused: a page in
+a browser can neither read the token nor send a request passing these checks.
+"""
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import log, app_data_dir, WARNING
+from output import JsonEmitter, output_spec
+from downloader import DownloadQueue, _load_pytube
+
+DEFAULT_PORT = 8719
+STATE_FILE = "daemon.json"
+
+
+class EventHub(JsonEmitter):
+    """JsonEmitter fanning records out to the connected /events streams.
+    A client that stops reading loses its oldest records, never blocks the queue."""
+    def __init__(self, maxlen=1000):
+        super().__init__()
+        self.maxlen = maxlen
+        self._clients = []
+
+    def subscribe(self):
+        q = queue.Queue(self.maxlen)
+        with self._lock:
+            self._clients.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._clients:
+                self._clients.remove(q)
+
+    def write(self, record):
+        with self._lock:
+            clients = list(self._clients)
+        for q in clients:
+            while True:
+                try:
+                    q.put_nowait(record)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+class Daemon:
+    def __init__(self, manager, workers=3, journal=None, port=DEFAULT_PORT):
+        self.manager = manager
+        self.hub = EventHub()
+        self.queue = DownloadQueue(manager, workers=workers, on_status=self.hub.on_status, journal=journal)
+        manager.progress.subscribe(self.hub.on_progress)
+        self.started = time.time()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.server.daemon_threads = True
+        self.server.app = self
+        self.token = secrets.token_urlsafe(32)
+        self.stopping = threading.Event()
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve(self):
+        """Serves until shutdown() (POST /shutdown) or Ctrl+C."""
+        # Engines are imported now, not on the first job
+        threading.Thread(target=self._warm_up, name="warm-up", daemon=True).start()
+        if self.queue.journal:
+            self.queue.journal.collect_garbage(staging_root=self.manager.staging.root)
+            self.queue.resume()
+        state = os.path.join(app_data_dir(), STATE_FILE)
+        if os.path.exists(state):
+            os.remove(state) # A stale file keeps its old permissions when reopened
+        with open(os.open(state, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+            json.dump({"address": self.address, "pid": os.getpid(), "token": self.token}, f)
+        log(f"Daemon listening on {self.address}")
+        try:
+            self.server.serve_forever(poll_interval=0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stopping.set()
+            self.server.server_close()
+            self.queue.stop(wait=False)
+            if os.path.exists(state):
+                os.remove(state)
+            log("Daemon stopped.")
+
+    def shutdown(self):
+        self.stopping.set()
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _warm_up(self):
+        self.manager.warm_up()
+        _load_pytube()
+
+    def health(self):
+        counts = {}
+        for job in list(self.queue.jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"pid": os.getpid(), "uptime": round(time.time() - self.started, 1), "jobs": counts,
+                "engines": self.manager.health.snapshot(), "connections": self.manager.connections.used,
+                "bandwidth": self.manager.bandwidth.rates()}
+
+    def submit(self, body):
+        urls = body.get("urls") or ([body["url"]] if body.get("url") else [])
+        if not urls:
+            raise ValueError("expected 'urls'")
+        mode, quality, fmt = output_spec(body.get("mode"), body.get("quality"), body.get("fmt"))
+        also = [output_spec(*spec) for spec in body.get("also") or []]
+        outputs = [[mode, quality, fmt]] + also if also else None
+        output = os.path.abspath(body.get("output") or "Downloads_YT")
+        return [self.queue.submit(u, output, mode, quality, fmt, int(body.get("priority", 1)), outputs=outputs)
+                for u in urls]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "UltraYouTube"
+
+    @property
+    def app(self):
+        return self.server.app
+
+    def log_message(self, fmt, *args):
+        pass # Requests are not worth a log line each
+
+    def _send(self, code, obj):
+        data = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _allowed(self):
+        """Refuses (and answers) requests from browsers or without the daemon's token."""
+        if self.headers.get("Origin") is not None:
+            self._send(403, {"error": "cross-origin requests are not allowed"})
+            return False
+        scheme, _, token = (self.headers.get("Authorization") or "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), self.app.token.encode()):
+            self._send(401, {"error": "missing or invalid token (see daemon.json)"})
+            return False
+        return True
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _job(self, job_id):
+        job = self.app.queue.jobs.get(job_id)
+        if not job:
+            self._send(404, {"error": f"unknown job {job_id}"})
+        return job
+
+    def do_GET(self):
+        if not self._allowed():
+            return
+        parts = self.path.strip("/").split("/")
+        if parts == ["health"]:
+            self._send(200, self.app.health())
+        elif parts == ["jobs"]:
+            self._send(200, [j.as_dict() for j in list(self.app.queue.jobs.values())])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job:
+                self._send(200, job.as_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "trace":
+            job = self._job(parts[1])
+            if job:
+                self._send(200, job.trace.summary() if job.trace else {"job": job.id, "spans": []})
+        elif parts == ["events"]:
+            self._events()
+        elif parts == ["metrics"]:
+            self._metrics()
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _metrics(self):
+        data = self.app.manager.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self._allowed():
+            return
+        parts = self.path.strip("/").split("/")
+        if (self.headers.get("Content-Type") or "").split(";")[0].strip().lower() != "application/json":
+            return self._send(415, {"error": "expected Content-Type: application/json"})
+        try:
+            body = self._body()
+        except ValueError:
+            return self._send(400, {"error": "invalid JSON body"})
+        if parts == ["jobs"]:
+            try:
+                jobs = self.app.submit(body)
+            except (ValueError, TypeError) as e:
+                return self._send(400, {"error": str(e)})
+            self._send(201, [j.as_dict() for j in jobs])
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "priority":
+            job = self._job(parts[1])
+            if job:
+                ok = self.app.queue.set_priority(job.id, int(body.get("priority", 1)))
+                self._send(200 if ok else 409, job.as_dict())
+        elif parts == ["shutdown"]:
+            self._send(200, {"ok": True})
+            self.app.shutdown()
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        if not self._allowed():
+            return
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if job:
+                ok = self.app.queue.cancel(job.id)
+                self._send(200 if ok else 409, job.as_dict())
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _events(self):
+        hub = self.app.hub
+        sub = hub.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            # Current state first, so a client never misses a job that finished
+            # between its submission and this stream
+            for job in list(self.app.queue.jobs.values()):
+                self._write_line(hub.status(job))
+            while not self.app.stopping.is_set():
+                try:
+                    record = sub.get(timeout=5)
+                except queue.Empty:
+                    self.wfile.write(b"\n") # Keep-alive; also detects gone clients
+                    self.wfile.flush()
+                    continue
+                self._write_line(record)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            log(f"[daemon] event stream error: {e}", WARNING)
+        finally:
+            hub.unsubscribe(sub)
+
+    def _write_line(self, record):
+        self.wfile.write(json.dumps(record, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+        self.wfile.flush()
@@ -0,0 +1,350 @@
+"""Distributed mode: several hosts share one job directory (e.g. a network share).
+
+    <root>/pending/<prio>-<time>-<id>.json   jobs waiting, in claim order
+    <root>/claimed/<id>.json                 jobs being downloaded; the file's
+                                             mtime is the lease heartbeat
+    <root>/done/<id>.json, failed/<id>.json  results
+    <root>/staging/<id>/<claim>/             partial files of one claim of a job
+    <root>/output/                           common output tree
+
+Claiming is an atomic rename from pending/ to claimed/: exactly one worker
+wins. The owner refreshes the mtime of its claimed file every lease/3 seconds;
+a claimed file older than `lease` belongs to a dead worker and is put back in
+pending/. Every claim writes into its own staging folder: a worker that lost
+its lease may still be running, and only ever touches its own files. The
+next owner resumes from an earlier claim's partial files once nothing has
+written to them for a whole lease. Time is read from the shared filesystem
+itself, so hosts with skewed clocks agree on expiry.
+
+Plain files instead of SQLite: SQLite's locking is unreliable on network shares.
+"""
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+from utils import log, WARNING
+from archive import file_checksum
+from downloader import DownloadQueue
+
+LEASE = 60 # s without heartbeat before a job is reclaimed
+MAX_ATTEMPTS = 3
+PARTIAL_SUFFIXES = (".part", ".ytdl", ".temp")
+
+
+def _write_json(path, data, tmp_dir):
+    # Readers never see a half-written file
+    tmp = os.path.join(tmp_dir, f"{os.path.basename(path)}.{uuid.uuid4().hex[:8]}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish(src, dest):
+    """Moves src to dest without ever overwriting: an identical file already
+    there is kept, a different one makes us pick "name (2).ext". Returns the path."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    stem, ext = os.path.splitext(dest)
+    n = 1
+    while True:
+        try:
+            os.link(src, dest) # Fails if dest exists, atomically
+            os.remove(src)
+            return dest
+        except FileExistsError:
+            pass
+        except OSError:
+            # No hard links on this filesystem: check-then-rename (small race window)
+            if not os.path.exists(dest):
+                os.replace(src, dest)
+                return dest
+        if os.path.getsize(dest) == os.path.getsize(src) and file_checksum(dest) == file_checksum(src):
+            os.remove(src)
+            return dest
+        n += 1
+        dest = f"{stem} ({n}){ext}"
+
+
+def _last_write(folder):
+    """Latest mtime of a folder and everything in it."""
+    latest = os.path.getmtime(folder)
+    for parent, _, names in os.walk(folder):
+        for name in names:
+            try:
+                latest = max(latest, os.path.getmtime(os.path.join(parent, name)))
+            except OSError:
+                pass
+    return latest
+
+
+class SharedQueue:
+    """The job directory, usable from any host."""
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        for name in ("pending", "claimed", "done", "failed", "staging", "output", "tmp"):
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+
+    def _dir(self, name, *parts):
+        return os.path.join(self.root, name, *parts)
+
+    def submit(self, url, mode, quality, fmt, path="", priority=1, outputs=None):
+        """Queues a job; `path` is relative to the output tree. Returns its id."""
+        spec = {"id": uuid.uuid4().hex[:8], "url": url, "mode": mode, "quality": quality, "fmt": fmt,
+                "path": path, "priority": priority, "submitted": time.time(), "attempts": 0}
+        if outputs:
+            spec["outputs"] = [list(o) for o in outputs]
+        self._put_pending(spec)
+        return spec["id"]
+
+    def _put_pending(self, spec):
+        # Lexicographic order = claim order: priority first, then FIFO
+        prio = 100 - max(0, min(99, int(spec.get("priority", 1))))
+        name = f"{prio:03d}-{int(spec['submitted'] * 1000):013d}-{spec['id']}.json"
+        _write_json(self._dir("pending", name), spec, self._dir("tmp"))
+
+    def now(self):
+        """Current time according to the shared filesystem."""
+        probe = self._dir("tmp", f".clock-{os.getpid()}-{threading.get_ident()}")
+        with open(probe, "w"):
+            pass
+        try:
+            return os.path.getmtime(probe)
+        finally:
+            os.remove(probe)
+
+    def claim(self, worker):
+        """Claims the next pending job for `worker`. Returns its spec or None."""
+        for name in sorted(os.listdir(self._dir("pending"))):
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-5].rsplit("-", 1)[-1]
+            claimed = self._dir("claimed", f"{job_id}.json")
+            try:
+                os.rename(self._dir("pending", name), claimed)
+            except OSError:
+                continue # Another worker was faster
+            spec = _read_json(claimed)
+            if spec is None:
+                continue
+            spec["lease"] = {"worker": worker, "claimed": time.time(), "claim": uuid.uuid4().hex[:8]}
+            _write_json(claimed, spec, self._dir("tmp")) # Also starts the heartbeat clock
+            return spec
+        return None
+
+    def owner(self, job_id):
+        spec = _read_json(self._dir("claimed", f"{job_id}.json"))
+        return spec and spec.get("lease", {}).get("worker")
+
+    def heartbeat(self, job_id, worker):
+        """Extends the lease. Returns False if the job is no longer ours."""
+        if self.owner(job_id) != worker:
+            return False
+        try:
+            os.utime(self._dir("claimed", f"{job_id}.json"))
+            return True
+        except OSError:
+            return False
+
+    def reclaim(self, lease=LEASE, max_attempts=MAX_ATTEMPTS):
+        """Puts back the jobs whose lease expired. Returns their ids."""
+        now = self.now()
+        reclaimed = []
+        for name in os.listdir(self._dir("claimed")):
+            path = self._dir("claimed", name)
+            try:
+                if now - os.path.getmtime(path) < lease:
+                    continue
+                # Rename first: a single reclaimer wins, and a late heartbeat fails
+                grabbed = self._dir("tmp", f"{name}.reclaim-{uuid.uuid4().hex[:8]}")
+                os.rename(path, grabbed)
+            except OSError:
+                continue
+            spec = _read_json(grabbed) or {}
+            os.remove(grabbed)
+            if "id" not in spec:
+                continue
+            dead = spec.pop("lease", {}).get("worker")
+            spec["attempts"] = spec.get("attempts", 0) + 1
+            if spec["attempts"] >= max_attempts:
+                spec["error"] = f"lease expired {spec['attempts']} times (last owner {dead})"
+                _write_json(self._dir("failed", f"{spec['id']}.json"), spec, self._dir("tmp"))
+            else:
+                self._put_pending(spec)
+            log(f"[distributed] Reclaimed job {spec['id']} from {dead}.", WARNING)
+            reclaimed.append(spec["id"])
+        return reclaimed
+
+    def complete(self, spec, worker, files=None, error=None, max_attempts=MAX_ATTEMPTS):
+        """Records the result of an owned job; failures are retried up to max_attempts.
+        Returns False (nothing recorded) if the job is no longer ours."""
+        claimed = self._dir("claimed", f"{spec['id']}.json")
+        # Take the claim out of claimed/ first, as reclaim() does: once the job is
+        # back in pending/, a new owner's claim file must not be the one removed
+        grabbed = self._dir("tmp", f"{spec['id']}.json.complete-{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(claimed, grabbed)
+        except OSError:
+            return False # Reclaimed meanwhile
+        current = _read_json(grabbed) or {}
+        if current.get("lease", {}).get("worker") != worker:
+            os.rename(grabbed, claimed) # Someone else's claim: put it back untouched
+            return False
+        spec = dict(spec, finished=time.time(), worker=worker)
+        spec.pop("lease", None)
+        if error is None:
+            spec["files"] = files or []
+            _write_json(self._dir("done", f"{spec['id']}.json"), spec, self._dir("tmp"))
+            shutil.rmtree(self._dir("staging", spec["id"]), ignore_errors=True)
+        else:
+            spec["attempts"] = spec.get("attempts", 0) + 1
+            spec["error"] = error
+            if spec["attempts"] >= max_attempts:
+                _write_json(self._dir("failed", f"{spec['id']}.json"), spec, self._dir("tmp"))
+            else:
+                self._put_pending(spec)
+        os.remove(grabbed)
+        return True
+
+    def counts(self):
+        return {name: sum(1 for f in os.listdir(self._dir(name)) if f.endswith(".json"))
+                for name in ("pending", "claimed", "done", "failed")}
+
+
+class Worker:
+    """Claims jobs from a SharedQueue and runs them on a local DownloadQueue.
+
+    Each claim downloads into staging/<id>/<claim>/ (same volume as the output
+    tree), and its finished files are then published into output/ without
+    overwriting anything another host wrote, as long as the lease is still ours.
+    """
+    def __init__(self, manager, root, jobs=3, lease=LEASE, poll=2.0, max_attempts=MAX_ATTEMPTS):
+        self.shared = SharedQueue(root)
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.lease = lease
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self.queue = DownloadQueue(manager, workers=jobs, on_status=self._on_status)
+        self.slots = threading.Semaphore(jobs)
+        self.specs = {} # job id -> spec, for the jobs we own
+        self._lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def run(self, until_empty=False):
+        """Claims and runs jobs until stop() (or, with until_empty, until the
+        shared queue has nothing left for us)."""
+        log(f"[distributed] Worker {self.id} on {self.shared.root}")
+        heartbeat = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        last_reclaim = 0
+        try:
+            while not self.stopping.is_set():
+                if time.monotonic() - last_reclaim > self.lease / 2:
+                    self.shared.reclaim(self.lease, self.max_attempts)
+                    last_reclaim = time.monotonic()
+                if not self.slots.acquire(timeout=self.poll):
+                    continue
+                spec = self.shared.claim(self.id)
+                if spec is None:
+                    self.slots.release()
+                    with self._lock:
+                        idle = not self.specs
+                    if until_empty and idle and not self.shared.counts()["claimed"]:
+                        break
+                    self.stopping.wait(self.poll)
+                    continue
+                self._start(spec)
+        finally:
+            self.stopping.set()
+            self.queue.stop(wait=False)
+
+    def stop(self):
+        self.stopping.set()
+
+    def _start(self, spec):
+        with self._lock:
+            self.specs[spec["id"]] = spec
+        staging = self._take_staging(spec)
+        log(f"[distributed] Claimed {spec['id']} (attempt {spec.get('attempts', 0) + 1}): {spec['url']}")
+        self.queue.submit(spec["url"], staging, spec["mode"], spec["quality"], spec["fmt"],
+                          spec.get("priority", 1), job_id=spec["id"], outputs=spec.get("outputs"))
+
+    def _on_status(self, job):
+        if not job.finished:
+            return
+        with self._lock:
+            spec = self.specs.pop(job.id, None)
+        if spec is None:
+            return
+        try:
+            if self.shared.owner(job.id) != self.id:
+                # Reclaimed while finishing: the new owner publishes its own download
+                log(f"[distributed] Job {job.id} is no longer ours, its files are not published.", WARNING)
+            elif job.status == "done":
+                files = self._publish(spec)
+                self.shared.complete(spec, self.id, files=files)
+                log(f"[distributed] Job {job.id} done: {len(files)} file(s).")
+            elif job.status == "failed":
+                self.shared.complete(spec, self.id, error=job.error or "download failed",
+                                     max_attempts=self.max_attempts)
+            # cancelled: the lease was lost, the new owner takes over
+        except OSError as e:
+            log(f"[distributed] Could not record job {job.id}: {e}", WARNING)
+        finally:
+            self.slots.release()
+
+    def _staging(self, spec):
+        return self.shared._dir("staging", spec["id"], spec["lease"]["claim"])
+
+    def _take_staging(self, spec):
+        """Creates this claim's staging folder. An earlier claim's folder is taken
+        over (renamed) if nothing wrote to it for a whole lease; one still
+        written to belongs to a worker that lost its lease but is still running."""
+        mine = self._staging(spec)
+        job_dir = os.path.dirname(mine)
+        os.makedirs(job_dir, exist_ok=True)
+        now = self.shared.now()
+        for name in os.listdir(job_dir):
+            old = os.path.join(job_dir, name)
+            if old == mine or not os.path.isdir(old) or now - _last_write(old) < self.lease:
+                continue
+            try:
+                os.rename(old, mine)
+            except OSError:
+                continue # Taken over by another worker meanwhile
+            log(f"[distributed] Job {spec['id']}: resuming from the partial files of claim {name}.")
+            break
+        os.makedirs(mine, exist_ok=True)
+        return mine
+
+    def _publish(self, spec):
+        staging = self._staging(spec)
+        target = os.path.join(self.shared._dir("output"), spec.get("path") or "")
+        files = []
+        for folder, _, names in os.walk(staging):
+            for name in names:
+                if name.endswith(PARTIAL_SUFFIXES):
+                    continue
+                src = os.path.join(folder, name)
+                dest = publish(src, os.path.join(target, os.path.relpath(src, staging)))
+                files.append(os.path.relpath(dest, self.shared._dir("output")))
+        return files
+
+    def _heartbeat(self):
+        while not self.stopping.wait(self.lease / 3):
+            with self._lock:
+                owned = list(self.specs)
+            for job_id in owned:
+                if not self.shared.heartbeat(job_id, self.id):
+                    log(f"[distributed] Lost the lease of job {job_id}, cancelling it.", WARNING)
+                    self.queue.cancel(job_id)
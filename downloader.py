@@ -1,20 +1,503 @@
 import os
+import collections
 import shutil
-import yt_dlp
-from utils import log
+import queue
+import threading
+import time
+import uuid
+import itertools
+from concurrent.futures import Future
+from utils import log, debug, logger, DEBUG, WARNING, ERROR
+from urls import video_id, canonical_url, is_collection
+from cache import MetadataCache
+from archive import DownloadArchive, archive_id
+from engines import EngineHealth
+from concurrency import ConnectionBudget, DEFAULT_BUDGET
+from bandwidth import BandwidthLimiter
+from snapshots import PlaylistSnapshots
+from postprocess import PostProcessStage, PostTask, merge, scale, extract_audio
+from ranged import RangedDownloader
+from staging import Staging, FSYNC_NONE
+from retry import RetryCoordinator, classify, host_key, FINAL, THROTTLE, ENGINE_RETRIES
+from metrics import Metrics, Trace
+import journal as jr
+from progress import ProgressChannel, ProgressReporter, EXTRACTING, DOWNLOADING, POSTPROCESSING, FINISHED, FAILED
+
+KEEP_FINISHED = 1000 # Finished jobs a DownloadQueue keeps listing (older ones are dropped)
+
+def _load_pytube():
+    """Imports pytubefix on first use (fallback engine only). Returns None if unavailable."""
+    global YouTube
+    if YouTube is False:
+        try:
+            from pytubefix import YouTube as yt_cls
+            YouTube = yt_cls
+        except ImportError:
+            YouTube = None
+    return YouTube
+
+YouTube = False # Not loaded yet
+
+def _resolved(value):
+    """A Future already resolved with value."""
+    future = Future()
+    future.set_result(value)
+    return future
+
+def _all_of(results):
+    """A Future resolved once every result (bool or Future) is: True if all succeeded."""
+    futures = [r if isinstance(r, Future) else _resolved(r) for r in results]
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def one_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        combined.set_result(all(not f.exception() and f.result() for f in futures))
+
+    if not futures:
+        combined.set_result(True)
+    for f in futures:
+        f.add_done_callback(one_done)
+    return combined
+
+def _trace_of(reporter):
+    """The job's Trace (a throwaway one for engines called outside start_download)."""
+    return reporter.trace or Trace(reporter.job)
+
+
+def _folder_name(title):
+    """Folder name for a playlist, sanitised like outtmpl fields with 'windowsfilenames'."""
+    from yt_dlp.utils import sanitize_filename, sanitize_path
+    return sanitize_path(sanitize_filename(title, restricted=False), force=True)
+
+
+def _phase(kind):
+    """Trace phase of an FFmpeg step: muxing streams is a merge, anything else post-processing."""
+    return "merge" if kind == "Merger" else "postprocess"
+
+
+def _height(quality):
+    import re
+    return int(re.sub(r"[^0-9]", "", quality or "") or 0)
+
+class EngineCancelled(Exception):
+    """Raised inside an engine when its attempt was cancelled (e.g. lost a hedge)."""
+
+
+class _HedgeAttempt:
+    """One engine running on behalf of a hedged download."""
+    def __init__(self, engine, directory):
+        self.engine = engine
+        self.dir = directory
+        self.cancel = threading.Event()
+        self.ok = False
+        self.error = None
+        self.outputs = []
+        self.started = time.monotonic()
+        self.last_progress = self.started
+
+    def touch(self, event=None):
+        if event is None or event.phase == DOWNLOADING:
+            self.last_progress = time.monotonic()
+
+    def should_hedge(self, stall_timeout, latency_budget):
+        now = time.monotonic()
+        if stall_timeout and now - self.last_progress > stall_timeout:
+            return True
+        return bool(latency_budget) and now - self.started > latency_budget
+
+
+class _QuietLogger:
+    def debug(self, msg): pass
+    def info(self, msg): pass
+    def warning(self, msg): log(msg, WARNING)
+    def error(self, msg): log(msg, ERROR)
+
+
+class DownloadJob:
+    """A single download request (URL + options) tracked by a DownloadQueue.
+    outputs, if given, lists several (mode, quality, fmt) specs produced from one
+    download; mode/quality/fmt are then the first of them."""
+    def __init__(self, url, path, mode, quality, fmt, priority=1, job_id=None, outputs=None):
+        self.id = job_id or uuid.uuid4().hex[:8]
+        self.url = url
+        self.created = time.time() # Start of the "queued" span
+        self.path = path
+        if outputs:
+            outputs = [list(spec) for spec in outputs]
+            mode, quality, fmt = outputs[0]
+        self.mode = mode
+        self.quality = quality
+        self.fmt = fmt
+        self.outputs = outputs
+        self.priority = priority # Queue order and bandwidth weight (higher first)
+        self._seq = None
+
+        self.status = "queued" # queued -> running -> done / failed / cancelled
+        self.progress = 0.0
+        self.stats = {} # Latest engine details (fragments, buffersize, ...)
+        self.phase = None # Journal phase (extracting, downloading, merging, ...)
+        self.tmpfiles = set()
+        self.error = None
+        self.trace = None # metrics.Trace, set once the job starts
+        self.cancel_event = threading.Event() # Set to interrupt the job while it runs
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Blocks until the job is finished. Returns True if it succeeded."""
+        self._done.wait(timeout)
+        return self.status == "done"
+
+    def as_dict(self):
+        return {"id": self.id, "url": self.url, "path": self.path, "mode": self.mode,
+                "quality": self.quality, "fmt": self.fmt, "priority": self.priority,
+                "status": self.status, "progress": round(self.progress, 4), "phase": self.phase,
+                "outputs": self.outputs, "error": self.error}
+
+    def __repr__(self):
+        return f"<DownloadJob {self.id} {self.status} {self.url}>"
+
+
+class DownloadQueue:
+    """Runs many DownloadJobs concurrently on a pool of worker threads.
+
+    on_status(job) is called from the worker threads, on_progress(job, value)
+    from the manager's progress channel thread (coalesced); consumers touching
+    a GUI must marshal to their own thread. The latest event details (speed,
+    fragment concurrency, rate...) are kept in job.stats.
+
+    Only the last `keep_finished` finished jobs stay in self.jobs (with their
+    traces), so a long run does not grow: their metrics are already folded
+    into manager.metrics. None keeps every job.
+    """
+    def __init__(self, manager=None, workers=3, on_progress=None, on_status=None, journal=None,
+                 keep_finished=KEEP_FINISHED):
+        self.manager = manager or DownloadManager()
+        self.workers = max(1, int(workers))
+        self.on_progress = on_progress
+        self.on_status = on_status
+        # Optional JobJournal: jobs survive a crash and can be resume()d
+        self.journal = journal
+
+        self.jobs = {}
+        self.keep_finished = keep_finished
+        self._finished = collections.deque() # Finished job IDs, oldest first
+        self._queue = queue.PriorityQueue() # (-priority, seq, job): highest priority, then FIFO
+        self._seq = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._events = self.manager.progress.subscribe(self._on_event)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"dl-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def submit(self, url, path, mode, quality, fmt, priority=1, job_id=None, outputs=None):
+        job = DownloadJob(url, path, mode, quality, fmt, priority, job_id=job_id, outputs=outputs)
+        if self.journal:
+            self.journal.add(job)
+        return self._enqueue(job)
+
+    def resume(self):
+        """Re-queues the journal's unfinished jobs left by a dead process, keeping
+        their IDs and folders so engines continue from the partial data."""
+        if not self.journal:
+            return []
+        jobs = []
+        for row in self.journal.claim_unfinished():
+            if row["id"] in self.jobs:
+                continue
+            job = DownloadJob(row["url"], row["path"], row["mode"], row["quality"], row["fmt"],
+                              row["priority"], job_id=row["id"], outputs=row["outputs"])
+            log(f"Resuming job {job.id} (interrupted while {row['phase']}): {job.url}")
+            jobs.append(self._enqueue(job))
+        return jobs
+
+    def _enqueue(self, job):
+        with self._lock:
+            self.jobs[job.id] = job
+        self._notify(job)
+        self._push(job)
+        self.start()
+        return job
+
+    def set_priority(self, job_id, priority):
+        """Changes a job's priority: its place in the queue if it is waiting,
+        its bandwidth share if it is running."""
+        job = self.jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        job.priority = priority
+        if job.status == "queued":
+            self._push(job) # The previous queue entry becomes stale and is skipped
+        else:
+            self.manager.set_priority(job.id, priority)
+        return True
+
+    def _push(self, job):
+        job._seq = next(self._seq)
+        self._queue.put((-job.priority, job._seq, job))
+
+    def cancel(self, job_id):
+        """Cancels a job. A waiting job is dropped at once; a running one is
+        interrupted by its engine and its partial files are removed with its
+        staging folder."""
+        job = self.jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        job.cancel_event.set()
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        else:
+            log(f"Cancelling job {job.id}...")
+        return True
+
+    def pending(self):
+        return [j for j in list(self.jobs.values()) if not j.finished]
+
+    def join(self):
+        """Blocks until every submitted job has finished (post-processing included)."""
+        self._queue.join()
+
+    def stop(self, wait=True):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put((float("inf"), next(self._seq), None))
+        if wait:
+            for t in threads:
+                t.join()
+
+    def _worker(self):
+        while True:
+            _, seq, job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            if job.status != "queued" or seq != job._seq:
+                self._queue.task_done()
+                continue
+            # The worker is free once the download itself is over; the queue entry
+            # is only done when the job's post-processing is finished too
+            self._run(job).add_done_callback(lambda _: self._queue.task_done())
+
+    def _on_event(self, event):
+        job = self.jobs.get(event.job)
+        if not job:
+            return
+        job.progress = event.fraction
+        job.stats.update(event.details)
+        if self.journal:
+            self._journal_event(job, event)
+        job.stats.update(phase=event.phase, engine=event.engine, speed=event.speed, eta=event.eta)
+        if self.on_progress:
+            try:
+                self.on_progress(job, job.progress)
+            except Exception as e:
+                log(f"[queue] progress callback error: {e}")
+
+    def _journal_event(self, job, event):
+        # Only phase changes and new temp files hit the database
+        phase = event.phase
+        if phase == POSTPROCESSING and event.details.get("postprocessor") == "Merger":
+            phase = jr.MERGING
+        if phase in (jr.EXTRACTING, jr.DOWNLOADING, jr.MERGING, jr.POSTPROCESSING) and phase != job.phase:
+            job.phase = phase
+            self.journal.set_phase(job.id, phase)
+        tmpfile = event.details.get("tmpfile")
+        if tmpfile and tmpfile not in job.tmpfiles:
+            job.tmpfiles.add(tmpfile)
+            self.journal.add_file(job.id, os.path.abspath(tmpfile))
+
+    def _run(self, job):
+        job.status = "running"
+        self._notify(job)
+
+        try:
+            result = self.manager.start_download(job.url, job.path, job.mode, job.quality, job.fmt,
+                                                 job=job, wait=False, outputs=job.outputs)
+        except Exception as e:
+            job.error = str(e)
+            result = _resolved(False)
+        result.add_done_callback(lambda f: self._complete(job, f))
+        return result
+
+    def _complete(self, job, result):
+        try:
+            ok = result.result()
+        except Exception as e:
+            job.error = str(e)
+            ok = False
+        if ok:
+            job.progress = 1.0
+            self._finish(job, "done")
+        else:
+            self._finish(job, "cancelled" if job.cancel_event.is_set() else "failed")
+
+    def _finish(self, job, status):
+        self.manager.progress.flush() # Last progress events go out before the status
+        job.status = status
+        if self.journal:
+            self.journal.set_phase(job.id, status, job.error)
+        job._done.set()
+        self._notify(job)
+        self._prune(job)
+
+    def _prune(self, job):
+        if self.keep_finished is None:
+            return
+        with self._lock:
+            self._finished.append(job.id)
+            while len(self._finished) > self.keep_finished:
+                self.jobs.pop(self._finished.popleft(), None)
+
+    def _notify(self, job):
+        if self.on_status:
+            try:
+                self.on_status(job)
+            except Exception as e:
+                log(f"[queue] status callback error: {e}")
 
-try:
-    from pytubefix import YouTube
-    import pytubefix.exceptions
-except ImportError:
-    YouTube = None
 
 class DownloadManager:
-    def __init__(self):
-        pass
+    def __init__(self, cache=None, archive=None, hedge=False, stall_timeout=20, latency_budget=180,
+                 connection_budget=DEFAULT_BUDGET, rate_limit=None, progress_rate=10,
+                 playlist_workers=3, sync=False, record_removals=False, postprocess_workers=None,
+                 staging_dir=None, fsync=FSYNC_NONE):
+        # Extracted info dicts, shared by every job of this manager (cache=False disables it)
+        self.cache = MetadataCache() if cache is None else cache
+        # Completed downloads, checked before any network work (archive=False disables it)
+        self.archive = DownloadArchive() if archive is None else archive
+
+        # Engine selection: stats + circuit breaker, optional speculative fallback
+        self.health = EngineHealth()
+        self.hedge = hedge
+        self.stall_timeout = stall_timeout # s without progress before hedging
+        self.latency_budget = latency_budget # s before hedging even if progressing
+
+        # Fragment connections shared by every concurrent job
+        self.connections = ConnectionBudget(connection_budget)
+        # Global bandwidth cap (bytes/s, None = unlimited), split by job priority
+        self.bandwidth = BandwidthLimiter(rate_limit)
+        # Error classification, backoff and host cool-downs shared by every job
+        self.retry = RetryCoordinator()
+        # Finished job traces folded into counters/histograms (Prometheus text)
+        self.metrics = Metrics()
+        self.metrics.gauge("connections_in_use", lambda: self.connections.used,
+                           "Fragment connections currently granted")
+        self.metrics.gauge("postprocess_pending", lambda: self.postprocess.pending if self.postprocess else 0,
+                           "Post-processing tasks queued or running")
+        # Structured progress events, coalesced to progress_rate batches/s for consumers
+        self.progress = ProgressChannel(progress_rate)
+        # Playlists: entries downloaded in parallel while still being enumerated
+        # (0 = legacy mode, one yt-dlp run over the whole playlist)
+        self.playlist_workers = playlist_workers
+        # Incremental playlist sync: only entries missing from the stored snapshot
+        # are downloaded, and enumeration stops once the known ones are reached
+        self.snapshots = PlaylistSnapshots() if sync else None
+        self.record_removals = record_removals # needs full enumeration
+        # FFmpeg merges/transcodes on their own bounded stage, overlapping the next
+        # download (None = one worker per CPU, 0 = inline yt-dlp post-processing)
+        self.postprocess = PostProcessStage(postprocess_workers) if postprocess_workers != 0 else None
+        # Engines write into a per-job staging folder (same filesystem as the output
+        # unless staging_dir is set); only complete files are renamed into the output
+        self.staging = Staging(staging_dir, fsync)
+        # Idle extraction sessions, reused across jobs (one per concurrent extraction)
+        self._extractors = queue.LifoQueue()
+        # Single flight: identical concurrent requests share one download
+        self._inflight = {} # (canonical url, folder, outputs) -> Future
+        self._inflight_lock = threading.Lock()
+
+    def set_rate_limit(self, rate_limit):
+        """Changes the global bandwidth cap; running jobs adapt on their next chunk."""
+        self.bandwidth.set_limit(rate_limit)
+        log(f"Bandwidth limit: {rate_limit or 'unlimited'}" + (" B/s" if rate_limit else ""))
+
+    def set_priority(self, job_id, priority):
+        """Bandwidth weight of a running job."""
+        return self.bandwidth.set_priority(job_id, priority)
+
+    def start_download(self, url, path, mode, quality, fmt, progress_callback=None, job=None, wait=True,
+                       outputs=None, progress_details=False):
+        """Downloads one URL, trying the engines in turn. Returns True on success.
+
+        With wait=False, returns a Future as soon as the download itself is over;
+        it resolves (True/False) once the post-processing stage is done too.
+
+        outputs: several [mode, quality, fmt] specs made from a single download
+        (see _download_multi); mode/quality/fmt are ignored then.
+
+        The URL is canonicalised first (youtu.be/ID, shorts/ID, watch?v=ID&list=...
+        are the same video); a request identical to one still running waits for
+        that download and shares its result instead of starting another one.
+
+        Progress is published as ProgressEvents on self.progress; progress_callback,
+        if given, is also called with (fraction) at a limited rate, or with
+        (fraction, **details) when progress_details is True.
+        The job's phases are timed on a metrics.Trace (job.trace), folded into
+        self.metrics once it is over.
+        """
+        key = job.id if job else uuid.uuid4().hex[:8]
+        reporter = ProgressReporter(self.progress, key, progress_callback, details=progress_details)
+        url = canonical_url(url)
+        trace = reporter.trace = Trace(key, url)
+        if job:
+            job.trace = trace
+            trace.add_span("queued", job.created, trace.started)
+        specs = tuple(tuple(spec) for spec in outputs or [(mode, quality, fmt)])
+        flight = (url, os.path.abspath(path), specs)
+        with self._inflight_lock:
+            result = self._inflight.get(flight)
+            leader = result is None
+            if leader:
+                result = self._inflight[flight] = Future()
+        if leader:
+            # Forgotten first, so requests arriving after the result start afresh
+            result.add_done_callback(lambda _: self._land(flight))
+            try:
+                started = self._start_download(url, path, mode, quality, fmt, reporter, job, outputs)
+            except Exception as e:
+                log(f"Error: {e}", ERROR)
+                started = False
+            if not isinstance(started, Future):
+                started = _resolved(started)
+            started.add_done_callback(lambda f: result.set_result(not f.exception() and f.result()))
+        else:
+            log(f"Same download already in progress, sharing its result: {url}")
+            trace.count("coalesced")
+            result.add_done_callback(lambda _: trace.add_span("shared", trace.started, time.time()))
+
+        def published(f):
+            ok = not f.exception() and f.result()
+            trace.finish(ok)
+            self.metrics.record(trace)
+            reporter.update(FINISHED if ok else FAILED)
+        result.add_done_callback(published)
+        return result.result() if wait else result
+
+    def _land(self, flight):
+        with self._inflight_lock:
+            self._inflight.pop(flight, None)
 
-    def start_download(self, url, path, mode, quality, fmt, progress_callback):
-        log(f"Process: {mode} | {quality} | {fmt}")
+    def _start_download(self, url, path, mode, quality, fmt, reporter, job, outputs=None):
+        if outputs and len(outputs) > 1:
+            log("Process: " + ", ".join(" | ".join(spec) for spec in outputs))
+        else:
+            log(f"Process: {mode} | {quality} | {fmt}")
         log(f"Target: {url}")
         
         if not os.path.exists(path):
@@ -24,31 +507,456 @@ class DownloadManager:
                 log(f"Error creating directory: {e}")
                 return False
 
-        success = False
-        
-        # 1. Try yt-dlp
+        playlist = self.playlist_workers and is_collection(url)
+        if outputs and len(outputs) > 1 and not playlist:
+            return self._download_multi(url, path, outputs, reporter, job)
+
+        vid = video_id(url)
+        if vid and self.archive:
+            entry = self.archive.lookup(archive_id(vid), mode, quality, fmt)
+            if entry:
+                log(f"Already downloaded: {entry['path']}")
+                _trace_of(reporter).count("archive_hits")
+                return True
+
+        if playlist:
+            result = self._download_playlist(url, path, mode, quality, fmt, reporter, job, outputs)
+            if result is not None:
+                return result
+
+        success, outputs = self._fetch(url, path, mode, quality, fmt, reporter, job)
+        if success and any(isinstance(out, PostTask) for _, out in outputs):
+            done = self.postprocess.submit(self._post_process, outputs, mode, quality, fmt, reporter)
+            done.add_done_callback(lambda _: self.staging.discard(self.staging.location(path, reporter.job)))
+            return done
+
+        if success and self.archive:
+            for item_id, filepath in outputs:
+                self.archive.record(item_id, mode, quality, fmt, filepath)
+
+        return success
+
+    def _fetch(self, url, path, mode, quality, fmt, reporter, job, stage=None):
+        """Runs the engines (hedged or in turn) for one video. Returns (success, outputs).
+
+        The engines write into the job's staging folder; complete files are then
+        moved into `path` (deferred PostTasks get their `dest` there instead).
+        With `stage`, the engines write there and the files are left in it."""
+        engines = self._engine_order()
+        if not engines:
+            log("No download engine available.")
+            return False, []
+
+        cancel = job.cancel_event if job else None
+        staged = stage or self.staging.dir(path, reporter.job)
+        share = self.bandwidth.register(reporter.job, job.priority if job else 1)
+        try:
+            if self.hedge and video_id(url) and len(engines) > 1:
+                success, outputs = self._run_hedged(engines, url, staged, mode, quality, fmt, reporter, share, cancel)
+            else:
+                success, outputs = self._run_sequential(engines, url, staged, mode, quality, fmt, reporter, share,
+                                                        cancel)
+        finally:
+            share.close()
+        if stage:
+            return success, outputs
+        if success:
+            try:
+                outputs = self.staging.commit(staged, path, outputs)
+            except OSError as e:
+                log(f"Cannot move the download into {path}: {e}", ERROR)
+                success, outputs = False, []
+        if not success or not any(isinstance(out, PostTask) for _, out in outputs):
+            self.staging.discard(staged)
+        return success, outputs
+
+    def _download_multi(self, url, path, outputs, reporter, job):
+        """Fetch once, emit many: downloads the source streams needed by every
+        output spec a single time (into the job's staging folder), then
+        produces all outputs from them in parallel on the post-processing stage.
+        Outputs at the source quality are remuxed, lower video qualities and other
+        audio formats transcoded. Returns a Future (or False)."""
+        vid = video_id(url)
+        if vid and self.archive:
+            outputs = [spec for spec in outputs if not self.archive.lookup(archive_id(vid), *spec)]
+            if not outputs:
+                log("Already downloaded in every requested format.")
+                _trace_of(reporter).count("archive_hits")
+                return True
+        if not self.postprocess or not shutil.which('ffmpeg'):
+            log("Multi-output needs FFmpeg and the post-processing stage: one download per output.")
+            return _all_of([self._start_download(url, path, *spec, reporter, job) for spec in outputs])
+
+        # The source covers the most demanding output
+        videos = [spec for spec in outputs if spec[0] != "Audio"]
+        if videos:
+            heights = [_height(q) for _, q, _ in videos]
+            source_height = 0 if 0 in heights else max(heights)
+            source = ("Vidéo", f"{source_height}p" if source_height else "best", videos[0][2])
+        else:
+            source = tuple(outputs[0])
+        staging = self.staging.dir(path, reporter.job)
+        log(f"Multi-output: {len(outputs)} outputs from one download ({' | '.join(source)})")
+        success, fetched = self._fetch(url, path, *source, reporter, job, stage=staging)
+        if not success or not fetched:
+            self.staging.discard(staging)
+            return False
+
+        item_id, out = fetched[0]
+        # Deferred outputs still hold the raw streams (video first, then audio)
+        sources = out.inputs if isinstance(out, PostTask) else [out]
+        stem = os.path.splitext(os.path.basename(out.output if isinstance(out, PostTask) else out))[0]
+
+        results, names = [], set()
+        os.makedirs(os.path.join(staging, "out"), exist_ok=True)
+        for mode, quality, fmt in outputs:
+            dest = os.path.join(path, f"{stem}.{fmt}")
+            if dest in names:
+                dest = os.path.join(path, f"{stem} [{quality}].{fmt}")
+            names.add(dest)
+            # Produced in the staging folder too, then moved into place
+            staged = os.path.join(staging, "out", os.path.basename(dest))
+            height = _height(quality)
+            if mode == "Audio":
+                task = extract_audio(sources[-1], fmt, height, output=staged)
+            elif not height or height >= source_height > 0:
+                task = merge(sources, staged)
+            else:
+                task = scale(sources, staged, height)
+            task.keep_inputs = True
+            task.dest = dest
+            results.append(self.postprocess.submit(self._emit, task, item_id, (mode, quality, fmt), reporter))
+
+        combined = _all_of(results)
+        combined.add_done_callback(lambda _: self.staging.discard(staging))
+        return combined
+
+    def _emit(self, task, item_id, spec, reporter):
+        """Runs on the post-processing stage: one output of a multi-output job."""
+        reporter.update(POSTPROCESSING, postprocessor=task.kind)
+        log(f"[postprocess] {task.kind}: {os.path.basename(task.output)}")
+        try:
+            with _trace_of(reporter).span(_phase(task.kind), kind=task.kind, output=os.path.basename(task.output)):
+                self._run_task(task)
+        except Exception as e:
+            log(f"[postprocess] Error: {e}", ERROR)
+            return False
+        if self.archive:
+            self.archive.record(item_id, *spec, task.dest or task.output)
+        return True
+
+    def _run_task(self, task):
+        """Runs a PostTask where it was staged, then moves its output into place."""
+        out = task.run()
+        return self.staging.finalize(out, task.dest) if task.dest else out
+
+    def _post_process(self, outputs, mode, quality, fmt, reporter):
+        """Runs on the post-processing stage: finishes the deferred outputs, then
+        archives the final files."""
+        final = []
+        try:
+            for item_id, out in outputs:
+                if isinstance(out, PostTask):
+                    reporter.update(POSTPROCESSING, postprocessor=out.kind)
+                    log(f"[postprocess] {out.kind}: {os.path.basename(out.output)}")
+                    with _trace_of(reporter).span(_phase(out.kind), kind=out.kind):
+                        out = self._run_task(out)
+                final.append((item_id, out))
+        except Exception as e:
+            log(f"[postprocess] Error: {e}", ERROR)
+            return False
+
+        if self.archive:
+            for item_id, filepath in final:
+                self.archive.record(item_id, mode, quality, fmt, filepath)
+        return True
+
+    def _flat_entries(self, url):
+        """Enumerates a playlist lazily: entries are yielded as each page is fetched.
+        Returns (playlist info, entries iterator)."""
+        import yt_dlp
+        opts = {
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'quiet': True,
+            'noprogress': True,
+            'logger': _QuietLogger(),
+        }
+        ydl = yt_dlp.YoutubeDL(opts)
+        info = ydl.extract_info(url, download=False, process=False)
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            raise ValueError("Not a playlist")
+        return info, iter(info.get('entries') or [])
+
+    def _download_playlist(self, url, path, mode, quality, fmt, reporter, job, outputs=None):
+        """Streaming playlist mode: each entry is handed to a bounded pool of
+        workers as soon as it is enumerated, so the first file arrives after one
+        page request and entries overlap. Every entry goes through the normal
+        single-video path (archive, cache, engines, fallback).
+        Returns None if the URL could not be enumerated as a playlist."""
+        import yt_dlp
+        from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+        log("Mode detected: Playlist/Album (Streaming, {} parallel)".format(self.playlist_workers))
+        reporter.update(EXTRACTING)
+        try:
+            with _trace_of(reporter).span("enumerate"):
+                info, entries = self._flat_entries(url)
+        except Exception as e:
+            log(f"Playlist enumeration failed ({e}), using a single yt-dlp run.")
+            return None
+
+        # Same layout as the outtmpl '%(playlist_title&{}/|)s...'
+        title = info.get('title') or info.get('id') or "Playlist"
+        folder = os.path.join(path, _folder_name(title))
+        os.makedirs(folder, exist_ok=True)
+        log(f"Playlist: {title} -> {folder}")
+
+        priority = job.priority if job else 1
+        total = info.get('playlist_count')
+        counts = {"found": 0, "done": 0, "failed": 0, "skipped": 0}
+        sync = None
+        if self.snapshots:
+            profile = "+".join("|".join(spec) for spec in outputs or [(mode, quality, fmt)])
+            sync = self.snapshots.session(info.get('id') or url, profile, url, title,
+                                          total, record_removals=self.record_removals)
+        lock = threading.Lock()
+        # Bounded pipeline: enumeration waits when this many entries are pending
+        slots = threading.BoundedSemaphore(self.playlist_workers * 2)
+
+        pending = []
+
+        def run_entry(index, entry_url, entry_id):
+            settled = Future() # Resolved once entry_done has run
+            with lock:
+                pending.append(settled)
+            try:
+                child = DownloadJob(entry_url, folder, mode, quality, fmt, priority, job_id=f"{reporter.job}.{index}",
+                                    outputs=outputs)
+                if job:
+                    child.cancel_event = job.cancel_event
+                result = self.start_download(entry_url, folder, mode, quality, fmt, job=child, wait=False,
+                                             outputs=outputs)
+            except Exception as e:
+                log(f"[playlist] Entry {index} error: {e}")
+                result = _resolved(False)
+            # The slot is held until the entry is post-processed too
+            result.add_done_callback(lambda f: entry_done(f, entry_id, settled))
+
+        def entry_done(result, entry_id, settled):
+            slots.release()
+            ok = not result.exception() and result.result()
+            try:
+                if ok and sync:
+                    sync.mark_downloaded(entry_id)
+                with lock:
+                    counts["done" if ok else "failed"] += 1
+                    finished = counts["done"] + counts["failed"]
+                    known = total or counts["found"]
+                reporter.update(DOWNLOADING, finished, known, entries_done=counts["done"],
+                                entries_failed=counts["failed"], entries_found=counts["found"])
+            finally:
+                settled.set_result(ok)
+
+        complete = False
+        with ThreadPoolExecutor(max_workers=self.playlist_workers, thread_name_prefix="playlist") as pool:
+            try:
+                for index, entry in enumerate(entries, 1):
+                    if job and job.cancel_event.is_set():
+                        break
+                    entry_url = entry.get('url') or entry.get('webpage_url')
+                    if entry.get('ie_key') == 'Youtube' and entry.get('id'):
+                        entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+                    if not entry_url:
+                        continue
+                    entry_id = entry.get('id') or entry_url
+                    if sync and sync.seen(entry_id, index):
+                        counts["skipped"] += 1
+                        if sync.should_stop():
+                            # Leaving the lazy iterator here saves the remaining page requests
+                            break
+                        continue
+                    slots.acquire()
+                    with lock:
+                        counts["found"] += 1
+                    pool.submit(run_entry, index, entry_url, entry_id)
+                else:
+                    complete = True
+            except Exception as e:
+                log(f"[playlist] Enumeration stopped: {e}")
+                with lock:
+                    counts["failed"] += 1
+        wait_futures(pending)
+
+        if sync:
+            sync.finish(complete)
+            log(f"Playlist synced: {counts['done']} new ok, {counts['failed']} failed, "
+                f"{counts['skipped']} already downloaded.")
+            return counts["failed"] == 0
+        log(f"Playlist finished: {counts['done']} ok, {counts['failed']} failed.")
+        return counts["failed"] == 0 and counts["done"] > 0
+
+    def _engine_order(self):
+        names = ["yt-dlp"]
+        if _load_pytube():
+            # Both fallbacks get their stream URLs from pytubefix
+            names += ["ranged", "pytubefix"]
+        else:
+            log("[pytubefix] Not available.")
+        return self.health.order(names)
+
+    def _attempt(self, engine, url, path, mode, quality, fmt, reporter, share, cancel=None):
+        """Runs one engine, feeding EngineHealth. Returns its outputs, raises on failure.
+        `reporter` must be the engine's own fork of the job reporter.
+
+        The attempt waits for the host's cool-down first. yt-dlp and the ranged
+        engine retry on their own; pytubefix is retried here (ENGINE_RETRIES)."""
+        log(f"Engine: {engine}...")
+        func = {"yt-dlp": self._download_ytdlp, "ranged": self._download_ranged}.get(engine, self._download_pytube)
+        trace, host = _trace_of(reporter), host_key(url)
+        started = time.monotonic()
         try:
-            log("Engine: yt-dlp (Primary)...")
-            self._download_ytdlp(url, path, mode, quality, fmt, progress_callback)
-            success = True
+            with trace.span("attempt", engine=engine):
+                if self.retry.remaining(host) > 0:
+                    with trace.span("cooldown", engine=engine):
+                        self.retry.wait(host, cancel)
+                outputs = self.retry.run(lambda: func(url, path, mode, quality, fmt, reporter, share, cancel=cancel),
+                                         host, ENGINE_RETRIES if engine == "pytubefix" else 1, cancel, engine,
+                                         on_retry=lambda kind, delay: trace.count("retries"))
         except Exception as e:
-            log(f"[yt-dlp] Error: {e}")
-            log("Engine: pytubefix (Fallback)...")
+            kind = classify(e)
+            if cancel is not None and cancel.is_set():
+                log(f"[{engine}] Cancelled.")
+            elif kind in FINAL:
+                # The video's fault, not the engine's: health is left alone
+                log(f"[{engine}] Error ({kind}): {e}")
+            else:
+                log(f"[{engine}] Error: {e}")
+                self.health.record(engine, False)
+            raise
+        self.health.record(engine, True, time.monotonic() - started)
+        trace.engine = engine
+        return outputs
+
+    def _run_sequential(self, engines, url, path, mode, quality, fmt, reporter, share, cancel=None):
+        for i, engine in enumerate(engines):
+            if cancel is not None and cancel.is_set():
+                break
+            if i:
+                _trace_of(reporter).count("fallbacks")
+            try:
+                return True, self._attempt(engine, url, path, mode, quality, fmt, reporter.fork(engine), share, cancel)
+            except Exception as e:
+                if classify(e) in FINAL:
+                    log("Permanent error: the other engines would fail too, giving up.")
+                    break
+                continue
+        return False, []
+
+    def _run_hedged(self, engines, url, path, mode, quality, fmt, reporter, share, cancel=None):
+        """Starts the next engine speculatively when the current one stalls or runs
+        over the latency budget. The first engine to finish wins; the others are
+        cancelled and their partial files removed.
+
+        Each attempt writes into its own hidden folder inside `path`; the winner's
+        files are moved into place afterwards.
+        """
+        finished = queue.Queue()
+        attempts = []
+
+        def launch(engine):
+            # Named after the job so an interrupted attempt is resumed (or collected) later
+            attempt = _HedgeAttempt(engine, os.path.join(path, f".hedge-{reporter.job}-{engine}"))
+            attempts.append(attempt)
 
-        # 2. Try pytubefix
-        if not success:
-            if YouTube:
+            progress = reporter.fork(engine)
+            progress.listeners.insert(0, attempt.touch)
+
+            def run():
                 try:
-                    self._download_pytube(url, path, mode, quality, fmt, progress_callback)
-                    success = True
+                    os.makedirs(attempt.dir, exist_ok=True)
+                    attempt.outputs = self._attempt(engine, url, attempt.dir, mode, quality, fmt,
+                                                    progress, share, cancel=attempt.cancel)
+                    attempt.ok = True
                 except Exception as e:
-                    log(f"[pytubefix] Error: {e}")
+                    attempt.ok = False
+                    attempt.error = e
+                finally:
+                    if not attempt.ok or attempt.cancel.is_set():
+                        shutil.rmtree(attempt.dir, ignore_errors=True)
+                    finished.put(attempt)
+
+            threading.Thread(target=run, name=f"hedge-{engine}", daemon=True).start()
+            return attempt
+
+        remaining = list(engines)
+        current = launch(remaining.pop(0))
+        running = 1
+        winner = None
+        while running:
+            if cancel is not None and cancel.is_set():
+                break
+            try:
+                attempt = finished.get(timeout=0.5)
+            except queue.Empty:
+                if remaining and current.should_hedge(self.stall_timeout, self.latency_budget):
+                    log(f"[hedge] {current.engine} is slow, starting {remaining[0]} in parallel...")
+                    _trace_of(reporter).count("hedges")
+                    current = launch(remaining.pop(0))
+                    running += 1
+                continue
+
+            running -= 1
+            if attempt.ok:
+                winner = attempt
+                break
+            if classify(attempt.error) in FINAL:
+                log("Permanent error: the other engines would fail too, giving up.")
+                break
+            if remaining and running == 0:
+                _trace_of(reporter).count("fallbacks")
+                current = launch(remaining.pop(0))
+                running += 1
+
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel.set()
+        if not winner:
+            return False, []
+
+        log(f"[hedge] {winner.engine} won.")
+        def moved(filepath, move=True):
+            dest = os.path.join(path, os.path.relpath(filepath, winner.dir))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if move:
+                os.replace(filepath, dest)
+            return dest
+
+        outputs = []
+        for item_id, out in winner.outputs:
+            if isinstance(out, PostTask):
+                # Deferred post-processing: move its inputs, it runs in place later
+                out.inputs = [moved(p) for p in out.inputs]
+                out.output = moved(out.output, move=False)
             else:
-                log("[pytubefix] Not available.")
+                out = moved(out)
+            outputs.append((item_id, out))
+        shutil.rmtree(winner.dir, ignore_errors=True)
+        return True, outputs
 
-        return success
+    def _recorder(self, outputs):
+        """yt-dlp post-processor appending (archive id, final file path) to outputs."""
+        from yt_dlp.postprocessor import PostProcessor
 
-    def _download_ytdlp(self, url, path, mode, quality, fmt, progress_callback):
+        class RecordOutputPP(PostProcessor):
+            def run(self, info):
+                if info.get('filepath') and info.get('id'):
+                    outputs.append((archive_id(info['id'], info.get('extractor_key') or 'youtube'), info['filepath']))
+                return [], info
+
+        return RecordOutputPP()
+
+    def _download_ytdlp(self, url, path, mode, quality, fmt, reporter, share, cancel=None):
         has_ffmpeg = shutil.which('ffmpeg') is not None
         
         if not has_ffmpeg and (mode == "Audio" and fmt != "m4a"):
@@ -58,38 +966,50 @@ class DownloadManager:
             def __init__(self):
                 pass
             
-            def debug(self, msg): self._process_msg(msg)
+            def debug(self, msg):
+                # yt-dlp also routes to_screen output here; true debug lines are tagged
+                if msg.startswith('[debug] '):
+                    debug(msg)
+                else:
+                    self._process_msg(msg)
             def info(self, msg): self._process_msg(msg)
-            def warning(self, msg): log(f"[WARNING] {msg}")
-            def error(self, msg): log(f"[ERROR] {msg}")
+            def error(self, msg): log(msg, ERROR)
+
+            def warning(self, msg):
+                # Throttling / retried fragments -> back off fragment concurrency
+                if "429" in msg or "Retrying" in msg or "403" in msg:
+                    ctrl.congestion()
+                # ...and pause every job on this host
+                if classify(msg) == THROTTLE:
+                    retry.throttled(host)
+                if "Retrying" in msg:
+                    trace.count("retries")
+                log(msg, WARNING)
             
             def _process_msg(self, msg):
+                # Progress comes from the progress hooks, not from these lines
                 clean_msg = msg.strip()
                 if not clean_msg: return
-                if clean_msg.startswith('[download]'):
-                    try:
-                        import re
-                        match = re.search(r'(\d+(?:\.\d+)?)%', clean_msg)
-                        if match:
-                            progress_callback(float(match.group(1)) / 100)
-                    except: pass
-                    log(clean_msg)
-                else:
-                    log(clean_msg)
+                log(clean_msg)
 
         # 1. Base Options & Performance Optimization
         
         # Intelligent Playlist Detection
-        # If it's a specific video (has v= or shorts), we generally want just that video
-        # even if it's linked from a playlist context.
-        # We only download full playlist if it's a playlist view (list= X, no video param).
-        is_playlist_view = "list=" in url and "watch?" not in url and "v=" not in url
+        # A specific video (v=, youtu.be, shorts) is just that video even when linked
+        # from a playlist; only playlist and channel URLs download every entry.
+        is_playlist_view = is_collection(url)
         
         if is_playlist_view:
             log("Mode detected: Playlist/Album (Full Download)")
         else:
             log("Mode detected: Single Video (Ignoring List params)")
 
+        # FFmpeg work handed to the post-processing stage instead of running inline
+        # (a legacy whole-playlist run keeps yt-dlp's own post-processors)
+        defer = bool(self.postprocess) and has_ffmpeg and not is_playlist_view
+
+        retry, host = self.retry, host_key(url)
+        trace = _trace_of(reporter)
         ydl_opts_base = {
             'noplaylist': not is_playlist_view,
             'logger': YtDlpLogger(),
@@ -100,15 +1020,25 @@ class DownloadManager:
             'outtmpl': '%(playlist_title&{}/|)s%(title)s.%(ext)s',
             
             # SPEED OPTIMIZATIONS
-            'concurrent_fragment_downloads': 15, # Download 15 segments in parallel
+            # (concurrent_fragment_downloads / buffersize are set adaptively below)
             'retries': 10,
             'fragment_retries': 10,
-            'buffersize': 1024 * 1024,
+            # Jittered backoff, stretched to the host-wide cool-down while throttled
+            'retry_sleep_functions': {kind: retry.sleep_function(host) for kind in ('http', 'fragment', 'extractor')},
             
+            # Progress is reported through progress_hooks: don't format progress lines
+            'noprogress': True,
+            # Debug chatter is only generated when it would actually be logged
+            'verbose': logger.is_enabled(DEBUG),
+
             # COMPATIBILITY
             'windowsfilenames': True,
         }
 
+        if self.archive:
+            # Playlist entries already archived are skipped before their extraction
+            ydl_opts_base['download_archive'] = self.archive.view(mode, quality, fmt)
+
         log("Initializing and Optimizing Download...")
         # (Metadata extraction step removed - integrated into download for speed)
 
@@ -123,7 +1053,9 @@ class DownloadManager:
         if mode == "Audio":
             ydl_opts_base['format'] = 'bestaudio/best'
             post_args = []
-            if has_ffmpeg:
+            if defer:
+                pass # Transcoded by the post-processing stage
+            elif has_ffmpeg:
                 post_args.append({
                     'key': 'FFmpegExtractAudio',
                     'preferredcodec': fmt,
@@ -149,17 +1081,257 @@ class DownloadManager:
                 else: ydl_opts_base['format'] = f'best[ext={fmt}]/best'
 
         # 5. Run Download
-        with yt_dlp.YoutubeDL(ydl_opts_base) as ydl:
-            ydl.download([url])
+        import yt_dlp # Imported lazily: keeps headless cold start fast
+
+        # Fragment concurrency: AIMD within the connection budget shared by all jobs.
+        # yt-dlp reads these params when each fragmented format starts downloading,
+        # so adjustments apply to the next stream / playlist entry, and the next
+        # job starts from the value this one ends with (ConnectionBudget.last_value).
+        ctrl = self.connections.controller()
+        ydl_opts_base['concurrent_fragment_downloads'] = ctrl.value
+        ydl_opts_base['buffersize'] = ctrl.buffersize
+        ydl_ref = []
+
+        received = {}
+
+        def fragment_hook(d):
+            if d.get('status') != 'downloading':
+                return
+            done = d.get('downloaded_bytes') or 0
+            if ctrl.observe(d.get('filename'), done):
+                ydl_ref[0].params['concurrent_fragment_downloads'] = ctrl.value
+                ydl_ref[0].params['buffersize'] = ctrl.buffersize
+                log(f"[adaptive] fragments={ctrl.value} buffer={ctrl.buffersize // 1024}KiB "
+                    f"rate={ctrl.rate / 1e6:.2f}MB/s (budget {self.connections.used}/{self.connections.total})")
+            reporter.update(DOWNLOADING, done, d.get('total_bytes') or d.get('total_bytes_estimate'),
+                            d.get('speed'), d.get('eta'), d.get('fragment_index'), d.get('fragment_count'),
+                            fragments=ctrl.value, buffersize=ctrl.buffersize, tmpfile=d.get('tmpfilename'),
+                            rate=round(share.rate), rate_limit=share.allotted)
+
+            # Bandwidth shaping: blocking here delays yt-dlp's next read
+            delta = done - received.get(d.get('filename'), 0)
+            trace.add_bytes("yt-dlp", max(0, delta))
+            share.throttle(delta, cancel)
+            received[d.get('filename')] = done
+
+        postprocessing = {}
+
+        def postprocessor_hook(d):
+            name = d.get('postprocessor')
+            if d.get('status') == 'started':
+                postprocessing[name] = time.time()
+                reporter.update(POSTPROCESSING, postprocessor=name)
+            elif d.get('status') == 'finished' and name in postprocessing:
+                trace.add_span(_phase(name), postprocessing.pop(name), time.time(), engine="yt-dlp", kind=name)
+
+        hooks = [fragment_hook]
+        if cancel is not None:
+            def cancel_hook(d):
+                if cancel.is_set():
+                    raise yt_dlp.utils.DownloadCancelled("yt-dlp download cancelled")
+            hooks.insert(0, cancel_hook)
+        ydl_opts_base['progress_hooks'] = hooks
+        ydl_opts_base['postprocessor_hooks'] = [postprocessor_hook]
+
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts_base) as ydl:
+                ydl_ref.append(ydl)
+                reporter.update(EXTRACTING)
+                outputs = self._run_ytdlp(ydl, url, is_playlist_view, split=defer and mode != "Audio", trace=trace)
+        finally:
+            ctrl.close()
+
+        if defer and mode == "Audio":
+            outputs = [(item_id, extract_audio(filepath, fmt, q_val) or filepath) for item_id, filepath in outputs]
+        return outputs
+
+    def _run_ytdlp(self, ydl, url, is_playlist_view, split=False, trace=None):
+        """Downloads url with ydl (through the metadata cache for single videos).
+        split=True downloads the requested formats one by one and returns a merge
+        PostTask instead of letting yt-dlp merge inline."""
+        import yt_dlp
+        trace = trace or Trace(None)
+        outputs = []
+        ydl.add_post_processor(self._recorder(outputs), when='after_move')
+
+        def process(info):
+            with trace.span("download", engine="yt-dlp"):
+                if split:
+                    self._download_streams(ydl, info, outputs)
+                else:
+                    ydl.process_ie_result(info, download=True)
+
+        def extract():
+            with trace.span("extract", engine="yt-dlp"):
+                return self._extract(url)
+
+        vid = None if is_playlist_view else video_id(url)
+        if not vid or not self.cache:
+            if split:
+                process(extract())
+            else:
+                # Extraction and download interleave in one call: a single span
+                with trace.span("download", engine="yt-dlp"):
+                    ydl.download([url])
+            return outputs
+
+        info = self.cache.get(vid)
+        if info is not None:
+            log(f"Metadata cache hit: {vid} (extraction skipped)")
+            trace.count("cache_hits")
+            try:
+                process(info)
+                return outputs
+            except yt_dlp.utils.DownloadError as e:
+                # Stream URLs may have been revoked early: re-extract once
+                log(f"Cached metadata failed ({e}), re-extracting...")
+                self.cache.invalidate(vid)
+
+        trace.count("cache_misses")
+        info = extract()
+        self.cache.put(vid, info)
+        process(info)
+        return outputs
+
+    def _extract(self, url):
+        """Extracts url (unprocessed) on a warm YoutubeDL from the pool: its HTTP
+        session, cookies and the extractors' player/signature caches are kept
+        from one job to the next instead of being rebuilt per download."""
+        try:
+            ydl = self._extractors.get_nowait()
+        except queue.Empty:
+            ydl = self._new_extractor()
+        try:
+            return ydl.sanitize_info(ydl.extract_info(url, download=False, process=False))
+        finally:
+            self._extractors.put(ydl)
+
+    def _new_extractor(self):
+        import yt_dlp
+        return yt_dlp.YoutubeDL({'quiet': True, 'noprogress': True, 'logger': _QuietLogger()})
+
+    def warm_up(self):
+        """Imports yt-dlp and pools a first extraction session ahead of the first job.
+        Downloads still get a YoutubeDL of their own per job (their options differ)."""
+        if self._extractors.empty():
+            self._extractors.put(self._new_extractor())
+
+    def _download_streams(self, ydl, info, outputs):
+        """Downloads each format of a video+audio selection on its own (yt-dlp's
+        '.f<id>' part names), then replaces them in outputs by one merge PostTask."""
+        import copy
+        resolved = ydl.process_ie_result(copy.deepcopy(info), download=False)
+        formats = resolved.get('requested_formats')
+        if not formats or len(formats) < 2:
+            ydl.process_ie_result(info, download=True) # Single file, nothing to merge
+            return
+
+        selector, template = ydl.format_selector, ydl.params['outtmpl']['default']
+        stem, _ = os.path.splitext(template)
+        ydl.params['outtmpl']['default'] = f"{stem}.f%(format_id)s.%(ext)s"
+        start = len(outputs)
+        try:
+            for f in formats:
+                ydl.format_selector = ydl.build_format_selector(f['format_id'])
+                ydl.process_ie_result(copy.deepcopy(info), download=True)
+        finally:
+            ydl.format_selector = selector
+            ydl.params['outtmpl']['default'] = template
+
+        streams = outputs[start:]
+        del outputs[start:]
+        if len(streams) != len(formats):
+            raise Exception(f"Only {len(streams)} of {len(formats)} streams downloaded.")
+        output = ydl.prepare_filename(dict(resolved, ext=ydl.params.get('merge_output_format') or resolved['ext']))
+        outputs.append((streams[0][0], merge([filepath for _, filepath in streams], output)))
+
+    def _download_ranged(self, url, path, mode, quality, fmt, reporter, share, cancel=None):
+        """Fallback engine: stream URLs from pytubefix, fetched with parallel Range
+        requests. Video mode takes the adaptive streams (1080p+) and merges them
+        with FFmpeg; without FFmpeg it is limited to a progressive stream."""
+        import re
+        reporter.update(EXTRACTING)
+        trace = _trace_of(reporter)
+        q_val = int(re.sub(r"[^0-9]", "", quality) or 0)
+        has_ffmpeg = shutil.which('ffmpeg') is not None
+
+        with trace.span("extract", engine="ranged"):
+            yt = YouTube(url)
+            streams = self._ranged_streams(yt, mode, fmt, q_val, has_ffmpeg)
+        if not all(streams):
+            raise Exception("No suitable stream found.")
+
+        base = os.path.join(path, os.path.splitext(streams[0].default_filename)[0])
+        targets = []
+        for s in streams:
+            ext = 'm4a' if s.type == 'audio' and s.subtype == 'mp4' else s.subtype
+            dest = f"{base}.f{s.itag}.{ext}" if len(streams) > 1 else f"{base}.{ext}"
+            targets.append((s.url, dest, s.filesize))
+            log(f"ranged: {s.itag} {s.resolution or s.abr} {s.mime_type}")
+
+        ctrl = self.connections.controller()
+        downloader = None
+
+        def received(n, dest):
+            trace.add_bytes("ranged", n)
+            reporter.update(DOWNLOADING, downloader.downloaded, downloader.total, ctrl.rate or None,
+                            fragments=ctrl.value, tmpfile=dest + ".part",
+                            rate=round(share.rate), rate_limit=share.allotted)
+            share.throttle(n, cancel)
+
+        downloader = RangedDownloader(controller=ctrl, on_bytes=received, cancel=cancel, retry=self.retry)
+        try:
+            with trace.span("download", engine="ranged"):
+                files = downloader.download(targets)
+        finally:
+            ctrl.close()
+            if downloader.retried:
+                trace.count("retries", downloader.retried)
+
+        out = files[0]
+        if len(files) > 1:
+            out = merge(files, f"{base}.{fmt}")
+        elif mode == "Audio" and has_ffmpeg:
+            out = extract_audio(out, fmt, q_val) or out
+        if isinstance(out, PostTask) and not self.postprocess:
+            reporter.update(POSTPROCESSING, postprocessor=out.kind)
+            with trace.span(_phase(out.kind), engine="ranged", kind=out.kind):
+                out = out.run()
+        return [(archive_id(yt.video_id), out)]
+
+    def _ranged_streams(self, yt, mode, fmt, q_val, has_ffmpeg):
+        """Streams fetched by the ranged engine (a None item if one is missing)."""
+        if mode == "Audio":
+            streams = [yt.streams.filter(only_audio=True).order_by('abr').desc().first()]
+        elif has_ffmpeg:
+            ext = 'webm' if fmt == 'webm' else 'mp4'
+            videos = yt.streams.filter(adaptive=True, only_video=True, file_extension=ext).order_by('resolution').desc()
+            video = next((s for s in videos if not q_val or int(s.resolution[:-1]) <= q_val), None) or videos.last()
+            audio = yt.streams.filter(only_audio=True, file_extension=ext).order_by('abr').desc().first()
+            streams = [video, audio or yt.streams.get_audio_only()]
+        else:
+            log("FFmpeg missing: ranged engine limited to progressive streams.")
+            progressive = yt.streams.filter(progressive=True).order_by('resolution').desc()
+            streams = [next((s for s in progressive if not q_val or int(s.resolution[:-1]) <= q_val), None)
+                       or progressive.last()]
+        return streams
 
-    def _download_pytube(self, url, path, mode, quality, fmt, progress_callback):
+    def _download_pytube(self, url, path, mode, quality, fmt, reporter, share, cancel=None):
         # Pytube is less flexible, we do best effort mapping
         def pytube_progress(stream, chunk, bytes_remaining):
+            if cancel is not None and cancel.is_set():
+                raise EngineCancelled("pytubefix download cancelled")
+            # pytubefix reads ~9MB ranges: shaping is exact on average, bursty per chunk
+            share.throttle(len(chunk), cancel)
+            trace.add_bytes("pytubefix", len(chunk))
             total_size = stream.filesize
             bytes_downloaded = total_size - bytes_remaining
-            val = bytes_downloaded / total_size
-            progress_callback(val)
+            reporter.update(DOWNLOADING, bytes_downloaded, total_size,
+                            rate=round(share.rate), rate_limit=share.allotted)
 
+        reporter.update(EXTRACTING)
+        trace = _trace_of(reporter)
+        extracting = time.time()
         yt = YouTube(url, on_progress_callback=pytube_progress)
         
         # Parse Quality INT
@@ -204,9 +1376,15 @@ class DownloadManager:
             else:
                  stream = streams.get_highest_resolution()
 
+        # pytubefix extracts lazily, while the streams above are listed
+        trace.add_span("extract", extracting, time.time(), engine="pytubefix")
         if stream:
-            out_file = stream.download(output_path=path)
-            # Basic rename for audio if it came as mp4 but user wanted mp3 (fake rename, not conversion)
-            # But dangerous without conversion. We leave it as is for safety in fallback mode.
+            with trace.span("download", engine="pytubefix"):
+                out_file = stream.download(output_path=path)
+            # Real conversion only when FFmpeg can run it on the post-processing stage,
+            # otherwise we leave the file as is for safety in fallback mode.
+            if mode == "Audio" and self.postprocess and shutil.which('ffmpeg'):
+                out_file = extract_audio(out_file, fmt, q_val) or out_file
+            return [(archive_id(yt.video_id), out_file)]
         else:
             raise Exception("No suitable stream found.")
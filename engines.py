@@ -0,0 +1,100 @@
+"""Per-engine success/latency statistics and circuit breaker."""
+import threading
+import time
+
+from utils import log
+
+BREAKER_THRESHOLD = 5 # Consecutive failures that open the breaker
+BREAKER_COOLDOWN = 300 # Seconds before a tripped engine gets a trial run again
+LATENCY_ALPHA = 0.3 # EWMA weight of the latest sample
+MIN_SAMPLES = 5 # Attempts before an engine's success rate can reorder it
+
+
+class EngineStats:
+    def __init__(self, name):
+        self.name = name
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None # EWMA of successful attempt duration (s)
+        self.open_until = 0.0 # Breaker open while time.monotonic() < open_until
+
+    @property
+    def attempts(self):
+        return self.successes + self.failures
+
+    @property
+    def success_rate(self):
+        # Laplace smoothing: an unused engine scores 0.5, not 0 or 1
+        return (self.successes + 1) / (self.attempts + 2)
+
+    def is_open(self, now=None):
+        return (now or time.monotonic()) < self.open_until
+
+    def as_dict(self):
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "success_rate": round(self.success_rate, 3),
+            "latency": round(self.latency, 2) if self.latency is not None else None,
+            "breaker_open": self.is_open(),
+        }
+
+
+class EngineHealth:
+    """Learns which download engine to try first.
+
+    Engines are ordered by success rate, once they have MIN_SAMPLES attempts:
+    until then an engine scores a neutral 0.5 and keeps its configured place,
+    so one early failure does not demote the default engine behind engines
+    never tried. An engine failing BREAKER_THRESHOLD
+    times in a row is skipped for BREAKER_COOLDOWN seconds, then gets one trial
+    (half-open) that either closes the breaker or re-opens it.
+    """
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, min_samples=MIN_SAMPLES):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._stats:
+                self._stats[name] = EngineStats(name)
+            return self._stats[name]
+
+    def record(self, name, ok, latency=None):
+        st = self.get(name)
+        with self._lock:
+            if ok:
+                st.successes += 1
+                st.consecutive_failures = 0
+                st.open_until = 0.0
+                if latency is not None:
+                    st.latency = latency if st.latency is None else \
+                        LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * st.latency
+            else:
+                st.failures += 1
+                st.consecutive_failures += 1
+                if st.consecutive_failures >= self.threshold:
+                    if not st.is_open():
+                        log(f"[engines] Circuit breaker OPEN for {name} ({st.consecutive_failures} failures in a row)")
+                    st.open_until = time.monotonic() + self.cooldown
+
+    def order(self, names):
+        """Engines to try, best first. Engines with an open breaker are left out
+        unless every engine is tripped (then the default order is kept)."""
+        now = time.monotonic()
+        stats = [self.get(n) for n in names]
+        usable = [s for s in stats if not s.is_open(now)]
+        if not usable:
+            return list(names)
+        # sorted() is stable: ties keep the caller's (default) order
+        usable.sort(key=lambda s: -round(s.success_rate if s.attempts >= self.min_samples else 0.5, 1))
+        return [s.name for s in usable]
+
+    def snapshot(self):
+        with self._lock:
+            return {name: st.as_dict() for name, st in self._stats.items()}
@@ -1,11 +1,12 @@
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog
-import threading
 import os
 import sys
 from utils import logger, log
-from downloader import DownloadManager
+from downloader import DownloadManager, DownloadQueue
+from journal import JobJournal
+from client import find_daemon, RemoteQueue
 from version import VERSION
 
 APP_NAME = "UltraYouTube Downloader"
@@ -27,7 +28,18 @@ class YouTubeDownloaderApp(ctk.CTk):
         self.format_var = tk.StringVar(value="mp4") # NEW
         self.quality_var = tk.StringVar(value="1080p")
         
-        self.manager = DownloadManager()
+        self.finished = {"done": set(), "failed": set()} # Job ids, for the progress label
+        daemon = find_daemon()
+        if daemon:
+            # A daemon is running (cli.py --serve): jobs go to its shared queue
+            self.queue = RemoteQueue(daemon, on_status=self.on_job_status)
+            progress = self.queue.progress
+        else:
+            self.manager = DownloadManager()
+            self.queue = DownloadQueue(self.manager, workers=3, on_status=self.on_job_status, journal=JobJournal())
+            progress = self.manager.progress
+        # Progress events are drained on the Tk thread (see poll_progress)
+        self.progress_events = progress.subscribe()
 
         self.setup_ui()
         
@@ -36,12 +48,24 @@ class YouTubeDownloaderApp(ctk.CTk):
         log("GUI Initialized.")
         
         self.check_env()
+        self.poll_progress()
+        self.resume_jobs()
 
     def check_env(self):
          if not getattr(sys, 'frozen', False):
              if sys.prefix == sys.base_prefix:
                  log("WARNING: Running outside venv.")
 
+    def resume_jobs(self):
+        # Jobs interrupted by a crash / closed window continue from their partial files
+        if not self.queue.journal:
+            log(f"Connected to the download daemon ({self.queue.client.address}).")
+            return
+        self.queue.journal.collect_garbage()
+        resumed = self.queue.resume()
+        if resumed:
+            log(f"{len(resumed)} interrupted job(s) resumed.")
+
     def setup_ui(self):
         # Sidebar
         self.sidebar = ctk.CTkFrame(self, width=200, corner_radius=0)
@@ -128,30 +152,48 @@ class YouTubeDownloaderApp(ctk.CTk):
         if not url:
             log("Error: Empty URL")
             return
-        
-        self.btn.configure(state="disabled")
-        self.progress.set(0)
-        self.pct_label.configure(text="0%")
-        
-        threading.Thread(target=self.run_process, args=(url,), daemon=True).start()
 
-    def run_process(self, url):
         path = self.download_path.get()
         mode = self.mode_option.get() # Uses SegmentedButton directly
         qual = self.quality_var.get()
         fmt = self.format_var.get()
-        
-        def update_prog(val):
+
+        if not self.queue.pending():
+            # The queue drained: a new batch, counted from zero (the label kept the last totals until now)
+            self.finished = {"done": set(), "failed": set()}
+        # Jobs are queued: the button stays enabled so several links can run in parallel.
+        job = self.queue.submit(url, path, mode, qual, fmt)
+        self.url_var.set("")
+        log(f"Job {job.id} queued.")
+
+    def poll_progress(self):
+        # Coalesced events: at most one refresh per poll, whatever the fragment count
+        if self.progress_events.drain():
+            self.refresh_progress()
+        self.after(100, self.poll_progress)
+
+    # Queue callbacks run on worker threads -> marshal to the Tk main loop.
+    def on_job_status(self, job):
+        if job.status in self.finished:
+            self.finished[job.status].add(job.id)
+        if job.status == "done":
+            log(f"Job {job.id} finished successfully!")
+        elif job.status == "failed":
+            log(f"Job {job.id} download FAILED.")
+        elif job.status == "cancelled":
+            log(f"Job {job.id} cancelled.")
+        self.after(0, self.refresh_progress)
+
+    def refresh_progress(self):
+        active = self.queue.pending()
+        done, failed = len(self.finished["done"]), len(self.finished["failed"])
+        counts = f"{done} ok" + (f", {failed} failed" if failed else "")
+        if not active:
+            # Successful share of the finished jobs: failures never show as 100%
+            val = done / (done + failed) if done + failed else 0
             self.progress.set(val)
-            self.pct_label.configure(text=f"{int(val*100)}%")
-        
-        res = self.manager.start_download(url, path, mode, qual, fmt, update_prog)
-        
-        if res:
-            log("Finished successfully!")
-            self.progress.set(1)
-            self.pct_label.configure(text="100%")
-        else:
-            log("Download FAILED.")
-            
-        self.btn.configure(state="normal")
+            self.pct_label.configure(text=f"{int(val*100)}% | {counts}" if done + failed else "0%")
+            return
+        val = sum(j.progress for j in active) / len(active)
+        self.progress.set(val)
+        self.pct_label.configure(text=f"{len(active)} job(s) | {int(val*100)}% | {counts}")
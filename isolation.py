@@ -0,0 +1,378 @@
+"""Worker processes for long runs: every download runs in a child process.
+
+A child process holds one DownloadManager and runs one job at a time. It is
+replaced after `max_jobs` jobs, or as soon as its resident memory passes
+`max_rss` MB, so whatever yt-dlp objects, info dicts and engine state pile
+up over thousands of items goes back to the OS with the process. A job
+running longer than `timeout` seconds gets its process tree killed (FFmpeg
+included) and fails; the next job starts on a fresh process. Memory is read
+with psutil when installed, otherwise from /proc or GetProcessMemoryInfo.
+
+IsolatedManager stands in for DownloadManager behind a DownloadQueue: the
+children's progress events and log lines are relayed to the parent, and so
+are their job traces (metrics, engine statistics). The global rate limit and
+connection budget are split evenly between the processes. Metadata cache
+and archive are SQLite files, shared by every process as before.
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from utils import log, logger, WARNING, ERROR
+from engines import EngineHealth
+from metrics import Metrics, Trace
+from progress import ProgressChannel, ProgressEvent, progress_notifier
+from staging import Staging, FSYNC_NONE
+
+MAX_JOBS = 50 # Jobs per process before it is recycled
+CANCEL_GRACE = 10 # s for a cancelled job to stop on its own before its process is killed
+POLL = 0.5 # s between timeout / cancel checks while a job runs
+
+
+def _rss_mb():
+    """Resident memory of this process in MB (None if this platform cannot tell)."""
+    try:
+        import psutil # Optional: exact on every platform
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    if os.name == "nt":
+        return _working_set_mb()
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # Peak, not current: errs on recycling
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+    except (ImportError, OSError):
+        return None
+
+
+def _working_set_mb():
+    """Windows: the process's working set, through GetProcessMemoryInfo."""
+    import ctypes
+    from ctypes import wintypes
+
+    class Counters(ctypes.Structure): # PROCESS_MEMORY_COUNTERS
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+    try:
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32, psapi = ctypes.WinDLL("kernel32"), ctypes.WinDLL("psapi")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        if psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize / 2 ** 20
+    except (OSError, AttributeError):
+        pass
+    return None
+
+
+def _serve(conn, options, level):
+    """Child process main loop: runs the jobs sent by the parent, one at a time."""
+    if hasattr(os, "setsid"):
+        os.setsid() # Own process group: a timeout kills the FFmpeg children too
+    from downloader import DownloadManager, DownloadJob
+
+    lock = threading.Lock()
+
+    def send(*msg):
+        with lock:
+            try:
+                conn.send(msg)
+            except (OSError, ValueError):
+                pass # Parent gone
+
+    logger.level = level
+    logger.headless = True
+    logger.forward = lambda lvl, msg: send("log", lvl, msg)
+    manager = DownloadManager(**options)
+    manager.progress.subscribe(lambda event: send("progress", event.as_dict()))
+    job = None
+
+    def run():
+        try:
+            ok = manager.start_download(job.url, job.path, job.mode, job.quality, job.fmt, job=job,
+                                        outputs=job.outputs)
+            error = None
+        except Exception as e:
+            ok, error = False, str(e)
+        manager.progress.flush() # Last events go out before the result
+        send("done", bool(ok), error, job.trace.summary() if job.trace else None, _rss_mb())
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        kind = msg[0]
+        if kind == "run":
+            spec = msg[1]
+            job = DownloadJob(spec["url"], spec["path"], spec["mode"], spec["quality"], spec["fmt"],
+                              spec["priority"], job_id=spec["id"], outputs=spec["outputs"])
+            job.created = spec["created"]
+            threading.Thread(target=run, name=f"job-{job.id}", daemon=True).start()
+        elif kind == "cancel" and job:
+            job.cancel_event.set()
+        elif kind == "priority":
+            manager.set_priority(*msg[1:])
+        elif kind == "rate":
+            manager.set_rate_limit(msg[1])
+        elif kind == "stop":
+            return
+
+
+class _Process:
+    """Parent-side handle of one worker process."""
+    def __init__(self, context, options, index):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, options, logger.level),
+                                       name=f"ultrayt-worker-{index}", daemon=True)
+        self.process.start()
+        child.close()
+        self.jobs = 0
+        self.rss = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def send(self, *msg):
+        with self._lock:
+            self.conn.send(msg)
+
+    def stop(self, timeout=5):
+        try:
+            self.send("stop")
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.alive:
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        """Kills the process and everything it started (FFmpeg...)."""
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.pid, signal.SIGKILL)
+            else:
+                # Windows has no process groups to signal: taskkill walks the tree
+                subprocess.run(["taskkill", "/T", "/F", "/PID", str(self.pid)], capture_output=True, timeout=10)
+        except (OSError, subprocess.SubprocessError):
+            pass
+        if self.alive:
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+class IsolatedManager:
+    """DownloadManager stand-in running each job in a recyclable worker process.
+
+    processes: worker processes (match the DownloadQueue's workers)
+    max_jobs: jobs per process before it is replaced
+    max_rss: MB of resident memory after which a process is replaced (None = no limit)
+    timeout: s before a running job is killed (None = no limit)
+    Other keyword arguments are passed to each process's DownloadManager.
+    """
+    def __init__(self, processes=3, max_jobs=MAX_JOBS, max_rss=None, timeout=None, progress_rate=10,
+                 **options):
+        self.processes = max(1, int(processes))
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.timeout = timeout
+        if max_rss and _rss_mb() is None:
+            log("[isolate] Process memory cannot be measured here (install psutil): "
+                "--max-rss is not enforced, processes are only recycled by job count.", WARNING)
+        options["progress_rate"] = progress_rate
+        self.rate_limit = options.pop("rate_limit", None)
+        if options.get("connection_budget"):
+            options["connection_budget"] = max(1, options["connection_budget"] // self.processes)
+        self.options = options
+
+        self.progress = ProgressChannel(progress_rate)
+        self.metrics = Metrics()
+        self.health = EngineHealth() # Engine outcomes reported by the processes' traces
+        self.staging = Staging(options.get("staging_dir"), options.get("fsync", FSYNC_NONE))
+        # "spawn": a fresh interpreter, never a fork of this threaded process
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = queue.Queue() # Idle _Process handles (None = not started yet)
+        for _ in range(self.processes):
+            self._slots.put(None)
+        self._running = {} # job id -> _Process
+        self._live = set()
+        self._count = 0
+        self._lock = threading.Lock()
+        self.metrics.gauge("worker_processes", lambda: len(self._live), "Live worker processes")
+
+    def _share(self):
+        return self.rate_limit / self.processes if self.rate_limit else None
+
+    def set_rate_limit(self, rate_limit):
+        self.rate_limit = rate_limit
+        log(f"Bandwidth limit: {rate_limit or 'unlimited'}" + (" B/s" if rate_limit else ""))
+        with self._lock:
+            live = list(self._live)
+        for proc in live:
+            try:
+                proc.send("rate", self._share())
+            except (OSError, ValueError):
+                pass
+
+    def set_priority(self, job_id, priority):
+        proc = self._running.get(job_id)
+        if not proc:
+            return False
+        try:
+            proc.send("priority", job_id, priority)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def start_download(self, url, path, mode, quality, fmt, progress_callback=None, job=None, wait=True,
+                       outputs=None, progress_details=False):
+        """Same contract as DownloadManager.start_download(); the call returns once
+        the job is over in its worker process. A job killed on timeout, or whose
+        process died, resolves with an exception (its message becomes job.error)."""
+        result = Future()
+        try:
+            notify = progress_notifier(progress_callback, progress_details)
+            result.set_result(self._run(url, path, mode, quality, fmt, notify, job, outputs))
+        except Exception as e:
+            log(f"[isolate] {e}", ERROR)
+            result.set_exception(e)
+        if wait:
+            return not result.exception() and result.result()
+        return result
+
+    def _spawn(self):
+        with self._lock:
+            self._count += 1
+            options = dict(self.options, rate_limit=self._share())
+            proc = _Process(self._context, options, self._count)
+            self._live.add(proc)
+        log(f"[isolate] Worker process {proc.pid} started.")
+        return proc
+
+    def _retire(self, proc, reason, kill=False):
+        log(f"[isolate] Worker process {proc.pid} {reason}.")
+        with self._lock:
+            self._live.discard(proc)
+        if kill:
+            proc.kill()
+        else:
+            proc.stop()
+
+    def _run(self, url, path, mode, quality, fmt, notify, job, outputs):
+        proc = self._slots.get()
+        try:
+            if proc is None or not proc.alive:
+                proc = self._spawn()
+            ok, proc = self._drive(proc, url, path, mode, quality, fmt, notify, job, outputs)
+            return ok
+        finally:
+            self._slots.put(proc)
+
+    def _drive(self, proc, url, path, mode, quality, fmt, notify, job, outputs):
+        """Runs one job on proc and relays its messages. Returns (ok, the process
+        to keep for the next job, or None once it was retired)."""
+        key = job.id if job else uuid.uuid4().hex[:8]
+        spec = {"id": key, "url": url, "path": path, "mode": mode, "quality": quality, "fmt": fmt,
+                "outputs": outputs, "priority": job.priority if job else 1,
+                "created": job.created if job else time.time()}
+        started = time.monotonic()
+        cancelled = None
+        self._running[key] = proc
+        try:
+            proc.send("run", spec)
+            while True:
+                if job is not None and job.cancel_event.is_set():
+                    if cancelled is None:
+                        cancelled = time.monotonic()
+                        proc.send("cancel")
+                    elif time.monotonic() - cancelled > CANCEL_GRACE:
+                        self._retire(proc, "killed (cancelled job did not stop)", kill=True)
+                        return False, None
+                if self.timeout and time.monotonic() - started > self.timeout:
+                    self.metrics.inc("timeouts_total", help="Jobs killed for running over the timeout")
+                    self._retire(proc, f"killed: job {key} ran over {self.timeout:g}s", kill=True)
+                    raise TimeoutError(f"timed out after {self.timeout:g}s")
+                if not proc.conn.poll(POLL):
+                    if not proc.alive:
+                        self._retire(proc, f"died (exit code {proc.process.exitcode})", kill=True)
+                        raise RuntimeError(f"worker process died (exit code {proc.process.exitcode})")
+                    continue
+                try:
+                    msg = proc.conn.recv()
+                except (EOFError, OSError):
+                    self._retire(proc, "disconnected", kill=True)
+                    raise RuntimeError("worker process died")
+                kind = msg[0]
+                if kind == "log":
+                    logger.log(msg[2], msg[1])
+                elif kind == "progress":
+                    event = ProgressEvent.from_dict(msg[1])
+                    self.progress.publish(event)
+                    if notify:
+                        notify(event)
+                elif kind == "done":
+                    _, ok, error, summary, rss = msg
+                    if error:
+                        log(f"Error: {error}", ERROR)
+                    self._finished(job, summary, cancelled is not None)
+                    proc.jobs += 1
+                    proc.rss = rss
+                    return ok, self._recycle(proc)
+        finally:
+            self._running.pop(key, None)
+
+    def _finished(self, job, summary, cancelled):
+        if not summary:
+            return
+        trace = Trace.from_summary(summary)
+        if job is not None:
+            job.trace = trace
+        self.metrics.record(trace)
+        if cancelled:
+            return
+        for span in trace.spans:
+            if span["name"] == "attempt" and span.get("engine"):
+                self.health.record(span["engine"], not span.get("error"), span["duration"])
+
+    def _recycle(self, proc):
+        """Keeps proc for the next job, or retires it. Returns what to keep."""
+        if self.max_jobs and proc.jobs >= self.max_jobs:
+            reason = f"recycled after {proc.jobs} jobs"
+        elif self.max_rss and proc.rss and proc.rss > self.max_rss:
+            reason = f"recycled at {proc.rss:.0f} MB"
+            log(f"[isolate] Worker process {proc.pid} uses {proc.rss:.0f} MB (limit {self.max_rss} MB).", WARNING)
+        else:
+            return proc
+        self.metrics.inc("recycled_total", help="Worker processes replaced (job count or memory)")
+        self._retire(proc, reason)
+        return None
+
+    def close(self):
+        """Stops every worker process."""
+        with self._lock:
+            live, self._live = list(self._live), set()
+        for proc in live:
+            proc.stop()
@@ -0,0 +1,169 @@
+"""Crash-safe journal of queued jobs, used to resume them after a restart."""
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from utils import log, app_data_dir
+from staging import STAGING_DIR
+
+# Lifecycle phases
+QUEUED = "queued"
+EXTRACTING = "extracting"
+DOWNLOADING = "downloading"
+MERGING = "merging"
+POSTPROCESSING = "postprocessing"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL = (DONE, FAILED, CANCELLED)
+
+GC_MAX_AGE = 7 * 24 * 3600 # Finished rows (and their leftovers) kept this long
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259 # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def partial_files(tmpfile):
+    """yt-dlp leftovers of one download: the .part file, fragment files and .ytdl state."""
+    base = tmpfile[:-5] if tmpfile.endswith(".part") else tmpfile
+    found = [tmpfile, base + ".ytdl"]
+    found += glob.glob(glob.escape(tmpfile) + "-Frag*")
+    return [f for f in found if os.path.exists(f)]
+
+
+class JobJournal:
+    """One row per job: its parameters, lifecycle phase, owning process and the
+    temporary files it was writing. Every phase change is committed, so after
+    a crash the unfinished jobs (whose process is gone) can be resumed."""
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(app_data_dir(), "journal.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    quality TEXT NOT NULL,
+                    fmt TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 1,
+                    phase TEXT NOT NULL,
+                    pid INTEGER,
+                    files TEXT NOT NULL DEFAULT '[]',
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )""")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+            if "outputs" not in columns: # Journals written before multi-output jobs
+                self._db.execute("ALTER TABLE jobs ADD COLUMN outputs TEXT")
+
+    def add(self, job):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, url, path, mode, quality, fmt, priority, outputs, phase, pid, "
+                "created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.url, job.path, job.mode, job.quality, job.fmt, job.priority,
+                 json.dumps(job.outputs) if job.outputs else None, QUEUED, os.getpid(), now, now))
+
+    def set_phase(self, job_id, phase, error=None):
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET phase=?, error=?, updated=? WHERE id=?",
+                             (phase, error, time.time(), job_id))
+
+    def add_file(self, job_id, tmpfile):
+        """Remembers a temporary file of the job (for resume and garbage collection)."""
+        with self._lock, self._db:
+            row = self._db.execute("SELECT files FROM jobs WHERE id=?", (job_id,)).fetchone()
+            if not row:
+                return
+            files = json.loads(row[0])
+            if tmpfile not in files:
+                files.append(tmpfile)
+                self._db.execute("UPDATE jobs SET files=? WHERE id=?", (json.dumps(files), job_id))
+
+    def claim_unfinished(self):
+        """Rows of unfinished jobs whose process is dead, re-assigned to this process."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, url, path, mode, quality, fmt, priority, phase, outputs, pid FROM jobs "
+                f"WHERE phase NOT IN ({','.join('?' * len(TERMINAL))}) ORDER BY created",
+                TERMINAL).fetchall()
+        claimed = []
+        for row in rows:
+            if row[9] != os.getpid() and pid_alive(row[9]):
+                continue # Still running in another process
+            with self._lock, self._db:
+                self._db.execute("UPDATE jobs SET pid=?, updated=? WHERE id=?", (os.getpid(), time.time(), row[0]))
+            claimed.append(dict(zip(("id", "url", "path", "mode", "quality", "fmt", "priority", "phase"), row),
+                                outputs=json.loads(row[8]) if row[8] else None))
+        return claimed
+
+    def collect_garbage(self, max_age=GC_MAX_AGE, staging_root=None):
+        """Deletes temp files of failed/cancelled jobs and forgets old finished rows.
+        staging_root: the manager's scratch staging directory, if it has one.
+        Returns the number of files/folders removed."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, path, phase, files, updated FROM jobs WHERE phase IN (?, ?, ?)", TERMINAL).fetchall()
+        removed = 0
+        cutoff = time.time() - max_age
+        for job_id, path, phase, files, updated in rows:
+            if phase != DONE:
+                for tmpfile in json.loads(files):
+                    for f in partial_files(tmpfile):
+                        try:
+                            os.remove(f)
+                            removed += 1
+                        except OSError:
+                            pass
+                leftovers = glob.glob(os.path.join(glob.escape(path), f".hedge-{job_id}-*"))
+                leftovers += glob.glob(os.path.join(glob.escape(path), f".multi-{job_id}")) # Older versions
+                leftovers += glob.glob(os.path.join(glob.escape(path), STAGING_DIR, glob.escape(job_id)))
+                if staging_root:
+                    leftovers += glob.glob(os.path.join(glob.escape(staging_root), glob.escape(job_id)))
+                for d in leftovers:
+                    shutil.rmtree(d, ignore_errors=True)
+                    removed += 1
+                with self._lock, self._db:
+                    self._db.execute("UPDATE jobs SET files='[]' WHERE id=?", (job_id,))
+            if updated < cutoff:
+                with self._lock, self._db:
+                    self._db.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+        if removed:
+            log(f"[journal] Removed {removed} stale temporary file(s).")
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,218 @@
+"""Per-job tracing spans and process-wide metrics (Prometheus text format).
+
+A Trace follows one download: timed spans per phase (queued, extract,
+download, merge, postprocess...) with the engine that ran them, and counters
+(bytes, retries, fallbacks, cache hits...). It travels with the job's
+ProgressReporter, so the engines reach it from any thread. Finished traces
+are folded into the manager's Metrics registry, rendered as Prometheus text
+(daemon GET /metrics, cli.py --metrics-file).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import log, WARNING
+
+PREFIX = "ultrayt"
+# Phase duration histogram buckets (s)
+BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+MAX_SPANS = 500 # Per trace: a long playlist keeps its first spans only
+
+
+class Trace:
+    """Spans and counters of one job."""
+    def __init__(self, job, url=None):
+        self.job = job
+        self.url = url
+        self.started = time.time()
+        self.ended = None
+        self.ok = None
+        self.engine = None # Engine that produced the file
+        self.spans = []
+        self.counters = {}
+        self.bytes = {} # engine -> bytes received
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, end, **attrs):
+        with self._lock:
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append(dict(attrs, name=name, start=start, duration=max(0.0, end - start)))
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Times the enclosed block; the span records whether it raised."""
+        start = time.time()
+        try:
+            yield
+        except BaseException:
+            attrs["error"] = True
+            raise
+        finally:
+            self.add_span(name, start, time.time(), **attrs)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_bytes(self, engine, n):
+        with self._lock:
+            self.bytes[engine] = self.bytes.get(engine, 0) + n
+
+    def finish(self, ok):
+        self.ok = bool(ok)
+        self.ended = time.time()
+
+    @classmethod
+    def from_summary(cls, summary):
+        """Rebuilds a finished trace from summary() (e.g. sent by a worker process)."""
+        trace = cls(summary.get("job"), summary.get("url"))
+        trace.started = summary.get("started") or time.time() - summary.get("seconds", 0)
+        trace.ended = trace.started + summary.get("seconds", 0)
+        trace.ok = summary.get("ok")
+        trace.engine = summary.get("engine")
+        trace.counters = dict(summary.get("counters") or {})
+        trace.bytes = dict(summary.get("bytes_by_engine") or {})
+        trace.spans = [dict(s, start=trace.started + s["start"]) for s in summary.get("spans") or []]
+        return trace
+
+    def phases(self):
+        """Total seconds per span name."""
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration"]
+        return totals
+
+    def summary(self):
+        """JSON-ready view of the job: where its time went and what it cost."""
+        end = self.ended or time.time()
+        with self._lock:
+            spans = [dict(s, start=round(s["start"] - self.started, 3), duration=round(s["duration"], 3))
+                     for s in self.spans]
+            counters, received = dict(self.counters), dict(self.bytes)
+        return {"job": self.job, "url": self.url, "ok": self.ok, "engine": self.engine,
+                "started": round(self.started, 3), "seconds": round(end - self.started, 3),
+                "phases": {name: round(t, 3) for name, t in self.phases().items()},
+                "bytes": sum(received.values()), "bytes_by_engine": received,
+                "counters": counters, "spans": spans}
+
+
+class Metrics:
+    """Thread-safe counters, gauges and phase histograms of a DownloadManager."""
+    def __init__(self):
+        self._counters = {} # (name, labels) -> value
+        self._gauges = {} # name -> callable returning the current value
+        self._histograms = {} # (name, labels) -> [bucket counts, sum, count]
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, n=1, help=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+            if help:
+                self._help.setdefault(name, help)
+
+    def gauge(self, name, func, help=None):
+        """Registers a gauge read at render time."""
+        with self._lock:
+            self._gauges[name] = func
+            if help:
+                self._help[name] = help
+
+    def observe(self, name, value, help=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+            if help:
+                self._help.setdefault(name, help)
+
+    def record(self, trace):
+        """Folds a finished trace into the totals."""
+        self.inc("jobs_total", help="Finished downloads by result", result="ok" if trace.ok else "failed")
+        if trace.engine:
+            self.inc("engine_used_total", help="Downloads completed by each engine", engine=trace.engine)
+        for engine, n in trace.bytes.items():
+            self.inc("bytes_total", n, help="Bytes received by each engine", engine=engine)
+        for name, n in trace.counters.items():
+            self.inc(f"{name}_total", n)
+        for span in list(trace.spans):
+            self.observe("phase_seconds", span["duration"], help="Time spent per job phase",
+                         phase=span["name"], engine=span.get("engine", ""))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+            gauges = dict(self._gauges)
+            helps = dict(self._help)
+        lines = []
+
+        def header(name, kind):
+            full = f"{PREFIX}_{name}"
+            if name in helps:
+                lines.append(f"# HELP {full} {helps[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        for name in sorted({n for n, _ in counters}):
+            full = header(name, "counter")
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{full}{_labels(labels)} {value}")
+        for name, func in sorted(gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            full = header(name, "gauge")
+            lines.append(f"{full} {value}")
+        for name in sorted({n for n, _ in histograms}):
+            full = header(name, "histogram")
+            for (n, labels), (buckets, total, count) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for bound, value in zip(BUCKETS, buckets):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full}_bucket{_labels(labels + (('le', le),))} {value}")
+                lines.append(f"{full}_sum{_labels(labels)} {round(total, 6)}")
+                lines.append(f"{full}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Writes render() to path atomically (node_exporter textfile collector)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def export(self, path, interval=10.0):
+        """Rewrites the file every `interval` seconds from a background thread."""
+        stop = threading.Event()
+
+        def run():
+            while True:
+                try:
+                    self.write(path)
+                except OSError as e:
+                    log(f"[metrics] Cannot write {path}: {e}", WARNING)
+                if stop.wait(interval):
+                    return
+        threading.Thread(target=run, name="metrics-export", daemon=True).start()
+        return stop
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
@@ -0,0 +1,63 @@
+"""Job output specs and JSON-lines records, shared by cli.py and daemon.py."""
+import json
+import sys
+import threading
+import time
+
+MODES = {"video": "Vidéo", "audio": "Audio"}
+DEFAULTS = {
+    "video": ("1080p", "mp4"),
+    "audio": ("192 kbps", "mp3"),
+}
+
+
+class JsonEmitter:
+    """Writes one JSON object per line to a stream, thread-safe."""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def record(self, event, **fields):
+        record = {"event": event, "ts": round(time.time(), 3)}
+        record.update(fields)
+        return record
+
+    def emit(self, event, **fields):
+        self.write(self.record(event, **fields))
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def status(self, job):
+        fields = {"job": job.id, "url": job.url, "status": job.status}
+        if job.error:
+            fields["error"] = job.error
+        return self.record("status", **fields)
+
+    def on_status(self, job):
+        self.write(self.status(job))
+
+    def on_trace(self, job):
+        """Status line, then the job's spans and counters once it is finished."""
+        self.on_status(job)
+        if job.finished and job.trace:
+            self.emit("trace", **job.trace.summary())
+
+    def on_progress(self, event):
+        # Already coalesced by the manager's ProgressChannel
+        fields = event.as_dict()
+        del fields["ts"]
+        self.emit("progress", **fields)
+
+
+def output_spec(mode, quality=None, fmt=None):
+    """[mode, quality, fmt] as DownloadManager expects it; missing values take the mode's defaults."""
+    mode = str(mode or "video").lower()
+    mode = {v.lower(): k for k, v in MODES.items()}.get(mode, mode) # Also accepts "Vidéo" / "Audio"
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r} (video or audio)")
+    default_quality, default_fmt = DEFAULTS[mode]
+    return [MODES[mode], quality or default_quality, fmt or default_fmt]
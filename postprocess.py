@@ -0,0 +1,134 @@
+"""Post-processing stage: FFmpeg merges/transcodes run off the download threads."""
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import log, debug
+
+# Audio format -> (ffmpeg encoder, takes a bitrate)
+AUDIO_CODECS = {
+    'mp3': ('libmp3lame', True),
+    'm4a': ('aac', True),
+    'aac': ('aac', True),
+    'opus': ('libopus', True),
+    'ogg': ('libvorbis', True),
+    'flac': ('flac', False),
+    'wav': ('pcm_s16le', False),
+}
+
+
+class PostTask:
+    """An FFmpeg job turning downloaded streams (inputs) into the final file (output).
+    kind uses yt-dlp's postprocessor names ("Merger", "ExtractAudio").
+    keep_inputs leaves the inputs in place (sources shared by several tasks).
+    dest, if set, is where the output goes once complete (see staging.py)."""
+    def __init__(self, kind, inputs, output, args, keep_inputs=False):
+        self.kind = kind
+        self.inputs = list(inputs)
+        self.output = output
+        self.args = list(args)
+        self.keep_inputs = keep_inputs
+        self.dest = None
+
+    def command(self, target):
+        cmd = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error']
+        for path in self.inputs:
+            cmd += ['-i', path]
+        return cmd + self.args + [target]
+
+    def run(self):
+        """Runs FFmpeg, then replaces the inputs by the output. Returns the output path."""
+        stem, ext = os.path.splitext(self.output)
+        target = f"{stem}.temp{ext}" # Same suffix as yt-dlp: never mistaken for a finished file
+        debug("[postprocess] %s", self.command(target))
+        flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        proc = subprocess.run(self.command(target), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              creationflags=flags)
+        if proc.returncode != 0:
+            if os.path.exists(target):
+                os.remove(target)
+            error = proc.stderr.decode(errors='replace').strip().splitlines()
+            raise RuntimeError(f"ffmpeg {self.kind} failed: {error[-1] if error else proc.returncode}")
+        os.replace(target, self.output)
+        for path in [] if self.keep_inputs else self.inputs:
+            if path != self.output and os.path.exists(path):
+                os.remove(path)
+        return self.output
+
+    def __repr__(self):
+        return f"<PostTask {self.kind} {os.path.basename(self.output)}>"
+
+
+def merge(inputs, output):
+    """Muxes separately downloaded video/audio streams without re-encoding."""
+    maps = []
+    for i in range(len(inputs)):
+        maps += ['-map', str(i)]
+    return PostTask("Merger", inputs, output, maps + ['-c', 'copy'])
+
+
+def scale(inputs, output, height):
+    """Re-encodes the video of muxed/separate streams down to `height` lines
+    (never up); the audio is copied."""
+    maps = []
+    for i in range(len(inputs)):
+        maps += ['-map', str(i)]
+    return PostTask("Transcode", inputs, output, maps + ['-vf', f"scale=-2:'min({height},ih)'", '-c:a', 'copy'])
+
+
+def extract_audio(source, fmt, bitrate=0, output=None):
+    """Transcodes `source` to audio format `fmt` (bitrate in kbps, 0 = 192).
+    Returns None when the file already has the requested extension, unless an
+    explicit `output` is given: the audio stream is then copied as is."""
+    stem, ext = os.path.splitext(source)
+    if ext.lstrip('.').lower() == fmt:
+        if output is None:
+            return None
+        return PostTask("ExtractAudio", [source], output, ['-vn', '-c:a', 'copy'])
+    codec, lossy = AUDIO_CODECS.get(fmt, (None, True))
+    args = ['-vn'] + (['-c:a', codec] if codec else [])
+    if lossy:
+        args += ['-b:a', f"{bitrate or 192}k"]
+    return PostTask("ExtractAudio", [source], output or f"{stem}.{fmt}", args)
+
+
+class PostProcessStage:
+    """Bounded pool for PostTasks, so the next download proceeds while the
+    previous file is merged or transcoded.
+
+    The pool threads only wait on FFmpeg processes (the CPU work happens there),
+    `workers` of them run at once. submit() blocks once `backlog` tasks are
+    queued or running: a slow transcoder then holds back the downloads instead
+    of letting staged streams pile up on disk.
+    """
+    def __init__(self, workers=None, backlog=None):
+        self.workers = workers or os.cpu_count() or 2
+        self.backlog = backlog or self.workers * 2
+        self._slots = threading.BoundedSemaphore(self.backlog)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="postprocess")
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, func, *args):
+        """Schedules func(*args), waiting for a free slot. Returns a Future."""
+        if not self._slots.acquire(blocking=False):
+            log(f"[postprocess] {self.backlog} tasks pending, waiting for a free slot...")
+            self._slots.acquire()
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._pool.submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def close(self, wait=True):
+        self._pool.shutdown(wait=wait)
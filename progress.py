@@ -0,0 +1,242 @@
+"""Structured progress events and a coalescing, thread-safe delivery channel.
+
+Engines publish ProgressEvents as often as they like (every yt-dlp block, every
+pytubefix chunk). The channel keeps only the latest event per job and delivers
+at most `rate` batches per second to its subscribers, so consumers (GUI, CLI,
+metrics) see a bounded event rate however many fragments are in flight.
+"""
+import threading
+import time
+from collections import deque
+
+from utils import log, WARNING
+
+# Lifecycle phases, in order
+EXTRACTING = "extracting"
+DOWNLOADING = "downloading"
+POSTPROCESSING = "postprocessing"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+class ProgressEvent:
+    __slots__ = ("job", "phase", "downloaded", "total", "speed", "eta",
+                 "fragment_index", "fragment_count", "engine", "details", "ts")
+
+    def __init__(self, job, phase, downloaded=0, total=None, speed=None, eta=None,
+                 fragment_index=None, fragment_count=None, engine=None, details=None):
+        self.job = job
+        self.phase = phase
+        self.downloaded = downloaded
+        self.total = total
+        self.speed = speed
+        self.eta = eta
+        self.fragment_index = fragment_index
+        self.fragment_count = fragment_count
+        self.engine = engine
+        self.details = details or {}
+        self.ts = time.time()
+
+    @property
+    def fraction(self):
+        if self.phase == FINISHED:
+            return 1.0
+        if self.total:
+            return min(1.0, self.downloaded / self.total)
+        if self.fragment_count and self.fragment_index:
+            return min(1.0, self.fragment_index / self.fragment_count)
+        return 0.0
+
+    def as_dict(self):
+        d = {k: getattr(self, k) for k in self.__slots__ if k != "details"}
+        d["fraction"] = round(self.fraction, 4)
+        d.update(self.details)
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        """Inverse of as_dict() (e.g. for events received from a daemon)."""
+        d = dict(d)
+        d.pop("fraction", None)
+        ts = d.pop("ts", None)
+        fields = {k: d.pop(k) for k in cls.__slots__ if k in d and k not in ("details", "ts")}
+        event = cls(details=d, **fields)
+        if ts:
+            event.ts = ts
+        return event
+
+    def __repr__(self):
+        return f"<ProgressEvent {self.job} {self.phase} {self.fraction:.1%}>"
+
+
+class Subscription:
+    """Events for one consumer: either pushed to `callback` on the channel's
+    dispatcher thread, or buffered for the consumer to drain() on its own thread."""
+    def __init__(self, channel, callback=None, maxlen=1000):
+        self.channel = channel
+        self.callback = callback
+        self._buffer = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def _deliver(self, events):
+        if self.callback:
+            for ev in events:
+                self.callback(ev)
+        else:
+            with self._lock:
+                self._buffer.extend(events)
+
+    def drain(self):
+        with self._lock:
+            events = list(self._buffer)
+            self._buffer.clear()
+        return events
+
+    def close(self):
+        self.channel.unsubscribe(self)
+
+
+class ProgressChannel:
+    def __init__(self, rate=10.0):
+        self.interval = 1.0 / rate if rate else 0
+        self._pending = {} # job -> latest event
+        self._transitions = [] # phase changes, never coalesced away
+        self._phases = {}
+        self._subs = []
+        self._lock = threading.Lock()
+        self._deliver_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback=None):
+        sub = Subscription(self, callback)
+        with self._lock:
+            self._subs.append(sub)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="progress", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def publish(self, event):
+        """Cheap and non-blocking: safe to call from engine hot paths."""
+        with self._lock:
+            if not self._subs:
+                return
+            if self._phases.get(event.job) != event.phase:
+                self._phases[event.job] = event.phase
+                self._transitions.append(event)
+                self._pending.pop(event.job, None)
+            else:
+                self._pending[event.job] = event
+            if not self.interval:
+                self._wake.set()
+            if event.phase in (FINISHED, FAILED):
+                self._phases.pop(event.job, None)
+
+    def flush(self):
+        """Delivers pending events now, on the calling thread (e.g. before a status change)."""
+        with self._lock:
+            events = self._transitions + list(self._pending.values())
+            self._transitions = []
+            self._pending = {}
+            subs = list(self._subs)
+        if not events:
+            return
+        events.sort(key=lambda e: e.ts)
+        with self._deliver_lock: # Keep batches in order across threads
+            for sub in subs:
+                try:
+                    sub._deliver(events)
+                except Exception:
+                    pass
+
+    def _dispatch(self):
+        while True:
+            if self.interval:
+                time.sleep(self.interval) # Coalescing window
+            else:
+                self._wake.wait()
+                self._wake.clear()
+            self.flush()
+
+
+def progress_notifier(callback, details=False):
+    """Turns a start_download() progress_callback into a function of one event.
+
+    The callback gets `(fraction)`, as it always did; with details=True it gets
+    `(fraction, **event.details)` instead. It runs inside the engines' hooks, so
+    its errors are logged and never reach the download.
+    """
+    if not callback:
+        return None
+
+    def notify(event):
+        try:
+            if details:
+                callback(event.fraction, **event.details)
+            else:
+                callback(event.fraction)
+        except Exception as e:
+            log(f"Progress callback failed: {e!r}", WARNING)
+    return notify
+
+
+class ProgressReporter:
+    """Per-job handle given to the engines. Builds events and publishes them.
+
+    `callback` is kept for direct callers of DownloadManager.start_download()
+    (see progress_notifier); it is rate-limited like the channel.
+    """
+    def __init__(self, channel, job, callback=None, engine=None, min_interval=0.1, details=False):
+        self.channel = channel
+        self.job = job
+        self.callback = progress_notifier(callback, details)
+        self.engine = engine
+        self.min_interval = min_interval
+        self.listeners = [] # Called synchronously with every event (e.g. hedge stall detection)
+        self.trace = None # metrics.Trace of the job, shared with the forks
+        self.last = None
+        self._last_callback = 0.0
+        self._lock = threading.Lock() # Forks may report from several engine threads
+
+    def fork(self, engine):
+        """Reporter for one engine attempt of the same job."""
+        child = ProgressReporter(None, self.job, engine=engine) # Publishes through us
+        child.trace = self.trace
+        child.listeners.append(self._from_child)
+        return child
+
+    def _from_child(self, event):
+        with self._lock:
+            # Several engines may race (hedging): another engine only takes over
+            # the job's progress once it is further ahead
+            last = self.last
+            if last is not None and last.engine != event.engine and event.phase == last.phase \
+                    and event.fraction < last.fraction:
+                return
+            self._emit(event)
+
+    def update(self, phase, downloaded=0, total=None, speed=None, eta=None,
+               fragment_index=None, fragment_count=None, **details):
+        event = ProgressEvent(self.job, phase, downloaded, total, speed, eta,
+                              fragment_index, fragment_count, self.engine, details)
+        self._emit(event)
+        return event
+
+    def _emit(self, event):
+        phase_changed = self.last is None or self.last.phase != event.phase
+        self.last = event
+        for listener in self.listeners:
+            listener(event)
+        if self.channel is not None:
+            self.channel.publish(event)
+        if self.callback:
+            now = time.monotonic()
+            if phase_changed or event.phase == FINISHED or now - self._last_callback >= self.min_interval:
+                self._last_callback = now
+                self.callback(event)
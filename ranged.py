@@ -0,0 +1,289 @@
+"""Multi-connection HTTP downloads: parallel Range requests into preallocated files."""
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+from utils import log, debug
+from retry import host_key
+from staging import preallocate
+
+CHUNK_SIZE = 8 * 1024 * 1024 # YouTube serves ranges up to ~10MB without throttling them
+MIN_CHUNK = 512 * 1024
+READ_SIZE = 64 * 1024
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+
+
+class RangeCancelled(Exception):
+    pass
+
+
+def _query_range(url):
+    # googlevideo stream URLs take the range as a query parameter (as pytubefix does)
+    return (urlparse(url).hostname or "").endswith("googlevideo.com")
+
+
+def _open(url, start=None, end=None, timeout=20):
+    headers = {"User-Agent": USER_AGENT}
+    if start is not None:
+        if _query_range(url):
+            url += ("&" if "?" in url else "?") + f"range={start}-{end}"
+        else:
+            headers["Range"] = f"bytes={start}-{end}"
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+
+
+def probe(url, timeout=20):
+    """Returns (size, accepts_ranges). size is None if the server does not say."""
+    with _open(url, 0, 0, timeout) as resp:
+        content_range = resp.headers.get("Content-Range", "")
+        if resp.status == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            return (int(total) if total.isdigit() else None), True
+        length = resp.headers.get("Content-Length")
+        # A query range answers 200 with exactly the requested byte
+        if _query_range(url) and length == "1":
+            return None, True
+        return (int(length) if length else None), False
+
+
+class RangedDownloader:
+    """Downloads several URLs at once over a shared set of connections.
+
+    Every file is preallocated as `<dest>.part`, cut into chunks, and the chunks
+    of all files are interleaved in one work list, so e.g. the video and audio
+    streams of a video progress together. Each connection fetches a chunk with
+    a Range request and writes it at its offset; a failed chunk is retried from
+    the last byte received. Finished chunks are recorded in `<dest>.part.chunks`:
+    after a crash, a download of the same file (same size) reopens the `.part`
+    and only fetches the chunks missing from it.
+
+    The number of active connections follows `controller.value` (an AIMD
+    FragmentController) when one is given, `connections` otherwise.
+    on_bytes(n, dest) is called from the connection threads after every read.
+    With a RetryCoordinator (`retry`), chunk retries honour the host-wide
+    cool-down and permanent errors are not retried.
+    """
+    def __init__(self, connections=4, controller=None, chunk_size=CHUNK_SIZE, on_bytes=None,
+                 cancel=None, retries=5, timeout=20, retry=None):
+        self.connections = connections
+        self.controller = controller
+        self.chunk_size = chunk_size
+        self.on_bytes = on_bytes
+        self.cancel = cancel
+        self.retries = retries
+        self.timeout = timeout
+        self.retry = retry
+
+        self.downloaded = 0
+        self.total = 0
+        self.retried = 0 # Chunk retries, all files
+        self._chunks = []
+        self._maps = {} # dest -> {"size", "chunk", "done": [chunk starts]}, persisted per chunk
+        self._lock = threading.Lock()
+        self._error = None
+
+    @property
+    def limit(self):
+        return self.controller.value if self.controller else self.connections
+
+    def download(self, targets):
+        """targets: [(url, dest, size or None)]. Returns the list of dest paths."""
+        plans = []
+        for url, dest, size in targets:
+            ranges = True
+            if not size:
+                size, ranges = probe(url, self.timeout)
+            if not size or not ranges:
+                plans.append((url, dest, None))
+                continue
+            plans.append((url, dest, size))
+            self.total += size
+
+        self._plan([(url, dest, size) for url, dest, size in plans if size])
+        threads = []
+        count = min(self.controller.maximum if self.controller else self.connections, len(self._chunks))
+        for i in range(count):
+            t = threading.Thread(target=self._worker, args=(i,), name=f"ranged-{i}", daemon=True)
+            t.start()
+            threads.append(t)
+        # Servers without Range support: one plain stream each, next to the pool
+        for url, dest, size in plans:
+            if not size:
+                log(f"[ranged] No range support, single connection: {os.path.basename(dest)}")
+                t = threading.Thread(target=self._guard, args=(self._single, url, dest), daemon=True)
+                t.start()
+                threads.append(t)
+        for t in threads:
+            t.join()
+
+        if self._error:
+            raise self._error
+        for url, dest, size in plans:
+            if size:
+                os.replace(dest + ".part", dest)
+                _remove(dest + ".part.chunks")
+        return [dest for _, dest, _ in plans]
+
+    def _plan(self, files):
+        per_file = []
+        for url, dest, size in files:
+            chunks = self._resume(dest, size)
+            if chunks is None:
+                # Preallocate: chunks are written at their offset, in any order
+                with open(dest + ".part", "wb") as fh:
+                    preallocate(fh, size)
+                # Small files still get a few chunks so that every connection helps
+                chunk = min(self.chunk_size, max(MIN_CHUNK, size // (self.limit * 2)))
+                chunks = self._maps[dest] = {"size": size, "chunk": chunk, "done": []}
+                self._save_map(dest)
+            done = set(chunks["done"])
+            chunk = chunks["chunk"]
+            per_file.append([(url, dest, start, min(start + chunk, size) - 1)
+                             for start in range(0, size, chunk) if start not in done])
+            debug("[ranged] %s: %d bytes in %d chunks", os.path.basename(dest), size, len(per_file[-1]))
+        # Interleave by relative position: all files advance at the same pace
+        ordered = []
+        for chunks in per_file:
+            ordered += [(i / len(chunks), c) for i, c in enumerate(chunks)]
+        ordered.sort(key=lambda item: item[0])
+        self._chunks = [c for _, c in reversed(ordered)] # pop() from the end
+
+    def _resume(self, dest, size):
+        """Chunk map of an interrupted download of dest, if it can be continued."""
+        try:
+            with open(dest + ".part.chunks", encoding="utf-8") as f:
+                chunks = json.load(f)
+            if chunks["size"] != size or os.path.getsize(dest + ".part") != size:
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self._maps[dest] = chunks
+        done = sum(min(chunks["chunk"], size - start) for start in chunks["done"])
+        self.downloaded += done
+        log(f"[ranged] Resuming {os.path.basename(dest)}: {len(chunks['done'])} chunks "
+            f"({done / 2 ** 20:.1f} MB) already there")
+        return chunks
+
+    def _chunk_done(self, fh, dest, start):
+        fh.flush() # The data is in the file before the map says so
+        with self._lock:
+            self._maps[dest]["done"].append(start)
+            self._save_map(dest)
+
+    def _save_map(self, dest):
+        path = dest + ".part.chunks"
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._maps[dest], f)
+        os.replace(path + ".tmp", path)
+
+    def _next_chunk(self):
+        with self._lock:
+            return self._chunks.pop() if self._chunks and not self._error else None
+
+    def _guard(self, func, *args):
+        """Runs func, recording its error for download() to raise. Returns True on success."""
+        try:
+            func(*args)
+            return True
+        except Exception as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            return False
+
+    def _worker(self, index):
+        handles = {}
+        try:
+            while True:
+                if index >= self.limit:
+                    # Connection released by the controller: idle until it grows again
+                    if not self._chunks or self._error:
+                        return
+                    time.sleep(0.2)
+                    continue
+                chunk = self._next_chunk()
+                if chunk is None:
+                    return
+                url, dest, start, end = chunk
+                if dest not in handles:
+                    handles[dest] = open(dest + ".part", "r+b")
+                if self._guard(self._fetch, handles[dest], url, dest, start, end):
+                    self._chunk_done(handles[dest], dest, start)
+        finally:
+            for fh in handles.values():
+                fh.close()
+
+    def _fetch(self, fh, url, dest, start, end):
+        pos = start
+        failures = 0
+        host = host_key(url)
+        while pos <= end:
+            self._check_cancel()
+            if self.retry and not self.retry.wait(host, self.cancel):
+                raise RangeCancelled("Ranged download cancelled")
+            try:
+                with _open(url, pos, end, self.timeout) as resp:
+                    if resp.status != 206 and not _query_range(url):
+                        raise IOError(f"Range request answered with HTTP {resp.status}")
+                    fh.seek(pos)
+                    while pos <= end:
+                        self._check_cancel()
+                        data = resp.read(min(READ_SIZE, end - pos + 1))
+                        if not data:
+                            break
+                        fh.write(data)
+                        pos += len(data)
+                        self._received(len(data), dest)
+                if pos <= end:
+                    raise IOError(f"Connection closed at byte {pos} of {end + 1}")
+            except RangeCancelled:
+                raise
+            except (urllib.error.URLError, OSError) as e:
+                failures += 1
+                if self.controller:
+                    self.controller.congestion()
+                if failures > self.retries:
+                    raise
+                delay = self.retry.delay(host, e, failures - 1) if self.retry else min(10, 0.5 * 2 ** failures)
+                if delay is None:
+                    raise
+                log(f"[ranged] Retrying chunk {start}-{end} at {pos} ({failures}/{self.retries}): {e}")
+                with self._lock:
+                    self.retried += 1
+                time.sleep(delay)
+
+    def _single(self, url, dest):
+        with _open(url, timeout=self.timeout) as resp, open(dest + ".part", "wb") as fh:
+            while True:
+                self._check_cancel()
+                data = resp.read(READ_SIZE)
+                if not data:
+                    break
+                fh.write(data)
+                self._received(len(data), dest)
+        os.replace(dest + ".part", dest)
+
+    def _received(self, n, dest):
+        with self._lock:
+            self.downloaded += n
+        if self.controller:
+            self.controller.add_bytes(n)
+        if self.on_bytes:
+            self.on_bytes(n, dest)
+
+    def _check_cancel(self):
+        if self._error:
+            raise RangeCancelled("Another chunk failed")
+        if self.cancel is not None and self.cancel.is_set():
+            raise RangeCancelled("Ranged download cancelled")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
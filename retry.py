@@ -0,0 +1,208 @@
+"""Error classification and retry/backoff coordinated across every job.
+
+Throttling is per client IP, not per download: when YouTube answers 429 (or
+asks to prove we are not a bot), every job talking to it backs off together.
+The host enters a cool-down that grows with each throttle signal; new
+attempts wait for it to end and yt-dlp's own retries sleep at least as long
+(retry_sleep_functions). A 403 is not throttling: it is one stream URL
+refused (expired signature, URL bound to another client), so only that job
+gives up on the URL and moves on to the next engine, which extracts afresh;
+the other jobs keep going. Permanent errors (video removed, private, geo or
+age restricted...) fail at once: no retries, no fallback engine.
+"""
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from utils import log, WARNING
+
+THROTTLE = "throttle" # 429, bot check: every job on the host waits, then retries
+FORBIDDEN = "forbidden" # 403 on a stream URL: this job re-extracts / falls back, no retry of the URL
+TRANSIENT = "transient" # Network errors, 5xx: retry with backoff
+PERMANENT = "permanent" # Unavailable, private, removed...: fail now
+RESTRICTED = "restricted" # Geo / age / members-only: fail now (no engine can help)
+FINAL = (PERMANENT, RESTRICTED)
+
+BACKOFF_BASE = 1.0 # s, first retry delay (doubled each attempt, jittered)
+BACKOFF_CAP = 60.0
+COOLDOWN_BASE = 5.0 # s, first host cool-down after a throttle signal
+COOLDOWN_CAP = 300.0
+ENGINE_RETRIES = 3 # Attempts of engines without retries of their own (pytubefix)
+
+# Lowercase message fragments, checked in this order (most specific first)
+_PATTERNS = (
+    (RESTRICTED, ("available in your country", "geo restrict", "geo-restrict", "region blocked",
+                  "confirm your age", "age-restricted", "age restricted", "inappropriate for some users",
+                  "members-only", "members only", "join this channel")),
+    (THROTTLE, ("http error 429", "too many requests", "rate-limit", "rate limit", "not a bot",
+                "bot detection")),
+    (FORBIDDEN, ("http error 403", "forbidden")),
+    (PERMANENT, ("video unavailable", "this video is unavailable", "private video", "video is private",
+                 "has been removed", "account associated with this video has been terminated",
+                 "copyright", "unsupported url", "is not a valid url", "incomplete youtube id",
+                 "http error 404", "http error 410", "does not exist", "premieres in",
+                 "live event will begin")),
+    (TRANSIENT, ("timed out", "timeout", "connection reset", "connection aborted", "connection refused",
+                 "temporary failure", "name resolution", "incompleteread", "incomplete read",
+                 "remote end closed", "http error 5", "eof occurred", "unable to download", "urlopen error")),
+)
+
+# pytubefix raises typed exceptions
+_EXCEPTIONS = {
+    "VideoRegionBlocked": RESTRICTED, "AgeRestrictedError": RESTRICTED, "AgeCheckRequiredError": RESTRICTED,
+    "AgeCheckRequiredAccountError": RESTRICTED, "MembersOnly": RESTRICTED, "LoginRequired": RESTRICTED,
+    "BotDetection": THROTTLE, "PoTokenRequired": THROTTLE,
+    "VideoUnavailable": PERMANENT, "VideoPrivate": PERMANENT, "VideoRemovedByUploader": PERMANENT,
+    "VideoRemovedByYouTubeForViolatingTOS": PERMANENT, "VideoBlockedByCopyright": PERMANENT,
+    "AccountTerminated": PERMANENT, "RecordingUnavailable": PERMANENT, "LiveStreamError": PERMANENT,
+    "LiveStreamOffline": PERMANENT, "LiveStreamEnded": PERMANENT,
+    "TimeoutError": TRANSIENT, "ConnectionError": TRANSIENT, "IncompleteRead": TRANSIENT,
+}
+
+
+def classify(error):
+    """THROTTLE, FORBIDDEN, TRANSIENT, PERMANENT, RESTRICTED, or None when unknown.
+    `error` is an exception or a message (e.g. a yt-dlp warning line)."""
+    if isinstance(error, BaseException):
+        for cls in type(error).__mro__:
+            if cls.__name__ in _EXCEPTIONS:
+                return _EXCEPTIONS[cls.__name__]
+        code = getattr(error, "code", None) or getattr(error, "status", None)
+        if code == 429:
+            return THROTTLE
+        if code == 403:
+            return FORBIDDEN
+        if code in (404, 410):
+            return PERMANENT
+        if isinstance(code, int) and code >= 500:
+            return TRANSIENT
+    text = str(error).lower()
+    for kind, fragments in _PATTERNS:
+        if any(f in text for f in fragments):
+            return kind
+    return None
+
+
+def host_key(url):
+    """Throttling scope of a URL: all of YouTube (pages and googlevideo streams)
+    counts as one host."""
+    host = (urlparse(url).hostname or "").lower()
+    if host.endswith(("youtube.com", "youtu.be", "googlevideo.com", "youtube-nocookie.com", "ytimg.com")):
+        return "youtube.com"
+    return host
+
+
+class _Host:
+    def __init__(self):
+        self.until = 0.0 # Cool-down end (time.monotonic())
+        self.level = 0 # Throttle signals in a row
+        self.last = 0.0
+
+
+class RetryCoordinator:
+    """Shared by every job of a DownloadManager: jittered exponential backoff
+    for transient errors and a host-wide cool-down for throttling."""
+    def __init__(self, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP,
+                 cooldown_base=COOLDOWN_BASE, cooldown_cap=COOLDOWN_CAP):
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cooldown_base = cooldown_base
+        self.cooldown_cap = cooldown_cap
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = _Host()
+        return self._hosts[host]
+
+    def backoff(self, attempt):
+        """Delay before retry number `attempt` (0-based): exponential, half jittered."""
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def remaining(self, host):
+        """Seconds left in the host's cool-down."""
+        with self._lock:
+            st = self._hosts.get(host)
+            return max(0.0, st.until - time.monotonic()) if st else 0.0
+
+    def throttled(self, host):
+        """Records a throttle signal: extends the host's cool-down (doubling,
+        jittered) unless one is already running. Returns the cool-down length."""
+        now = time.monotonic()
+        with self._lock:
+            st = self._host(host)
+            if now < st.until:
+                return st.until - now # Already cooling down: the same burst, one step
+            if now - st.last > self.cooldown_cap * 2:
+                st.level = 0 # Quiet long enough: start over
+            delay = min(self.cooldown_cap, self.cooldown_base * 2 ** st.level)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            st.level += 1
+            st.last = now
+            st.until = now + delay
+        log(f"[retry] {host} is throttling us, all jobs pause for {delay:.1f}s.", WARNING)
+        return delay
+
+    def succeeded(self, host):
+        with self._lock:
+            st = self._hosts.get(host)
+            if st and st.level:
+                st.level -= 1
+
+    def wait(self, host, cancel=None):
+        """Blocks until the host's cool-down is over. Returns False if cancelled."""
+        while True:
+            delay = self.remaining(host)
+            if delay <= 0:
+                return True
+            if cancel is not None:
+                if cancel.wait(min(delay, 1.0)):
+                    return False
+            else:
+                time.sleep(min(delay, 1.0))
+
+    def sleep_function(self, host):
+        """For yt-dlp's retry_sleep_functions: backoff, but never less than the
+        host's cool-down."""
+        return lambda n: max(self.backoff(n), self.remaining(host))
+
+    def delay(self, host, error, attempt):
+        """Sleep before retrying after `error`: None if it must not be retried
+        (final errors, and 403s: the same URL would be refused again)."""
+        kind = classify(error)
+        if kind in FINAL or kind == FORBIDDEN:
+            return None
+        if kind == THROTTLE:
+            return max(self.throttled(host), self.backoff(attempt))
+        return self.backoff(attempt)
+
+    def run(self, func, host, attempts=ENGINE_RETRIES, cancel=None, what="request", on_retry=None):
+        """Calls func() up to `attempts` times. Final errors and the last failure
+        are raised; throttling and transient errors are retried after a delay
+        (on_retry(kind, delay) is called before each retry)."""
+        for attempt in range(attempts):
+            if not self.wait(host, cancel):
+                raise InterruptedError(f"{what} cancelled")
+            try:
+                result = func()
+            except Exception as e:
+                if cancel is not None and cancel.is_set():
+                    raise
+                delay = self.delay(host, e, attempt)
+                if delay is None or attempt + 1 >= attempts:
+                    raise
+                log(f"[retry] {what} failed ({classify(e) or 'error'}: {e}), "
+                    f"retry {attempt + 1}/{attempts - 1} in {delay:.1f}s")
+                if on_retry:
+                    on_retry(classify(e), delay)
+                if cancel is not None:
+                    if cancel.wait(delay):
+                        raise
+                else:
+                    time.sleep(delay)
+                continue
+            self.succeeded(host)
+            return result
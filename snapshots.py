@@ -0,0 +1,158 @@
+"""Stored playlist snapshots for incremental (delta) syncs."""
+import os
+import sqlite3
+import threading
+import time
+
+from utils import log, app_data_dir
+
+SYNC_WINDOW = 30 # Consecutive known entries after which enumeration stops
+
+
+class PlaylistSnapshots:
+    """SQLite store of the entries seen in each playlist, per download profile
+    (mode|quality|format): position, first/last seen, downloaded, removed."""
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(app_data_dir(), "snapshots.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS playlists (
+                    playlist_id TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    url TEXT,
+                    title TEXT,
+                    entry_count INTEGER,
+                    synced REAL,
+                    PRIMARY KEY (playlist_id, profile)
+                )""")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    playlist_id TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    entry_id TEXT NOT NULL,
+                    position INTEGER,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    downloaded INTEGER NOT NULL DEFAULT 0,
+                    removed INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (playlist_id, profile, entry_id)
+                )""")
+
+    def session(self, playlist_id, profile, url=None, title=None, entry_count=None,
+                window=SYNC_WINDOW, record_removals=False):
+        return SyncSession(self, playlist_id, profile, url, title, entry_count, window, record_removals)
+
+    def entries(self, playlist_id, profile, include_removed=False):
+        query = "SELECT entry_id, position, downloaded, removed FROM entries WHERE playlist_id=? AND profile=?"
+        if not include_removed:
+            query += " AND removed=0"
+        with self._lock:
+            return self._db.execute(query + " ORDER BY position", (playlist_id, profile)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SyncSession:
+    """One sync run over a playlist.
+
+    Entries already downloaded are skipped without any work. Enumeration can
+    stop (should_stop) once `window` known entries were seen in a row:
+    - entry count unchanged: counted from the head, so syncing an unchanged
+      playlist costs the first page only;
+    - otherwise: counted from the anchor, the known head (lowest stored
+      position), and only once the new entries cover the growth of the entry
+      count. Entries added at the top come before the anchor; a playlist
+      growing at the end is enumerated until its additions are found.
+    An entry appended while another is removed leaves the count unchanged and
+    is only found by a full pass: record_removals enumerates the whole list
+    (it disables the early stop).
+    """
+    def __init__(self, store, playlist_id, profile, url, title, entry_count, window, record_removals):
+        self.store = store
+        self.playlist_id = playlist_id
+        self.profile = profile
+        self.window = window
+        self.record_removals = record_removals
+        self.started = time.time()
+        self.entry_count = entry_count
+
+        with store._lock:
+            row = store._db.execute("SELECT entry_count FROM playlists WHERE playlist_id=? AND profile=?",
+                                    (playlist_id, profile)).fetchone()
+            rows = store._db.execute(
+                "SELECT entry_id, downloaded FROM entries WHERE playlist_id=? AND profile=? AND removed=0 "
+                "ORDER BY position", (playlist_id, profile)).fetchall()
+        self.known = {eid: bool(dl) for eid, dl in rows}
+        self.anchor = rows[0][0] if rows else None # Known head of the playlist
+        self.first_sync = row is None
+        previous = row[0] if row else None
+        self.unchanged = bool(entry_count) and entry_count == previous
+        self.expected_new = max(0, entry_count - previous) if entry_count and previous else 0
+
+        self.new = 0
+        self.streak = 0
+        self.anchor_seen = False
+        self.complete = False
+        with store._lock, store._db:
+            store._db.execute(
+                "INSERT OR IGNORE INTO playlists (playlist_id, profile, url, title) VALUES (?, ?, ?, ?)",
+                (playlist_id, profile, url, title))
+
+    def seen(self, entry_id, position):
+        """Records an enumerated entry. Returns True if it was already downloaded."""
+        now = time.time()
+        known = entry_id in self.known
+        with self.store._lock, self.store._db:
+            if known:
+                self.store._db.execute(
+                    "UPDATE entries SET position=?, last_seen=?, removed=0 WHERE playlist_id=? AND profile=? AND entry_id=?",
+                    (position, now, self.playlist_id, self.profile, entry_id))
+            else:
+                self.store._db.execute(
+                    "INSERT OR REPLACE INTO entries (playlist_id, profile, entry_id, position, first_seen, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (self.playlist_id, self.profile, entry_id, position, now, now))
+                self.known[entry_id] = False
+        if entry_id == self.anchor:
+            self.anchor_seen = True
+            self.streak = 0 # Count known entries from the anchor on
+        if known:
+            self.streak += 1
+        else:
+            self.streak = 0
+            self.new += 1
+        return self.known[entry_id]
+
+    def should_stop(self):
+        if self.first_sync or self.record_removals:
+            return False
+        if self.unchanged:
+            return self.streak >= self.window
+        return self.anchor_seen and self.streak >= self.window and self.new >= self.expected_new
+
+    def mark_downloaded(self, entry_id):
+        with self.store._lock, self.store._db:
+            self.store._db.execute(
+                "UPDATE entries SET downloaded=1 WHERE playlist_id=? AND profile=? AND entry_id=?",
+                (self.playlist_id, self.profile, entry_id))
+            self.known[entry_id] = True
+
+    def finish(self, complete):
+        """complete=True when the whole playlist was enumerated."""
+        self.complete = complete
+        removed = 0
+        with self.store._lock, self.store._db:
+            if complete and self.record_removals:
+                removed = self.store._db.execute(
+                    "UPDATE entries SET removed=1 WHERE playlist_id=? AND profile=? AND removed=0 AND last_seen<?",
+                    (self.playlist_id, self.profile, self.started)).rowcount
+            self.store._db.execute(
+                "UPDATE playlists SET entry_count=COALESCE(?, entry_count), synced=? WHERE playlist_id=? AND profile=?",
+                (self.entry_count, time.time(), self.playlist_id, self.profile))
+        log(f"[sync] {self.playlist_id}: {self.new} new, {removed} removed"
+            + ("" if complete else f" (stopped after {self.streak} known entries)"))
+        return removed
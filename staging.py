@@ -0,0 +1,119 @@
+"""Output staging: files are written away from the output tree and only appear
+there once complete, through an atomic rename.
+
+Each job gets its own folder, by default `<output>/.staging/<job>`: on the
+same filesystem as the output, finalising a file is a single rename (no copy,
+even on network shares). A scratch directory elsewhere (a fast local disk)
+can be given instead; each file is then copied once, next to its destination
+under a `.temp` name, and renamed into place.
+
+fsync policy, for crash consistency:
+    none   the OS flushes when it likes (default)
+    file   each file is synced before its rename
+    full   the destination folder is synced after the rename too
+"""
+import errno
+import os
+import shutil
+
+STAGING_DIR = ".staging" # Under the output folder when no scratch directory is set
+FSYNC_NONE = "none"
+FSYNC_FILE = "file"
+FSYNC_FULL = "full"
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_FILE, FSYNC_FULL)
+
+
+def preallocate(fh, size):
+    """Reserves `size` bytes for an open file: real blocks where the OS can
+    (contiguous, no ENOSPC halfway through), a sparse file otherwise."""
+    fh.truncate(size)
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fh.fileno(), 0, size)
+        except OSError:
+            pass # Not supported by this filesystem (e.g. some network shares)
+
+
+def _fsync_path(path, directory=False):
+    if directory and os.name == "nt":
+        return # Folders cannot be opened for syncing on Windows
+    fd = os.open(path, os.O_RDONLY | (getattr(os, "O_DIRECTORY", 0) if directory else 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Staging:
+    """Where a DownloadManager's engines write, and how their files are finalised."""
+    def __init__(self, root=None, fsync=FSYNC_NONE):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy {fsync!r} ({', '.join(FSYNC_POLICIES)})")
+        self.root = os.path.abspath(root) if root else None
+        self.fsync = fsync
+
+    def location(self, output, job):
+        """Staging folder of a job writing into `output` (not created)."""
+        return os.path.abspath(os.path.join(self.root or os.path.join(output, STAGING_DIR), job))
+
+    def dir(self, output, job):
+        path = self.location(output, job)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def finalize(self, src, dest):
+        """Moves a complete file into place, atomically. Returns dest."""
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        if self.fsync != FSYNC_NONE:
+            _fsync_path(src)
+        try:
+            os.replace(src, dest)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Scratch disk: one copy next to the destination, then the rename
+            stem, ext = os.path.splitext(dest)
+            tmp = f"{stem}.temp{ext}"
+            try:
+                shutil.copyfile(src, tmp)
+                if self.fsync != FSYNC_NONE:
+                    _fsync_path(tmp)
+                os.replace(tmp, dest)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            os.remove(src)
+        if self.fsync == FSYNC_FULL:
+            _fsync_path(os.path.dirname(dest) or ".", directory=True)
+        return dest
+
+    def commit(self, stage, output, outputs):
+        """Finalises an engine's (item id, file or PostTask) outputs from `stage`
+        into `output`, keeping sub-folders (playlist titles). A PostTask stays
+        in the stage: its `dest` is set, to be finalised once it has run."""
+        committed = []
+        for item_id, out in outputs:
+            if isinstance(out, str):
+                dest = self._target(stage, output, out)
+                out = self.finalize(out, dest) if dest else out
+            else:
+                out.dest = self._target(stage, output, out.output)
+            committed.append((item_id, out))
+        return committed
+
+    def _target(self, stage, output, path):
+        rel = os.path.relpath(os.path.abspath(path), stage)
+        if rel.startswith(os.pardir):
+            return None # Not written by us (e.g. already in place)
+        return os.path.join(output, rel)
+
+    def discard(self, stage):
+        """Removes a job's staging folder, and the shared .staging folder once empty."""
+        shutil.rmtree(stage, ignore_errors=True)
+        parent = os.path.dirname(stage)
+        if not self.root and os.path.basename(parent) == STAGING_DIR:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                pass # Other jobs still staging here
@@ -0,0 +1,26 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# The modules live at the repository root, next to this folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="module")
+def media_server():
+    """benchmarks/server.py in a thread; yields its base URL."""
+    from benchmarks.server import serve
+    server = serve(0, seed=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def app_home(tmp_path, monkeypatch):
+    """Caches, archive and journal of the code under test stay in tmp_path."""
+    monkeypatch.setenv("ULTRAYT_HOME", str(tmp_path / "home"))
@@ -0,0 +1,44 @@
+import time
+
+from concurrency import ConnectionBudget, FragmentController, INITIAL_FRAGMENTS
+
+
+def feed(ctrl, rates, interval):
+    """Feeds one window per rate (bytes per window)."""
+    for n in rates:
+        time.sleep(interval * 1.1)
+        ctrl.add_bytes(n)
+
+
+def test_single_download_starts_at_the_former_fixed_value():
+    assert ConnectionBudget().controller().value == INITIAL_FRAGMENTS == 15
+
+
+def test_next_download_starts_where_the_last_one_converged():
+    budget = ConnectionBudget(32)
+    ctrl = FragmentController(budget, budget.last_value, interval=0.02)
+    feed(ctrl, [10 ** 6 * (i + 1) for i in range(5)], 0.02) # Still scaling: grows
+    grown = ctrl.value
+    assert grown > INITIAL_FRAGMENTS
+    ctrl.close()
+    assert budget.controller().value == grown
+
+
+def test_congestion_lowers_the_next_start():
+    budget = ConnectionBudget(32)
+    ctrl = budget.controller()
+    ctrl.interval = 0.02
+    ctrl.congestion()
+    feed(ctrl, [10 ** 6], 0.02)
+    assert ctrl.value == INITIAL_FRAGMENTS // 2
+    ctrl.close()
+    assert budget.controller().value == INITIAL_FRAGMENTS // 2
+
+
+def test_budget_sharing_does_not_lower_the_next_start():
+    budget = ConnectionBudget(20)
+    first, second = budget.controller(), budget.controller()
+    assert (first.value, second.value) == (15, 5) # Held back by the budget, not cut
+    second.close()
+    first.close()
+    assert budget.controller().value == INITIAL_FRAGMENTS
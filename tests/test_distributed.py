@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import time
+
+from distributed import SharedQueue, Worker, publish
+
+
+def claim_all(root, worker, results):
+    shared = SharedQueue(root)
+    claimed = []
+    while True:
+        spec = shared.claim(worker)
+        if spec is None:
+            break
+        claimed.append(spec["id"])
+    results.put((worker, claimed))
+
+
+def test_each_job_is_claimed_once_across_processes(tmp_path):
+    shared = SharedQueue(str(tmp_path))
+    ids = {shared.submit(f"https://example.com/{i}", "Vidéo", "best", "mp4") for i in range(40)}
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    procs = [context.Process(target=claim_all, args=(str(tmp_path), f"w{i}", results)) for i in range(2)]
+    for p in procs:
+        p.start()
+    claimed = dict(results.get(timeout=60) for _ in procs)
+    for p in procs:
+        p.join(10)
+    assert not set(claimed["w0"]) & set(claimed["w1"])
+    assert set(claimed["w0"]) | set(claimed["w1"]) == ids
+    assert shared.counts() == {"pending": 0, "claimed": 40, "done": 0, "failed": 0}
+
+
+def test_claim_order_follows_priority(tmp_path):
+    shared = SharedQueue(str(tmp_path))
+    low = shared.submit("https://example.com/low", "Vidéo", "best", "mp4", priority=1)
+    high = shared.submit("https://example.com/high", "Vidéo", "best", "mp4", priority=5)
+    assert [shared.claim("w")["id"], shared.claim("w")["id"]] == [high, low]
+
+
+def expire(shared, job_id, age=120):
+    path = shared._dir("claimed", f"{job_id}.json")
+    old = os.path.getmtime(path) - age
+    os.utime(path, (old, old))
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    shared = SharedQueue(str(tmp_path))
+    job_id = shared.submit("https://example.com/a", "Vidéo", "best", "mp4")
+    assert shared.claim("dead")["id"] == job_id
+    assert shared.reclaim(lease=60) == [] # Lease still running
+
+    expire(shared, job_id)
+    assert shared.reclaim(lease=60) == [job_id]
+    assert not shared.heartbeat(job_id, "dead") # The late owner learns it lost the job
+    spec = shared.claim("alive")
+    assert spec["id"] == job_id and spec["attempts"] == 1
+    assert shared.owner(job_id) == "alive"
+    assert not shared.complete(spec, "dead", files=[])
+
+
+def test_job_fails_after_max_attempts(tmp_path):
+    shared = SharedQueue(str(tmp_path))
+    job_id = shared.submit("https://example.com/a", "Vidéo", "best", "mp4")
+    for _ in range(3):
+        shared.claim("dead")
+        expire(shared, job_id)
+        shared.reclaim(lease=60, max_attempts=3)
+    assert shared.counts() == {"pending": 0, "claimed": 0, "done": 0, "failed": 1}
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_publish_never_overwrites(tmp_path):
+    dest = str(tmp_path / "out" / "video.mp4")
+    write(dest, b"theirs")
+
+    write(str(tmp_path / "a.mp4"), b"ours")
+    assert publish(str(tmp_path / "a.mp4"), dest) == str(tmp_path / "out" / "video (2).mp4")
+    with open(dest, "rb") as f:
+        assert f.read() == b"theirs"
+
+    write(str(tmp_path / "b.mp4"), b"theirs") # Same file published twice: kept once
+    assert publish(str(tmp_path / "b.mp4"), dest) == dest
+    assert not os.path.exists(tmp_path / "b.mp4")
+    assert sorted(os.listdir(tmp_path / "out")) == ["video (2).mp4", "video.mp4"]
+
+
+def test_claims_do_not_share_staging(tmp_path):
+    worker = Worker(manager=None, root=str(tmp_path), lease=60)
+    shared = worker.shared
+    job_id = shared.submit("https://example.com/a", "Vidéo", "best", "mp4")
+    first = shared.claim("dead")
+    old = worker._take_staging(first)
+    write(os.path.join(old, "a.mp4.part"), b"partial")
+
+    expire(shared, job_id)
+    shared.reclaim(lease=60)
+    second = shared.claim(worker.id)
+    # The previous holder wrote a moment ago and may still be running
+    assert worker._take_staging(second) != old
+    assert os.path.exists(os.path.join(old, "a.mp4.part"))
+
+
+def test_stale_staging_is_taken_over(tmp_path):
+    worker = Worker(manager=None, root=str(tmp_path), lease=60)
+    shared = worker.shared
+    job_id = shared.submit("https://example.com/a", "Vidéo", "best", "mp4")
+    old = worker._take_staging(shared.claim("dead"))
+    part = os.path.join(old, "a.mp4.part")
+    write(part, b"partial")
+    stale = time.time() - 120
+    for path in (part, old):
+        os.utime(path, (stale, stale))
+
+    expire(shared, job_id)
+    shared.reclaim(lease=60)
+    mine = worker._take_staging(shared.claim(worker.id))
+    with open(os.path.join(mine, "a.mp4.part"), "rb") as f:
+        assert f.read() == b"partial"
+    assert not os.path.exists(old)
+
+
+def test_complete_does_not_remove_a_new_claim(tmp_path, monkeypatch):
+    shared = SharedQueue(str(tmp_path))
+    job_id = shared.submit("https://example.com/a", "Vidéo", "best", "mp4")
+    spec = shared.claim("first")
+    put_pending = shared._put_pending
+    reclaimed = []
+
+    def requeue_then_claim(spec):
+        put_pending(spec)
+        reclaimed.append(shared.claim("second")) # Another worker is quick
+
+    monkeypatch.setattr(shared, "_put_pending", requeue_then_claim)
+    assert shared.complete(spec, "first", error="boom")
+    assert reclaimed[0]["id"] == job_id
+    assert shared.owner(job_id) == "second"
+    assert shared.heartbeat(job_id, "second")
+    assert shared.counts() == {"pending": 0, "claimed": 1, "done": 0, "failed": 0}
+
+
+def test_complete_by_former_owner_is_refused(tmp_path):
+    shared = SharedQueue(str(tmp_path))
+    job_id = shared.submit("https://example.com/a", "Vidéo", "best", "mp4")
+    spec = shared.claim("dead")
+    expire(shared, job_id)
+    shared.reclaim(lease=60)
+    shared.claim("alive")
+    assert not shared.complete(spec, "dead", files=[])
+    assert shared.owner(job_id) == "alive"
+    assert shared.counts() == {"pending": 0, "claimed": 1, "done": 0, "failed": 0}
+    assert os.listdir(shared._dir("tmp")) == []
@@ -0,0 +1,11 @@
+"""Playlist folder names must be valid on Windows, like the outtmpl's."""
+import re
+
+from downloader import _folder_name
+
+
+def test_playlist_folder_name_is_windows_safe():
+    name = _folder_name('Best of: "live" sets? <2024> | a/b*.')
+    assert not re.search(r'[<>:"/\\|?*]', name)
+    assert not name.endswith((".", " "))
+    assert name.startswith("Best of")
@@ -0,0 +1,25 @@
+"""Legacy progress_callback contract of ProgressReporter."""
+from progress import ProgressReporter, DOWNLOADING, FINISHED
+
+
+def test_callback_gets_only_the_fraction():
+    seen = []
+    reporter = ProgressReporter(None, "job", lambda v: seen.append(v))
+    reporter.update(DOWNLOADING, 50, 100, fragment_index=1, tbr=1200)
+    reporter.update(FINISHED, 100, 100)
+    assert seen == [0.5, 1.0]
+
+
+def test_callback_opts_in_to_details():
+    seen = []
+    reporter = ProgressReporter(None, "job", lambda v, **d: seen.append((v, d)), details=True)
+    reporter.update(DOWNLOADING, 50, 100, tbr=1200)
+    assert seen == [(0.5, {"tbr": 1200})]
+
+
+def test_failing_callback_does_not_break_the_download():
+    def callback(value):
+        raise ValueError("boom")
+    reporter = ProgressReporter(None, "job", callback)
+    event = reporter.update(DOWNLOADING, 50, 100)
+    assert event.fraction == 0.5
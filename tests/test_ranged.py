@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import threading
+
+from benchmarks.server import content
+from ranged import RangedDownloader, RangeCancelled
+from retry import RetryCoordinator
+
+SIZE = 3 * 1024 * 1024
+CHUNK = 512 * 1024
+
+
+def expected(size=SIZE):
+    return hashlib.sha256(b"".join(content(0, size))).hexdigest()
+
+
+def digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def fast_retry():
+    return RetryCoordinator(backoff_base=0.01, backoff_cap=0.05)
+
+
+def test_download_size_and_hash(media_server, tmp_path):
+    dest = str(tmp_path / "f.mp4")
+    downloader = RangedDownloader(connections=4, chunk_size=CHUNK)
+    assert downloader.download([(f"{media_server}/file/3M.mp4", dest, None)]) == [dest]
+    assert os.path.getsize(dest) == SIZE
+    assert digest(dest) == expected()
+    assert downloader.downloaded == downloader.total == SIZE
+    assert os.listdir(tmp_path) == ["f.mp4"] # No .part nor chunk map left
+
+
+def test_failed_chunks_are_retried(media_server, tmp_path):
+    dest = str(tmp_path / "f.mp4")
+    downloader = RangedDownloader(connections=4, chunk_size=CHUNK, retries=20, retry=fast_retry())
+    downloader.download([(f"{media_server}/file/3M.mp4?err=0.2&drop=0.2", dest, SIZE)])
+    assert downloader.retried > 0
+    assert digest(dest) == expected()
+
+
+def test_several_files_at_once(media_server, tmp_path):
+    video, audio = str(tmp_path / "f.f1.mp4"), str(tmp_path / "f.f2.m4a")
+    RangedDownloader(connections=3, chunk_size=CHUNK).download(
+        [(f"{media_server}/file/3M.mp4", video, None), (f"{media_server}/file/1M.m4a", audio, None)])
+    assert digest(video) == expected()
+    assert digest(audio) == expected(1024 * 1024)
+
+
+def test_no_range_support(media_server, tmp_path):
+    dest = str(tmp_path / "f.mp4")
+    RangedDownloader(connections=4, chunk_size=CHUNK).download([(f"{media_server}/file/1M.mp4?norange=1", dest, None)])
+    assert digest(dest) == expected(1024 * 1024)
+
+
+def test_resume_fetches_only_missing_chunks(media_server, tmp_path):
+    dest = str(tmp_path / "f.mp4")
+    url = f"{media_server}/file/3M.mp4"
+    cancel = threading.Event()
+    received = []
+
+    def stop_halfway(n, _):
+        received.append(n)
+        if sum(received) >= SIZE // 2:
+            cancel.set()
+
+    first = RangedDownloader(connections=2, chunk_size=CHUNK, cancel=cancel, on_bytes=stop_halfway)
+    try:
+        first.download([(url, dest, SIZE)])
+    except RangeCancelled:
+        pass
+    with open(dest + ".part.chunks", encoding="utf-8") as f:
+        done = json.load(f)["done"]
+    assert 0 < len(done) < SIZE // CHUNK
+
+    fetched = []
+    second = RangedDownloader(connections=2, chunk_size=CHUNK, on_bytes=lambda n, _: fetched.append(n))
+    second.download([(url, dest, SIZE)])
+    assert digest(dest) == expected()
+    assert sum(fetched) == SIZE - len(done) * CHUNK
+    assert not os.path.exists(dest + ".part.chunks")
+
+
+def test_stale_chunk_map_is_ignored(media_server, tmp_path):
+    dest = str(tmp_path / "f.mp4")
+    with open(dest + ".part", "wb") as f:
+        f.write(b"\0" * 100) # Not the size announced: start over
+    with open(dest + ".part.chunks", "w", encoding="utf-8") as f:
+        json.dump({"size": SIZE, "chunk": CHUNK, "done": [0]}, f)
+    RangedDownloader(connections=2, chunk_size=CHUNK).download([(f"{media_server}/file/3M.mp4", dest, SIZE)])
+    assert digest(dest) == expected()
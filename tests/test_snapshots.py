@@ -0,0 +1,54 @@
+from snapshots import PlaylistSnapshots
+
+
+def sync(store, ids, window=30):
+    """Enumerates ids like _download_playlist. Returns (new ids, entries enumerated)."""
+    session = store.session("PL", "video", entry_count=len(ids), window=window)
+    new, enumerated = [], 0
+    for position, entry_id in enumerate(ids, 1):
+        enumerated += 1
+        if session.seen(entry_id, position):
+            if session.should_stop():
+                break
+            continue
+        new.append(entry_id)
+        session.mark_downloaded(entry_id)
+    session.finish(enumerated == len(ids))
+    return new, enumerated
+
+
+def store(tmp_path):
+    return PlaylistSnapshots(str(tmp_path / "snapshots.sqlite3"))
+
+
+def test_unchanged_playlist_stops_after_one_window(tmp_path):
+    snapshots = store(tmp_path)
+    playlist = [f"v{i}" for i in range(300)]
+    assert sync(snapshots, playlist) == (playlist, 300) # First sync: everything
+    assert sync(snapshots, playlist) == ([], 30)
+    assert sync(snapshots, playlist) == ([], 30)
+
+
+def test_entry_added_at_the_top(tmp_path):
+    snapshots = store(tmp_path)
+    playlist = [f"v{i}" for i in range(300)]
+    sync(snapshots, playlist)
+    assert sync(snapshots, ["new"] + playlist) == (["new"], 31)
+
+
+def test_entries_appended_at_the_end(tmp_path):
+    snapshots = store(tmp_path)
+    playlist = [f"v{i}" for i in range(100)]
+    sync(snapshots, playlist)
+    assert sync(snapshots, playlist + ["new1", "new2"]) == (["new1", "new2"], 102)
+
+
+def test_removals_disable_the_early_stop(tmp_path):
+    snapshots = store(tmp_path)
+    playlist = [f"v{i}" for i in range(100)]
+    sync(snapshots, playlist)
+    session = snapshots.session("PL", "video", entry_count=99, record_removals=True)
+    for position, entry_id in enumerate(playlist[1:], 1):
+        session.seen(entry_id, position)
+        assert not session.should_stop()
+    assert session.finish(True) == 1
@@ -0,0 +1,110 @@
+"""Helpers to recognise YouTube URLs.
+
+Every supported URL form is parsed into a typed Target (video, playlist or
+channel) with one canonical URL, so that youtu.be/ID, shorts/ID and
+watch?v=ID&list=...&si=... all name the same download.
+"""
+import re
+from urllib.parse import urlparse, parse_qs
+
+_ID_RE = re.compile(r"^[0-9A-Za-z_-]{11}$")
+_LIST_RE = re.compile(r"^[0-9A-Za-z_-]{2,}$")
+_YT_HOSTS = ("youtube.com", "youtu.be", "youtube-nocookie.com")
+_VIDEO_PATHS = ("shorts", "embed", "live", "v")
+_CHANNEL_TABS = ("videos", "shorts", "streams", "playlists", "featured", "podcasts", "releases")
+
+VIDEO = "video"
+PLAYLIST = "playlist"
+CHANNEL = "channel"
+
+
+class Target:
+    """What a URL points to: kind (VIDEO, PLAYLIST, CHANNEL), its id
+    ("UC..." / "@handle" / "c/name" for channels) and an optional channel tab."""
+    def __init__(self, kind, id, tab=None):
+        self.kind = kind
+        self.id = id
+        self.tab = tab
+
+    @property
+    def url(self):
+        """Canonical URL: tracking and context parameters stripped."""
+        if self.kind == VIDEO:
+            return f"https://www.youtube.com/watch?v={self.id}"
+        if self.kind == PLAYLIST:
+            return f"https://www.youtube.com/playlist?list={self.id}"
+        return f"https://www.youtube.com/{self.id}" + (f"/{self.tab}" if self.tab else "")
+
+    @property
+    def key(self):
+        return (self.kind, self.id, self.tab)
+
+    @property
+    def collection(self):
+        """True for targets enumerated entry by entry (playlists, channels)."""
+        return self.kind != VIDEO
+
+    def __eq__(self, other):
+        return isinstance(other, Target) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"<Target {self.kind} {self.id}{'/' + self.tab if self.tab else ''}>"
+
+
+def parse(url):
+    """Returns the Target of a YouTube URL, or None for anything else."""
+    try:
+        parsed = urlparse(url.strip())
+    except (AttributeError, ValueError):
+        return None
+    host = (parsed.hostname or "").lower()
+    if not any(host == h or host.endswith("." + h) for h in _YT_HOSTS):
+        return None
+    parts = [p for p in parsed.path.split("/") if p]
+    qs = parse_qs(parsed.query)
+
+    # A video, even when opened from a playlist (list= is context only)
+    candidate = None
+    if host.endswith("youtu.be"):
+        candidate = parts[0] if parts else None
+    elif "v" in qs:
+        candidate = qs["v"][0]
+    elif len(parts) >= 2 and parts[0] in _VIDEO_PATHS:
+        candidate = parts[1]
+    # embed/videoseries?list=... is a playlist player despite its 11 chars
+    if candidate and _ID_RE.match(candidate) and candidate != "videoseries":
+        return Target(VIDEO, candidate)
+
+    playlist = qs.get("list", [None])[0]
+    if playlist and _LIST_RE.match(playlist) and (not parts or parts[0] in ("playlist", "watch", "embed")):
+        return Target(PLAYLIST, playlist)
+
+    if parts and parts[0].startswith("@"):
+        channel, rest = parts[0], parts[1:]
+    elif len(parts) >= 2 and parts[0] in ("channel", "c", "user"):
+        channel, rest = "/".join(parts[:2]), parts[2:]
+    else:
+        return None
+    tab = rest[0].lower() if rest and rest[0].lower() in _CHANNEL_TABS else None
+    return Target(CHANNEL, channel, tab)
+
+
+def canonical_url(url):
+    """The canonical form of a YouTube URL; other URLs are returned unchanged."""
+    target = parse(url)
+    return target.url if target else url.strip()
+
+
+def is_collection(url):
+    """True if the URL is a playlist or a channel rather than a single video."""
+    target = parse(url)
+    return bool(target and target.collection)
+
+
+def video_id(url):
+    """Returns the 11-char YouTube video ID of a URL, or None if it has none."""
+    target = parse(url)
+    return target.id if target and target.kind == VIDEO else None
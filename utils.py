@@ -1,60 +1,138 @@
 import sys
 import threading
 import datetime
+import logging
 import os
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+_LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
 
 class Logger:
-    """Redirects stdout/logs to the GUI console."""
-    def __init__(self, text_widget=None):
-        self.text_widget = text_widget
-        self.queue = []
+    """Log backend shared by every module.
+
+    - Messages below `level` are dropped before any formatting.
+    - The last `capacity` lines are kept in a ring buffer (nothing grows unbounded).
+    - The GUI textbox is fed in batches every `flush_interval` ms from the Tk
+      thread, and trimmed to `max_lines`.
+    - Optional rotating log file (add_file_sink).
+    """
+    def __init__(self, text_widget=None, level=INFO, capacity=2000, flush_interval=250, max_lines=5000):
+        self.text_widget = None
+        self.level = level
+        self.stream = None # Defaults to the real stdout; the CLI points it at stderr
+        self.headless = False # No widget will ever be attached: don't keep lines for it
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self.file_sink = None
+        self.forward = None # callable(level, msg) replacing every output (worker processes -> parent)
+
+        self.records = deque(maxlen=capacity) # Recent lines, e.g. to export or inspect
+        self._pending = deque(maxlen=capacity) # Lines not yet shown in the widget
+        self._lock = threading.Lock()
+        if text_widget is not None:
+            self.set_widget(text_widget)
+
+    def is_enabled(self, level):
+        return level >= self.level
 
     def set_widget(self, widget):
+        """Attaches the GUI textbox. Must be called from the Tk thread."""
         self.text_widget = widget
-        # Flush queue
-        for msg in self.queue:
-            self.write_to_widget(msg)
-        self.queue = []
+        self._flush_widget()
 
-    def write(self, message):
-        if not message: return
-        
-        # Always print to real stdout for debug
-        sys.__stdout__.write(message)
+    def add_file_sink(self, path, max_bytes=5 * 1024 * 1024, backups=3):
+        """Also writes every enabled line to `path`, rotated at max_bytes."""
+        import logging.handlers
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.file_sink = handler
+        return handler
 
-        if not self.text_widget:
-            self.queue.append(message)
+    def log(self, msg, level=INFO, *args):
+        if level < self.level:
+            return
+        if args:
+            msg = msg % args
+        if self.forward:
+            self.forward(level, msg)
             return
+        now = datetime.datetime.now()
+        line = f"[{now:%H:%M:%S}] {msg}" if level < WARNING else f"[{now:%H:%M:%S}] {_LEVEL_NAMES[level]}: {msg}"
+
+        stream = self.stream or sys.__stdout__
+        if stream:
+            try:
+                stream.write(msg + "\n")
+            except (OSError, ValueError):
+                pass
+        if self.file_sink:
+            self.file_sink.handle(logging.makeLogRecord({"msg": f"{now:%Y-%m-%d} {line}"}))
 
-        self.write_to_widget(message)
+        with self._lock:
+            self.records.append(line)
+            if not self.headless:
+                self._pending.append(line)
 
-    def write_to_widget(self, message):
-        def append():
+    def write(self, message):
+        """File-like interface (e.g. for redirecting sys.stdout)."""
+        message = message.rstrip("\n")
+        if message.strip():
+            self.log(message)
+
+    def _flush_widget(self):
+        # Runs on the Tk thread: one insert per batch, however many lines arrived
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+        widget = self.text_widget
+        if lines and widget is not None:
             try:
-                self.text_widget.configure(state="normal")
-                timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-                if message.strip():
-                     self.text_widget.insert("end", f"[{timestamp}] {message}")
-                else:
-                    self.text_widget.insert("end", message)
-                self.text_widget.see("end")
-                self.text_widget.configure(state="disabled")
-            except:
-                pass 
-        
-        if threading.current_thread() is threading.main_thread():
-            append()
-        else:
+                widget.configure(state="normal")
+                widget.insert("end", "\n".join(lines) + "\n")
+                count = int(widget.index("end-1c").split(".")[0])
+                if count > self.max_lines:
+                    widget.delete("1.0", f"{count - self.max_lines}.0")
+                widget.see("end")
+                widget.configure(state="disabled")
+            except Exception:
+                pass
+        if widget is not None:
             try:
-                self.text_widget.after(0, append)
-            except:
+                widget.after(self.flush_interval, self._flush_widget)
+            except Exception:
                 pass
 
     def flush(self):
         pass
 
+
 # Global logger instance to be used across modules
 logger = Logger()
 
-def log(msg):
-    logger.write(msg + "\n")
+def log(msg, level=INFO):
+    logger.log(msg, level)
+
+def debug(msg, *args):
+    """Debug line; %-style args are only formatted if debug logging is enabled."""
+    if logger.level <= DEBUG:
+        logger.log(msg, DEBUG, *args)
+
+def app_data_dir(*parts):
+    """Per-user directory for caches/databases (created on demand).
+
+    Override with the ULTRAYT_HOME environment variable.
+    """
+    base = os.environ.get("ULTRAYT_HOME")
+    if not base:
+        if os.name == "nt":
+            base = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "UltraYouTube")
+        else:
+            base = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ultrayoutube")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path